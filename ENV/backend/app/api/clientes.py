@@ -1,13 +1,25 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import Optional
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
 from backend.app.core.database import get_supabase
-
-from backend.app.schemas.cliente import ClienteListResponse, ClienteDetalle
+from backend.app.core.json_rapido import dumps, respuesta_json
+from backend.app.core.paginacion import CONTEO_PATTERN
+
+from backend.app.schemas.cliente import (
+    ClienteDetalle,
+    ClienteDuplicadosEstado,
+    ClienteListResponse,
+    ClienteSugerenciasResponse,
+)
+from backend.app.services.cliente_duplicados import estado_deteccion, lanzar_deteccion
+from backend.app.services.cliente_sugerencias import sugerir_clientes
 from backend.app.services.clientes_service import ClientesService
 from backend.app.repositories.clientes_repo import ClientesRepository
 
 from backend.app.schemas.catalogos import CatalogosResponse, CatalogItem
-from backend.app.schemas.cliente_create import ClienteCreateIn, ClienteCreateOut
+from backend.app.schemas.cliente_create import ClienteCreateIn, ClienteCreateOut, ClientesBatchIn, ClientesBatchOut
 from backend.app.services.clientes_create_service import ClientesCreateService
 
 router = APIRouter(prefix="/api/clientes", tags=["Clientes"])
@@ -18,7 +30,11 @@ def get_clientes_service(supabase=Depends(get_supabase)) -> ClientesService:
     return ClientesService(repo)
 
 
-@router.get("", response_model=ClienteListResponse)
+@router.get(
+    "",
+    response_class=Response,
+    responses={200: {"model": ClienteListResponse, "description": "Pagina de clientes con filas dispersas"}},
+)
 def listar_clientes(
     q: Optional[str] = Query(None),
     tipo: Optional[str] = Query(None),
@@ -27,17 +43,31 @@ def listar_clientes(
     page_size: int = Query(30, ge=1, le=100),
     sort_field: str = Query("razonsocial"),
     sort_dir: str = Query("ASC", pattern="^(ASC|DESC)$"),
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", pattern=CONTEO_PATTERN),
+    fields: Optional[str] = Query(
+        None,
+        description="Columnas separadas por comas (* = todas). Por defecto, la proyeccion ligera del listado.",
+    ),
     service: ClientesService = Depends(get_clientes_service),
 ):
-    return service.listar_clientes(
-        q=q,
-        tipo=tipo,
-        idgrupo=idgrupo,
-        page=page,
-        page_size=page_size,
-        sort_field=sort_field,
-        sort_dir=sort_dir,
-    )
+    try:
+        payload = service.listar_clientes(
+            q=q,
+            tipo=tipo,
+            idgrupo=idgrupo,
+            page=page,
+            page_size=page_size,
+            sort_field=sort_field,
+            sort_dir=sort_dir,
+            cursor=cursor,
+            count=count,
+            fields=fields,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Filas planas de PostgREST: se serializan sin validar un modelo por fila
+    return respuesta_json(payload)
 
 
 @router.get("/catalogos", response_model=CatalogosResponse)
@@ -60,16 +90,121 @@ def catalogos(supabase=Depends(get_supabase)):
     )
 
 
+@router.get("/suggest", response_model=ClienteSugerenciasResponse)
+def sugerir(
+    q: str = Query("", max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    supabase=Depends(get_supabase),
+):
+    """Autocompletado de clientes desde el indice en memoria (sin acentos ni mayusculas)."""
+    return respuesta_json({"data": sugerir_clientes(supabase, q, limit)})
+
+
+# -----------------------------
+# Duplicados (job por bloques)
+# -----------------------------
+def _estado_filtrado(estado: dict, confianza: Optional[str], limit: int) -> dict:
+    informe = estado.get("informe")
+    if informe:
+        propuestas = [p for p in informe["propuestas"] if not confianza or p["confianza"] == confianza]
+        informe = {**informe, "total_propuestas": len(propuestas), "propuestas": propuestas[:limit]}
+    return {**estado, "informe": informe}
+
+
+@router.post("/duplicados:detectar", response_model=ClienteDuplicadosEstado, status_code=202)
+def detectar_duplicados(
+    guardar_cif: bool = Query(True),
+    supabase=Depends(get_supabase),
+):
+    """Lanza en segundo plano la normalizacion de CIFs y la busqueda de duplicados."""
+    return _estado_filtrado(lanzar_deteccion(supabase, guardar_cif), None, 0)
+
+
+@router.get("/duplicados", response_model=ClienteDuplicadosEstado)
+def informe_duplicados(
+    confianza: Optional[str] = Query(None, pattern="^(alta|media|baja)$"),
+    limit: int = Query(200, ge=1, le=5000),
+):
+    """Estado del ultimo job y sus propuestas de fusion (principal + duplicados)."""
+    return _estado_filtrado(estado_deteccion(), confianza, limit)
+
+
+# -----------------------------
+# Ficha con GET condicional
+# -----------------------------
+def _etag(clienteid: int, version: str) -> str:
+    return f'W/"{clienteid}-{hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]}"'
+
+
+def _fecha_version(version: Optional[str]) -> Optional[datetime]:
+    if not version:
+        return None
+    try:
+        fecha = datetime.fromisoformat(version.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    # Last-Modified solo lleva segundos
+    return fecha.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _sin_cambios(request: Request, etag: str, fecha: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and fecha:
+        try:
+            return fecha <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _cabeceras_version(etag: str, fecha: Optional[datetime]) -> dict:
+    # no-cache: el navegador/cliente puede guardar la ficha pero debe revalidar
+    cabeceras = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if fecha:
+        cabeceras["Last-Modified"] = format_datetime(fecha, usegmt=True)
+    return cabeceras
+
+
 @router.get("/{clienteid}", response_model=ClienteDetalle)
 def obtener_cliente(
     clienteid: int,
+    request: Request,
     service: ClientesService = Depends(get_clientes_service),
 ):
+    """
+    Ficha del cliente con ETag/Last-Modified sacados de cliente.updated_at.
+    Con If-None-Match/If-Modified-Since se comprueba antes solo updated_at
+    y, si no ha cambiado, se contesta 304 sin leer ni enviar la ficha.
+    """
+    condicional = "if-none-match" in request.headers or "if-modified-since" in request.headers
+    if condicional:
+        version = service.version_detalle(clienteid)
+        if version:
+            etag, fecha = _etag(clienteid, version), _fecha_version(version)
+            if _sin_cambios(request, etag, fecha):
+                return Response(status_code=304, headers=_cabeceras_version(etag, fecha))
+
     try:
-        return service.obtener_detalle(clienteid)
+        detalle = service.obtener_detalle(clienteid)
     except ValueError:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
+    contenido = detalle.model_dump(mode="json")
+    version = detalle.cliente.updated_at
+    if version:
+        etag, fecha = _etag(clienteid, version), _fecha_version(version)
+    else:
+        # Base sin cliente.updated_at: ETag del contenido (ahorra la descarga, no la lectura)
+        etag, fecha = f'W/"{hashlib.sha1(dumps(contenido)).hexdigest()[:16]}"', None
+    if condicional and _sin_cambios(request, etag, fecha):
+        return Response(status_code=304, headers=_cabeceras_version(etag, fecha))
+    return respuesta_json(contenido, headers=_cabeceras_version(etag, fecha))
+
 
 @router.post("", response_model=ClienteCreateOut)
 def crear_cliente(
@@ -80,6 +215,16 @@ def crear_cliente(
     return service.crear(body)
 
 
+@router.post(":batch", response_model=ClientesBatchOut)
+def crear_clientes_lote(
+    body: ClientesBatchIn,
+    supabase=Depends(get_supabase),
+):
+    """Alta masiva con contactos y direcciones anidados; un resultado por cliente."""
+    service = ClientesCreateService(supabase)
+    return service.crear_lote(body.clientes)
+
+
 @router.put("/{clienteid}", response_model=ClienteCreateOut)
 def actualizar_cliente(
     clienteid: int,
@@ -1,12 +1,28 @@
 # backend/app/api/clientes_convertir.py
 from fastapi import APIRouter, Depends, HTTPException
-from backend.app.schemas.cliente_convertir import ClienteConvertirResponse
+from backend.app.schemas.cliente_convertir import (
+    ClienteConvertirResponse,
+    ClientesConvertirLoteIn,
+    ClientesConvertirLoteOut,
+)
 from backend.app.services.cliente_convertir_service import ClienteConvertirService
 from backend.app.core.database import get_supabase
 
 router = APIRouter(prefix="/api/clientes", tags=["Clientes"])
 
 
+@router.post("/convertir:lote", response_model=ClientesConvertirLoteOut)
+def convertir_potenciales_lote(
+    data: ClientesConvertirLoteIn,
+    supabase=Depends(get_supabase),
+):
+    service = ClienteConvertirService(supabase)
+    try:
+        return service.convertir_lote(data.clienteids, q=data.q, idgrupo=data.idgrupo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/{clienteid}/convertir", response_model=ClienteConvertirResponse)
 def convertir_potencial(
     clienteid: int,
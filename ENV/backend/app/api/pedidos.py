@@ -3,16 +3,20 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 
 from backend.app.core.database import get_supabase
+from backend.app.core.paginacion import CONTEO_PATTERN
 from backend.app.repositories.pedidos_repo import PedidosRepository
 from backend.app.schemas.pedido import (
     PedidoListResponse,
     PedidoDetalleOut,
     PedidoLineaOut,
     PedidoTotalesOut,
+    PedidoTotalesLoteOut,
     PedidoObservacionIn,
     PedidoCreateIn,
     PedidoUpdateIn,
     PedidoLineaCreate,
+    PedidoLineasSyncIn,
+    PedidoLineasSyncOut,
     PedidoCatalogos,
 )
 from backend.app.services.pedidos_service import PedidosService
@@ -37,6 +41,8 @@ def listar_pedidos(
     devoluciones: bool = Query(False),
     page: int = Query(1, ge=1),
     page_size: int = Query(30, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", pattern=CONTEO_PATTERN),
     service: PedidosService = Depends(get_service),
 ):
     filtros = {
@@ -49,7 +55,10 @@ def listar_pedidos(
         "fecha_hasta": fecha_hasta,
         "tipo_devolucion": devoluciones,
     }
-    return service.listar(filtros, page, page_size)
+    try:
+        return service.listar(filtros, page, page_size, cursor=cursor, count=count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/catalogos", response_model=PedidoCatalogos)
@@ -57,6 +66,20 @@ def catalogos_pedidos(service: PedidosService = Depends(get_service)):
     return service.catalogos()
 
 
+@router.get("/totales", response_model=PedidoTotalesLoteOut)
+def totales_pedidos(
+    ids: str = Query(..., description="pedidoid separados por comas"),
+    service: PedidosService = Depends(get_service),
+):
+    try:
+        pedido_ids = list(dict.fromkeys(int(x) for x in ids.split(",") if x.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids debe ser una lista de enteros separados por comas")
+    if len(pedido_ids) > 500:
+        raise HTTPException(status_code=400, detail="Como maximo 500 pedidos por llamada")
+    return service.totales_lote(pedido_ids)
+
+
 @router.post("", response_model=PedidoDetalleOut)
 def crear_pedido(body: PedidoCreateIn, service: PedidosService = Depends(get_service)):
     return service.crear(body)
@@ -94,6 +117,18 @@ def agregar_linea_pedido(pedidoid: int, body: PedidoLineaCreate, service: Pedido
     return service.agregar_linea(pedidoid, body)
 
 
+@router.put("/{pedidoid}/lineas", response_model=PedidoLineasSyncOut)
+def sincronizar_lineas_pedido(
+    pedidoid: int,
+    body: PedidoLineasSyncIn,
+    service: PedidosService = Depends(get_service),
+):
+    try:
+        return service.sincronizar_lineas(pedidoid, body.lineas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.delete("/{pedidoid}/lineas/{detalleid}")
 def borrar_linea_pedido(pedidoid: int, detalleid: int, service: PedidosService = Depends(get_service)):
     service.borrar_linea(pedidoid, detalleid)
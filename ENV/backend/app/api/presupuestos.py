@@ -4,8 +4,10 @@ from typing import List, Optional
 from postgrest.exceptions import APIError
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 from backend.app.core.database import get_supabase
+from backend.app.core.paginacion import CONTEO_PATTERN
 from backend.app.repositories.presupuestos_repo import PresupuestosRepository
 from backend.app.schemas.presupuesto import (
     PresupuestoCreateIn,
@@ -13,9 +15,15 @@ from backend.app.schemas.presupuesto import (
     PresupuestoOut,
     PresupuestoLineaIn,
     PresupuestoLineaOut,
+    PresupuestoLineaUpdateIn,
+    PresupuestoLineasBatchIn,
+    PresupuestoLineasBatchOut,
+    PresupuestoPdfZipIn,
     PresupuestoRecalcResponse,
+    PresupuestoReconciliacionOut,
     PresupuestoCatalogos,
 )
+from backend.app.services.presupuesto_pdf_export import exportar_zip
 from backend.app.services.presupuestos_service import PresupuestosService
 
 router = APIRouter(prefix="/api/presupuestos", tags=["Presupuestos"])
@@ -35,9 +43,16 @@ def listar_presupuestos(
     page: int = Query(1, ge=1),
     page_size: int = Query(30, ge=1, le=100),
     ordenar_por: str = Query("creado_en", pattern="^(creado_en|fecha_presupuesto)$"),
+    cursor: Optional[str] = Query(None),
+    count: str = Query("exact", pattern=CONTEO_PATTERN),
     service: PresupuestosService = Depends(get_service),
 ):
-    return service.listar(q, estadoid, clienteid, ambito_impuesto, page, page_size, ordenar_por)
+    try:
+        return service.listar(
+            q, estadoid, clienteid, ambito_impuesto, page, page_size, ordenar_por, cursor=cursor, count=count
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/catalogos", response_model=PresupuestoCatalogos)
@@ -97,6 +112,33 @@ def catalogos_presupuesto(supabase=Depends(get_supabase)):
     )
 
 
+@router.post("/totales/reconciliar", response_model=PresupuestoReconciliacionOut)
+def reconciliar_totales(
+    presupuestoid: Optional[int] = Query(None),
+    service: PresupuestosService = Depends(get_service),
+):
+    return service.reconciliar_totales(presupuestoid)
+
+
+@router.post("/pdf:zip")
+def exportar_pdfs_zip(
+    body: PresupuestoPdfZipIn,
+    supabase=Depends(get_supabase),
+    service: PresupuestosService = Depends(get_service),
+):
+    ids = service.ids_exportacion(body)
+    if not ids:
+        raise HTTPException(status_code=404, detail="No hay presupuestos que exportar")
+    return StreamingResponse(
+        exportar_zip(supabase, ids),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="presupuestos_{date.today():%Y%m%d}.zip"',
+            "X-Presupuestos": str(len(ids)),
+        },
+    )
+
+
 @router.get("/{presupuestoid}", response_model=PresupuestoOut)
 def obtener_presupuesto(presupuestoid: int, service: PresupuestosService = Depends(get_service)):
     try:
@@ -148,6 +190,39 @@ def agregar_linea(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.patch("/{presupuestoid}/lineas/{detalleid}")
+def actualizar_linea(
+    presupuestoid: int,
+    detalleid: int,
+    body: PresupuestoLineaUpdateIn,
+    service: PresupuestosService = Depends(get_service),
+):
+    try:
+        return {"total_estimada": service.actualizar_linea(presupuestoid, detalleid, body)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{presupuestoid}/lineas/{detalleid}")
+def borrar_linea(presupuestoid: int, detalleid: int, service: PresupuestosService = Depends(get_service)):
+    try:
+        return {"total_estimada": service.borrar_linea(presupuestoid, detalleid)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{presupuestoid}/lineas:batch", response_model=PresupuestoLineasBatchOut)
+def agregar_lineas(
+    presupuestoid: int,
+    body: PresupuestoLineasBatchIn,
+    service: PresupuestosService = Depends(get_service),
+):
+    try:
+        return service.agregar_lineas(presupuestoid, body.lineas)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/{presupuestoid}/recalcular", response_model=PresupuestoRecalcResponse)
 def recalcular(
     presupuestoid: int,
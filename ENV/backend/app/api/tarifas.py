@@ -1,6 +1,10 @@
+import tempfile
+from datetime import date
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
 
 from backend.app.core.database import get_supabase
 from backend.app.repositories.tarifas_repo import TarifasRepository
@@ -13,6 +17,10 @@ from backend.app.schemas.tarifa import (
     ClienteTarifaCreate,
     PrecioRequest,
     PrecioResponse,
+    PrecioBatchRequest,
+    PrecioBatchResponse,
+    SimulacionRequest,
+    SimulacionResponse,
 )
 from backend.app.services.tarifas_service import TarifasService
 
@@ -83,6 +91,96 @@ def asignar_cliente_tarifa(body: ClienteTarifaCreate, service: TarifasService =
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/impuestos/recargar")
+def recargar_impuestos(service: TarifasService = Depends(get_service)):
+    return service.recargar_impuestos()
+
+
+@router.post("/indice/recargar")
+def recargar_tarifas(service: TarifasService = Depends(get_service)):
+    return service.recargar_tarifas()
+
+
 @router.post("/calcular-precio", response_model=PrecioResponse)
 def calcular_precio(body: PrecioRequest, service: TarifasService = Depends(get_service)):
     return service.calcular_precio(body)
+
+
+@router.post("/calcular-precios", response_model=PrecioBatchResponse)
+def calcular_precios(body: PrecioBatchRequest, service: TarifasService = Depends(get_service)):
+    return service.calcular_precios(body)
+
+
+@router.post("/simular", response_model=SimulacionResponse)
+def simular(body: SimulacionRequest, service: TarifasService = Depends(get_service)):
+    try:
+        return service.simular(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# -----------------------------
+# Lista de precios por cliente (CSV / XLSX)
+# -----------------------------
+_CSV_CHUNK = 5000
+_XLSX_CHUNK = 64 * 1024
+
+
+def _iter_csv(df):
+    yield df.head(0).to_csv(index=False, sep=";")
+    for i in range(0, len(df), _CSV_CHUNK):
+        yield df.iloc[i : i + _CSV_CHUNK].to_csv(index=False, header=False, sep=";")
+
+
+def _xlsx_fichero(df):
+    """
+    XLSX en modo write_only (las filas no se quedan en memoria) sobre un
+    fichero temporal, listo para enviarlo por trozos con _iter_fichero.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Lista de precios")
+    ws.append([str(c) for c in df.columns])
+    for fila in df.itertuples(index=False, name=None):
+        # NaN no es un valor valido en una celda
+        ws.append([None if isinstance(v, float) and v != v else v for v in fila])
+    f = tempfile.TemporaryFile()
+    wb.save(f)
+    f.seek(0)
+    return f
+
+
+def _iter_fichero(f):
+    try:
+        while True:
+            trozo = f.read(_XLSX_CHUNK)
+            if not trozo:
+                break
+            yield trozo
+    finally:
+        f.close()
+
+
+@router.get("/lista-precios/{clienteid}")
+def lista_precios(
+    clienteid: int,
+    fecha: Optional[date] = Query(None),
+    formato: str = Query("csv", pattern="^(csv|xlsx)$"),
+    service: TarifasService = Depends(get_service),
+):
+    try:
+        df = service.lista_precios(clienteid, fecha)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    nombre = f"lista_precios_{clienteid}_{(fecha or date.today()).isoformat()}"
+    if formato == "xlsx":
+        return StreamingResponse(
+            _iter_fichero(_xlsx_fichero(df)),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f'attachment; filename="{nombre}.xlsx"'},
+        )
+    return StreamingResponse(
+        _iter_csv(df),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.csv"'},
+    )
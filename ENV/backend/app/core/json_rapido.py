@@ -0,0 +1,29 @@
+# backend/app/core/json_rapido.py
+"""
+Respuestas JSON sin pasar por pydantic para los listados grandes.
+
+Los endpoints que ya tienen los datos como dicts planos (filas de
+PostgREST: str, int, float, bool, None) pueden devolverlos con
+respuesta_json() y ahorrarse construir y validar un modelo por fila.
+Con orjson instalado serializa con orjson; si no, con json de la
+biblioteca estandar (mismo resultado, mas lento).
+"""
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+
+def dumps(contenido: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(contenido, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(contenido, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def respuesta_json(contenido: Any, status_code: int = 200, headers: dict | None = None) -> Response:
+    return Response(content=dumps(contenido), status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,143 @@
+# backend/app/core/paginacion.py
+"""
+Paginacion por cursor (keyset) y modos de conteo para los listados.
+
+El cursor es opaco para el cliente: JSON en base64url con el orden usado y
+los valores (clave de orden, clave primaria) de la ultima fila devuelta.
+La pagina siguiente se pide con "(orden, pk) > (valores del cursor)" en el
+sentido del orden, asi que cuesta lo mismo la pagina 1 que la 1000.
+
+Conteos: exact (count(*) completo), planned (estimacion del planificador),
+estimated (exacto hasta el limite de PostgREST, luego planificador) o none.
+Las paginas pedidas con cursor no cuentan (total=None): el total se pide
+una vez con la primera pagina.
+"""
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+CONTEOS = ("exact", "estimated", "planned", "none")
+CONTEO_PATTERN = "^(exact|estimated|planned|none)$"
+
+
+def modo_conteo(count: Optional[str], cursor: Optional[str] = None) -> Optional[str]:
+    """Valor para select(count=...) de postgrest (None = sin conteo)."""
+    count = (count or "exact").lower()
+    if count not in CONTEOS:
+        raise ValueError(f"count debe ser uno de {', '.join(CONTEOS)}")
+    return None if count == "none" or cursor else count
+
+
+# -----------------------------
+# Cursor opaco
+# -----------------------------
+def encode_cursor(orden: Sequence[Tuple[str, bool]], valores: Sequence[Any]) -> str:
+    raw = json.dumps({"o": [[c, d] for c, d in orden], "v": list(valores)}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, orden: Sequence[Tuple[str, bool]]) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw.decode("utf-8"))
+        valores = data["v"]
+        orden_cursor = [(c, bool(d)) for c, d in data["o"]]
+    except Exception:
+        raise ValueError("Cursor no valido")
+    if orden_cursor != [(c, bool(d)) for c, d in orden] or len(valores) != len(orden):
+        raise ValueError("El cursor no corresponde a este orden; vuelve a la primera pagina")
+    return valores
+
+
+def cursor_de_fila(orden: Sequence[Tuple[str, bool]], fila: dict) -> str:
+    return encode_cursor(orden, [fila.get(c) for c, _ in orden])
+
+
+# -----------------------------
+# Filtro keyset
+# -----------------------------
+def _literal(v: Any) -> str:
+    # Valores entre comillas dobles para que comas/parentesis no rompan or=(...)
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (int, float)):
+        return str(v)
+    s = str(v).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{s}"'
+
+
+def condicion_keyset(orden: Sequence[Tuple[str, bool]], valores: Sequence[Any]) -> str:
+    """
+    Expresion PostgREST (contenido de un or=(...)) para las filas que van
+    despues de `valores` con el orden dado. La ultima columna de `orden` debe
+    ser la clave primaria (unica y no nula). Respeta el orden de nulos por
+    defecto de Postgres: NULLS LAST en ascendente, NULLS FIRST en descendente.
+    """
+    ramas: List[str] = []
+    iguales: List[str] = []
+    for i, ((col, desc), v) in enumerate(zip(orden, valores)):
+        ultima = i == len(orden) - 1
+        op = "lt" if desc else "gt"
+        if v is None:
+            # Tras un nulo: en DESC siguen los no nulos; en ASC solo quedan nulos
+            if desc and not ultima:
+                ramas.append(_and(iguales + [f"{col}.not.is.null"]))
+            iguales.append(f"{col}.is.null")
+            continue
+        ramas.append(_and(iguales + [f"{col}.{op}.{_literal(v)}"]))
+        if not desc and not ultima:
+            ramas.append(_and(iguales + [f"{col}.is.null"]))
+        iguales.append(f"{col}.eq.{_literal(v)}")
+    return ",".join(ramas)
+
+
+def _and(condiciones: List[str]) -> str:
+    return condiciones[0] if len(condiciones) == 1 else f"and({','.join(condiciones)})"
+
+
+def aplicar_or(query, grupos: List[str]):
+    """
+    Aplica varios grupos OR a la vez (busqueda + keyset) en un unico
+    parametro or=(...), combinandolos con and(or(...),or(...)).
+    """
+    grupos = [g for g in grupos if g]
+    if not grupos:
+        return query
+    if len(grupos) == 1:
+        return query.or_(grupos[0])
+    return query.or_(f"and({','.join(f'or({g})' for g in grupos)})")
+
+
+def pagina_keyset(
+    query,
+    orden: Sequence[Tuple[str, bool]],
+    *,
+    cursor: Optional[str],
+    page: int,
+    page_size: int,
+    grupos_or: Optional[List[str]] = None,
+):
+    """
+    Ordena por `orden`, aplica los grupos OR y el cursor (si llega) y pide
+    una fila de mas para saber si hay pagina siguiente. Sin cursor pagina
+    por offset (page), igual que antes.
+    Devuelve (query, trocear) donde trocear(filas) -> (filas_pagina, next_cursor).
+    """
+    grupos = list(grupos_or or [])
+    if cursor:
+        grupos.append(condicion_keyset(orden, decode_cursor(cursor, orden)))
+    query = aplicar_or(query, grupos)
+    for col, desc in orden:
+        query = query.order(col, desc=desc)
+
+    start = 0 if cursor else (page - 1) * page_size
+    query = query.range(start, start + page_size)
+
+    def trocear(filas: List[dict]):
+        filas = filas or []
+        if len(filas) <= page_size:
+            return filas, None
+        filas = filas[:page_size]
+        return filas, cursor_de_fila(orden, filas[-1])
+
+    return query, trocear
@@ -1,7 +1,10 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from backend.app.api import (
     catalogos,
     clientes,
+    clientes_convertir,
     postal,
     productos,
     cliente_contacto,
@@ -13,10 +16,20 @@ from backend.app.api import (
     pedidos,
     crm_acciones,
 )
+from backend.app.services.presupuesto_pdf_export import cerrar_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Procesos de render de la exportacion ZIP de presupuestos
+    cerrar_pool()
+
 
-app = FastAPI(title="ERP EnteNova")
+app = FastAPI(title="ERP EnteNova", lifespan=lifespan)
 
 app.include_router(clientes.router)
+app.include_router(clientes_convertir.router)
 app.include_router(catalogos.router)
 app.include_router(postal.router)
 app.include_router(productos.router)
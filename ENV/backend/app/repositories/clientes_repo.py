@@ -1,6 +1,55 @@
 # backend/app/repositories/clientes_repo.py
-from typing import Optional, Tuple, List
+from typing import Optional, Sequence, Tuple, List
+
+from postgrest.exceptions import APIError
+
 from backend.app.schemas.cliente import ClienteOut
+from backend.app.core.paginacion import modo_conteo, pagina_keyset
+
+# Todas las columnas de cliente que expone la API (ficha y fields=)
+CAMPOS_CLIENTE = (
+    "clienteid", "codigocuenta", "codigoclienteoproveedor", "clienteoproveedor",
+    "razonsocial", "nombre", "cifdni", "cif_normalizado", "viapublica", "domicilio",
+    "codigopostal", "provincia", "municipio", "telefono", "telefono2", "telefono3", "fax",
+    "iban", "codigobanco", "codigoagencia", "dc", "ccc", "codigotipoefecto",
+    "codigocuentaefecto", "codigocuentaimpagado", "remesahabitual", "idgrupo",
+)
+
+# Proyeccion por defecto del listado: lo que pintan tarjetas y tabla
+CAMPOS_LISTA = (
+    "clienteid", "codigocuenta", "codigoclienteoproveedor", "clienteoproveedor",
+    "razonsocial", "nombre", "cifdni", "idgrupo",
+)
+
+_CAMPOS_DIRECCION = (
+    "clientes_direccionid, direccion_origen_id, idtercero, razonsocial, "
+    "nombrecomercial, direccionfiscal, direccion, idpais, idprovincia, "
+    "idmunicipio, codigopostal, rci_estado, rci_poblacion, rci_idterritorio, "
+    "municipio, cif, referenciacliente, created_at, updated_at"
+)
+_CAMPOS_CONTACTO = "cliente_contactoid, clienteid, tipo, valor, valor_norm, principal"
+
+# Relacion no encontrada / columna inexistente: falta backend/sql/cliente_updated_at.sql
+_ERRORES_ESQUEMA = {"PGRST200", "PGRST204", "42703"}
+
+# None = sin comprobar; False = la base no admite la select embebida
+_EMBED_DISPONIBLE = None
+
+
+def filtro_busqueda(q: str) -> str:
+    """Expresion or_ de la busqueda `q` del listado (la conversion masiva usa la misma)."""
+    safe_q = q.replace(",", " ")
+    return (
+        "razonsocial.ilike.%{0}%,nombre.ilike.%{0}%,cifdni.ilike.%{0}%,"
+        "codigocuenta.ilike.%{0}%,codigoclienteoproveedor.ilike.%{0}%".format(safe_q)
+    )
+
+
+def _codigo_error(e: Exception) -> Optional[str]:
+    code = getattr(e, "code", None)
+    if not code and getattr(e, "args", None) and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
 
 
 class ClientesRepository:
@@ -16,32 +65,18 @@ class ClientesRepository:
         page_size: int,
         sort_field: str,
         sort_dir: str,
-    ) -> Tuple[List[dict], int]:
+        cursor: Optional[str] = None,
+        count: str = "exact",
+        campos: Sequence[str] = CAMPOS_LISTA,
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
-        Devuelve (clientes, total)
+        Devuelve (clientes, total, next_cursor) con las columnas de `campos`.
+        Con cursor pagina por keyset (sort_field, clienteid); sin el, por offset.
         """
 
-        query = self.supabase.table("cliente").select(
-            "clienteid, codigocuenta, codigoclienteoproveedor, clienteoproveedor, "
-            "razonsocial, nombre, cifdni, cif_normalizado, viapublica, domicilio, "
-            "codigopostal, provincia, municipio, telefono, telefono2, telefono3, fax, "
-            "iban, codigobanco, codigoagencia, dc, ccc, codigotipoefecto, "
-            "codigocuentaefecto, codigocuentaimpagado, remesahabitual, idgrupo",
-            count="exact",
-        )
-
+        busqueda = []
         if q:
-            safe_q = q.replace(",", " ")
-            query = query.or_(
-                "razonsocial.ilike.%{0}%,nombre.ilike.%{0}%,cifdni.ilike.%{0}%,"
-                "codigocuenta.ilike.%{0}%,codigoclienteoproveedor.ilike.%{0}%".format(safe_q)
-            )
-
-        if tipo:
-            query = query.eq("clienteoproveedor", tipo)
-
-        if idgrupo:
-            query = query.eq("idgrupo", idgrupo)
+            busqueda.append(filtro_busqueda(q))
 
         # Orden
         allowed_sort = {
@@ -53,30 +88,82 @@ class ClientesRepository:
             "codigoclienteoproveedor",
         }
         sort_field = sort_field if sort_field in allowed_sort else "razonsocial"
-        ascending = sort_dir.upper() == "ASC"
-        query = query.order(sort_field, desc=not ascending)
 
-        # Paginación
-        start = (page - 1) * page_size
-        end = start + page_size - 1
+        # El cursor se arma con (sort_field, clienteid): siempre van en la select
+        columnas = list(dict.fromkeys(["clienteid", *campos, sort_field]))
+        query = self.supabase.table("cliente").select(
+            ", ".join(columnas),
+            count=modo_conteo(count, cursor),
+        )
 
-        res = query.range(start, end).execute()
+        if tipo:
+            query = query.eq("clienteoproveedor", tipo)
 
-        data = res.data or []
-        total = res.count or 0
+        if idgrupo:
+            query = query.eq("idgrupo", idgrupo)
+
+        ascending = sort_dir.upper() == "ASC"
+        orden = [(sort_field, not ascending)]
+        if sort_field != "clienteid":
+            orden.append(("clienteid", not ascending))
+
+        # Paginación (offset o keyset)
+        query, trocear = pagina_keyset(
+            query, orden, cursor=cursor, page=page, page_size=page_size, grupos_or=busqueda
+        )
+        res = query.execute()
 
-        return data, total
+        data, next_cursor = trocear(res.data)
+        return data, res.count, next_cursor
 
     def get_cliente_detalle(self, clienteid: int) -> dict:
+        """
+        Ficha del cliente con direcciones y contactos en una sola select
+        (embebidas via las FK de backend/sql/cliente_updated_at.sql).
+        Si la base aun no tiene esas FK o cliente.updated_at, tres consultas.
+        """
+        global _EMBED_DISPONIBLE
+        if _EMBED_DISPONIBLE is not False:
+            try:
+                base = (
+                    self.supabase.table("cliente")
+                    .select(
+                        f"{', '.join(CAMPOS_CLIENTE)}, updated_at, "
+                        f"direcciones:clientes_direccion!idtercero({_CAMPOS_DIRECCION}), "
+                        f"contactos:cliente_contacto!clienteid({_CAMPOS_CONTACTO})"
+                    )
+                    .eq("clienteid", clienteid)
+                    .limit(1)
+                    .execute()
+                    .data
+                    or []
+                )
+                _EMBED_DISPONIBLE = True
+            except APIError as e:
+                if _codigo_error(e) not in _ERRORES_ESQUEMA:
+                    raise
+                _EMBED_DISPONIBLE = False
+        if _EMBED_DISPONIBLE is False:
+            return self._get_cliente_detalle_separado(clienteid)
+
+        if not base:
+            return {}
+        cliente = dict(base[0])
+        direcciones = sorted(
+            cliente.pop("direcciones", None) or [],
+            key=lambda d: d.get("clientes_direccionid") or 0,
+            reverse=True,
+        )
+        contactos = sorted(
+            cliente.pop("contactos", None) or [],
+            key=lambda c: (not c.get("principal"), c.get("tipo") or ""),
+        )
+        return self._detalle(cliente, direcciones, contactos)
+
+    def _get_cliente_detalle_separado(self, clienteid: int) -> dict:
         base = (
             self.supabase.table("cliente")
-            .select(
-                "clienteid, codigocuenta, codigoclienteoproveedor, clienteoproveedor, "
-                "razonsocial, nombre, cifdni, cif_normalizado, viapublica, domicilio, "
-                "codigopostal, provincia, municipio, telefono, telefono2, telefono3, fax, "
-                "iban, codigobanco, codigoagencia, dc, ccc, codigotipoefecto, "
-                "codigocuentaefecto, codigocuentaimpagado, remesahabitual, idgrupo"
-            )
+            .select(", ".join(CAMPOS_CLIENTE))
             .eq("clienteid", clienteid)
             .limit(1)
             .execute()
@@ -90,12 +177,7 @@ class ClientesRepository:
 
         direcciones = (
             self.supabase.table("clientes_direccion")
-            .select(
-                "clientes_direccionid, direccion_origen_id, idtercero, razonsocial, "
-                "nombrecomercial, direccionfiscal, direccion, idpais, idprovincia, "
-                "idmunicipio, codigopostal, rci_estado, rci_poblacion, rci_idterritorio, "
-                "municipio, cif, referenciacliente, created_at, updated_at"
-            )
+            .select(_CAMPOS_DIRECCION)
             .eq("idtercero", clienteid)
             .order("clientes_direccionid", desc=True)
             .execute()
@@ -104,7 +186,7 @@ class ClientesRepository:
         )
         contactos = (
             self.supabase.table("cliente_contacto")
-            .select("cliente_contactoid, clienteid, tipo, valor, valor_norm, principal")
+            .select(_CAMPOS_CONTACTO)
             .eq("clienteid", clienteid)
             .order("principal", desc=True)
             .order("tipo")
@@ -112,7 +194,10 @@ class ClientesRepository:
             .data
             or []
         )
+        return self._detalle(cliente, direcciones, contactos)
 
+    @staticmethod
+    def _detalle(cliente: dict, direcciones: List[dict], contactos: List[dict]) -> dict:
         return {
             "cliente": cliente,
             "direcciones": direcciones,
@@ -120,6 +205,26 @@ class ClientesRepository:
             "contacto_principal": next((c for c in contactos if c.get("principal")), None),
         }
 
+    def get_cliente_version(self, clienteid: int) -> Optional[str]:
+        """updated_at del cliente (None si no existe o la columna no esta creada)."""
+        if _EMBED_DISPONIBLE is False:
+            return None
+        try:
+            rows = (
+                self.supabase.table("cliente")
+                .select("updated_at")
+                .eq("clienteid", clienteid)
+                .limit(1)
+                .execute()
+                .data
+                or []
+            )
+        except APIError as e:
+            if _codigo_error(e) not in _ERRORES_ESQUEMA:
+                raise
+            return None
+        return rows[0].get("updated_at") if rows else None
+
     def update_cliente(self, clienteid: int, data: dict) -> bool:
         if not data:
             return False
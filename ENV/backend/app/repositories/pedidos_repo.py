@@ -1,6 +1,36 @@
 from postgrest.exceptions import APIError
 # backend/app/repositories/pedidos_repo.py
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from backend.app.core.paginacion import modo_conteo, pagina_keyset
+
+_IN_CHUNK = 200
+_PAGE = 1000
+
+# Columnas de pedido_totales que añade backend/sql/pedido_totales.sql
+_COLUMNAS_NUEVAS = ("use_iva", "version_calculada")
+# False si la migracion no esta aplicada
+_COLUMNAS_NUEVAS_DISPONIBLES = True
+
+
+def _con_columnas_nuevas(escribir, datos):
+    """Escribe totales; si las columnas nuevas no existen, repite sin ellas y lo recuerda."""
+    global _COLUMNAS_NUEVAS_DISPONIBLES
+
+    def sin_nuevas(d):
+        if isinstance(d, list):
+            return [{k: v for k, v in r.items() if k not in _COLUMNAS_NUEVAS} for r in d]
+        return {k: v for k, v in d.items() if k not in _COLUMNAS_NUEVAS}
+
+    if not _COLUMNAS_NUEVAS_DISPONIBLES:
+        return escribir(sin_nuevas(datos))
+    try:
+        return escribir(datos)
+    except APIError as e:
+        if getattr(e, "code", None) not in ("PGRST204", "42703"):
+            raise
+        _COLUMNAS_NUEVAS_DISPONIBLES = False
+        return escribir(sin_nuevas(datos))
 
 
 class PedidosRepository:
@@ -10,8 +40,19 @@ class PedidosRepository:
     # -----------------------------
     # Listado
     # -----------------------------
-    def listar(self, filtros: dict, page: int, page_size: int) -> Tuple[List[dict], int]:
-        q = self.supabase.table("pedido").select("*", count="exact")
+    def listar(
+        self,
+        filtros: dict,
+        page: int,
+        page_size: int,
+        cursor: Optional[str] = None,
+        count: str = "exact",
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
+        """
+        Devuelve (pedidos, total, next_cursor). Con cursor pagina por keyset
+        (fecha_pedido, pedidoid); sin el, por offset.
+        """
+        q = self.supabase.table("pedido").select("*", count=modo_conteo(count, cursor))
 
         if filtros.get("tipo_devolucion"):
             tipo_dev = (
@@ -25,8 +66,9 @@ class PedidosRepository:
             if tipo_dev:
                 q = q.eq("tipo_pedidoid", tipo_dev.get("tipo_pedidoid"))
 
+        busqueda = []
         if filtros.get("q"):
-            q = q.or_(f"numero.ilike.%{filtros['q']}%,referencia_cliente.ilike.%{filtros['q']}%")
+            busqueda.append(f"numero.ilike.%{filtros['q']}%,referencia_cliente.ilike.%{filtros['q']}%")
         if filtros.get("estadoid"):
             q = q.eq("estado_pedidoid", filtros["estadoid"])
         if filtros.get("tipo_pedidoid"):
@@ -40,14 +82,16 @@ class PedidosRepository:
         if filtros.get("fecha_hasta"):
             q = q.lte("fecha_pedido", filtros["fecha_hasta"])
 
-        start = (page - 1) * page_size
-        end = start + page_size - 1
+        orden = [("fecha_pedido", True), ("pedidoid", True)]
+        q, trocear = pagina_keyset(q, orden, cursor=cursor, page=page, page_size=page_size, grupos_or=busqueda)
         try:
-            res = q.order("fecha_pedido", desc=True).range(start, end).execute()
+            res = q.execute()
         except APIError as e:
-            if getattr(e, "args", None) and isinstance(e.args[0], dict) and e.args[0].get("code") == "PGRST205":
-                return [], 0
+            if getattr(e, "code", None) == "PGRST205":
+                return [], 0, None
             raise
+        rows, next_cursor = trocear(res.data)
+        return rows, res.count, next_cursor
 
     # -----------------------------
     # Cabecera / detalle
@@ -92,6 +136,15 @@ class PedidosRepository:
     def borrar_linea(self, detalleid: int):
         self.supabase.table("pedido_detalle").delete().eq("pedido_detalleid", detalleid).execute()
 
+    def sincronizar_lineas(self, pedidoid: int, nuevas: List[dict], cambiadas: List[dict], borrar: List[int]):
+        """Aplica el diff de lineas con una sentencia por tipo de cambio."""
+        if borrar:
+            self.supabase.table("pedido_detalle").delete().eq("pedidoid", pedidoid).in_("pedido_detalleid", borrar).execute()
+        if cambiadas:
+            self.supabase.table("pedido_detalle").upsert(cambiadas, on_conflict="pedido_detalleid").execute()
+        if nuevas:
+            self.supabase.table("pedido_detalle").insert(nuevas).execute()
+
     # -----------------------------
     # Totales
     # -----------------------------
@@ -110,11 +163,68 @@ class PedidosRepository:
 
     def actualizar_totales(self, pedidoid: int, payload: dict):
         exists = self.totales(pedidoid)
-        if exists:
-            self.supabase.table("pedido_totales").update(payload).eq("pedidoid", pedidoid).execute()
-        else:
-            payload["pedidoid"] = pedidoid
-            self.supabase.table("pedido_totales").insert(payload).execute()
+
+        def escribir(datos: dict):
+            if exists:
+                self.supabase.table("pedido_totales").update(datos).eq("pedidoid", pedidoid).execute()
+            else:
+                self.supabase.table("pedido_totales").insert({**datos, "pedidoid": pedidoid}).execute()
+
+        _con_columnas_nuevas(escribir, payload)
+
+    # -----------------------------
+    # Totales en bloque
+    # -----------------------------
+    def _in_paginado(self, table: str, columns: str, col: str, ids: List[int], order: str) -> List[dict]:
+        rows: List[dict] = []
+        for i in range(0, len(ids), _IN_CHUNK):
+            trozo = ids[i : i + _IN_CHUNK]
+            start = 0
+            while True:
+                chunk = (
+                    self.supabase.table(table)
+                    .select(columns)
+                    .in_(col, trozo)
+                    .order(order)
+                    .range(start, start + _PAGE - 1)
+                    .execute()
+                    .data
+                    or []
+                )
+                rows.extend(chunk)
+                if len(chunk) < _PAGE:
+                    break
+                start += _PAGE
+        return rows
+
+    def totales_lote(self, pedido_ids: List[int]) -> Dict[int, dict]:
+        try:
+            rows = self._in_paginado("pedido_totales", "*", "pedidoid", pedido_ids, "pedidoid")
+        except APIError as e:
+            if getattr(e, "code", None) == "PGRST205":
+                return {}
+            raise
+        return {int(r["pedidoid"]): r for r in rows}
+
+    def pedidos_lote(self, pedido_ids: List[int]) -> Dict[int, dict]:
+        rows = self._in_paginado("pedido", "pedidoid, clienteid", "pedidoid", pedido_ids, "pedidoid")
+        return {int(r["pedidoid"]): r for r in rows}
+
+    def lineas_lote(self, pedido_ids: List[int]) -> List[dict]:
+        return self._in_paginado(
+            "pedido_detalle",
+            "pedido_detalleid, pedidoid, productoid, cantidad, precio_unitario",
+            "pedidoid",
+            pedido_ids,
+            "pedido_detalleid",
+        )
+
+    def upsert_totales(self, rows: List[dict]):
+        if rows:
+            _con_columnas_nuevas(
+                lambda filas: self.supabase.table("pedido_totales").upsert(filas, on_conflict="pedidoid").execute(),
+                rows,
+            )
 
     # -----------------------------
     # Observaciones
@@ -3,6 +3,48 @@ from postgrest.exceptions import APIError
 from datetime import date, datetime
 from typing import Dict, List, Optional, Tuple
 
+from backend.app.core.paginacion import modo_conteo, pagina_keyset
+
+_PAGE = 1000
+_UPSERT_CHUNK = 500
+
+
+def _codigo_error(e: APIError) -> Optional[str]:
+    code = getattr(e, "code", None)
+    if not code and getattr(e, "args", None) and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
+
+
+# False = la base no tiene presupuesto_linea.descuento_manual (backend/sql/presupuesto_linea_descuento_manual.sql)
+_DESCUENTO_MANUAL_DISPONIBLE = True
+
+
+def _con_descuento_manual(operar, datos=None):
+    """
+    Lee o escribe lineas con la columna descuento_manual; si no existe,
+    repite la operacion sin ella y lo recuerda. operar recibe los datos
+    (o None en lecturas) y un booleano que indica si usar la columna.
+    """
+    global _DESCUENTO_MANUAL_DISPONIBLE
+
+    def sin_columna(d):
+        if d is None:
+            return None
+        if isinstance(d, list):
+            return [{k: v for k, v in r.items() if k != "descuento_manual"} for r in d]
+        return {k: v for k, v in d.items() if k != "descuento_manual"}
+
+    if not _DESCUENTO_MANUAL_DISPONIBLE:
+        return operar(sin_columna(datos), False)
+    try:
+        return operar(datos, True)
+    except APIError as e:
+        if _codigo_error(e) not in ("PGRST204", "42703"):
+            raise
+        _DESCUENTO_MANUAL_DISPONIBLE = False
+        return operar(sin_columna(datos), False)
+
 
 class PresupuestosRepository:
     def __init__(self, supabase):
@@ -11,7 +53,7 @@ class PresupuestosRepository:
     def _select_presupuesto_fields(self) -> str:
         return (
             "presupuesto_id,numero,clienteid,presupuesto_estadoid,fecha_presupuesto,"
-            "fecha_validez,total_estimada,trabajadorid,editable,ambito_impuesto,"
+            "fecha_validez,total_estimada,trabajadorid,editable,ambito_impuesto,created_at,"
             "cliente:cliente(razonsocial,nombre),"
             "estado:presupuesto_estado(estado,bloquea_edicion)"
         )
@@ -28,11 +70,18 @@ class PresupuestosRepository:
         page: int,
         page_size: int,
         ordenar_por: str,
-    ) -> Tuple[List[dict], int]:
-        query = self.supabase.table("presupuesto").select(self._select_presupuesto_fields(), count="exact")
+        cursor: Optional[str] = None,
+        count: str = "exact",
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
+        """
+        Devuelve (presupuestos, total, next_cursor). Con cursor pagina por
+        keyset (orden, presupuesto_id); sin el, por offset como siempre.
+        """
+        query = self.supabase.table("presupuesto").select(
+            self._select_presupuesto_fields(), count=modo_conteo(count, cursor)
+        )
 
-        if q:
-            query = query.or_(f"numero.ilike.%{q}%,referencia_cliente.ilike.%{q}%")
+        busqueda = [f"numero.ilike.%{q}%,referencia_cliente.ilike.%{q}%"] if q else []
 
         if estadoid:
             query = query.eq("presupuesto_estadoid", estadoid)
@@ -43,20 +92,55 @@ class PresupuestosRepository:
         if ambito_impuesto:
             query = query.eq("ambito_impuesto", ambito_impuesto)
 
-        if ordenar_por == "fecha_presupuesto":
-            query = query.order("fecha_presupuesto", desc=True)
-        else:
-            query = query.order("created_at", desc=True)
+        campo = "fecha_presupuesto" if ordenar_por == "fecha_presupuesto" else "created_at"
+        orden = [(campo, True), ("presupuesto_id", True)]
+        query, trocear = pagina_keyset(
+            query, orden, cursor=cursor, page=page, page_size=page_size, grupos_or=busqueda
+        )
 
-        start = (page - 1) * page_size
-        end = start + page_size - 1
         try:
-            res = query.range(start, end).execute()
-            return res.data or [], res.count or 0
+            res = query.execute()
         except APIError as e:
-            if getattr(e, "args", None) and isinstance(e.args[0], dict) and e.args[0].get("code") == "PGRST205":
-                return [], 0
+            if _codigo_error(e) == "PGRST205":
+                return [], 0, None
             raise
+        rows, next_cursor = trocear(res.data)
+        return rows, res.count, next_cursor
+
+    def ids_filtrados(
+        self,
+        q: Optional[str],
+        estadoid: Optional[int],
+        clienteid: Optional[int],
+        ambito_impuesto: Optional[str],
+        fecha_desde: Optional[date],
+        fecha_hasta: Optional[date],
+    ) -> List[int]:
+        """Ids (por fecha de presupuesto) que cumplen los filtros del listado, sin limite de pagina."""
+        ids: List[int] = []
+        start = 0
+        while True:
+            query = self.supabase.table("presupuesto").select("presupuesto_id")
+            if q:
+                query = query.or_(f"numero.ilike.%{q}%,referencia_cliente.ilike.%{q}%")
+            if estadoid:
+                query = query.eq("presupuesto_estadoid", estadoid)
+            if clienteid:
+                query = query.eq("clienteid", clienteid)
+            if ambito_impuesto:
+                query = query.eq("ambito_impuesto", ambito_impuesto)
+            if fecha_desde:
+                query = query.gte("fecha_presupuesto", fecha_desde.isoformat())
+            if fecha_hasta:
+                query = query.lte("fecha_presupuesto", fecha_hasta.isoformat())
+            chunk = (
+                query.order("fecha_presupuesto").order("presupuesto_id").range(start, start + _PAGE - 1).execute().data
+                or []
+            )
+            ids.extend(r["presupuesto_id"] for r in chunk)
+            if len(chunk) < _PAGE:
+                return ids
+            start += _PAGE
 
     # -----------------------------
     # Cabecera
@@ -85,24 +169,83 @@ class PresupuestosRepository:
     # LÍneas
     # -----------------------------
     def listar_lineas(self, presupuestoid: int) -> List[dict]:
+        def leer(_, con_manual: bool):
+            return (
+                self.supabase.table("presupuesto_linea")
+                .select(
+                    "presupuesto_linea_id, producto_id, descripcion, cantidad, precio_unitario, "
+                    "descuento_pct, iva_pct, base_linea, iva_importe, total_linea, "
+                    "tarifa_aplicada, nivel_tarifa" + (", descuento_manual" if con_manual else "")
+                )
+                .eq("presupuesto_id", presupuestoid)
+                .order("presupuesto_linea_id", desc=False)
+                .execute()
+            )
+
+        return _con_descuento_manual(leer).data or []
+
+    def insertar_linea(self, data: dict) -> int:
+        res = _con_descuento_manual(
+            lambda d, _: self.supabase.table("presupuesto_linea").insert(d).execute(), data
+        )
+        return res.data[0]["presupuesto_linea_id"]
+
+    def insertar_lineas(self, rows: List[dict]) -> List[int]:
+        if not rows:
+            return []
+        res = _con_descuento_manual(
+            lambda d, _: self.supabase.table("presupuesto_linea").insert(d).execute(), rows
+        )
+        return [r["presupuesto_linea_id"] for r in (res.data or [])]
+
+    def obtener_linea(self, presupuestoid: int, detalleid: int) -> Optional[dict]:
+        def leer(_, con_manual: bool):
+            return (
+                self.supabase.table("presupuesto_linea")
+                .select(
+                    "presupuesto_linea_id, producto_id, descripcion, cantidad, descuento_pct, "
+                    "base_linea, iva_importe, total_linea" + (", descuento_manual" if con_manual else "")
+                )
+                .eq("presupuesto_linea_id", detalleid)
+                .eq("presupuesto_id", presupuestoid)
+                .maybe_single()
+                .execute()
+            )
+
+        return _con_descuento_manual(leer).data or None
+
+    def borrar_linea(self, presupuestoid: int, detalleid: int) -> Optional[dict]:
+        # delete devuelve la fila borrada: sirve para restar su delta sin releer
         res = (
             self.supabase.table("presupuesto_linea")
-            .select(
-                "presupuesto_linea_id, producto_id, descripcion, cantidad, precio_unitario, "
-                "descuento_pct, iva_pct, base_linea, iva_importe, total_linea, "
-                "tarifa_aplicada, nivel_tarifa"
-            )
+            .delete()
+            .eq("presupuesto_linea_id", detalleid)
             .eq("presupuesto_id", presupuestoid)
-            .order("presupuesto_linea_id", desc=False)
             .execute()
         )
-        return res.data or []
-    def insertar_linea(self, data: dict) -> int:
-        res = self.supabase.table("presupuesto_linea").insert(data).execute()
-        return res.data[0]["presupuesto_linea_id"]
+        return (res.data or [None])[0]
 
     def actualizar_linea(self, detalleid: int, data: dict):
-        self.supabase.table("presupuesto_linea").update(data).eq("presupuesto_linea_id", detalleid).execute()
+        _con_descuento_manual(
+            lambda d, _: self.supabase.table("presupuesto_linea").update(d).eq("presupuesto_linea_id", detalleid).execute(),
+            data,
+        )
+
+    def guardar_recalculo(self, presupuestoid: int, lineas: List[dict], totales: dict):
+        """
+        Escritura del recalculo completo: lineas en upserts masivos por
+        presupuesto_linea_id (troceados) y, a continuacion, la fila de
+        totales y total_estimada de cabecera.
+        """
+        for i in range(0, len(lineas), _UPSERT_CHUNK):
+            _con_descuento_manual(
+                lambda d, _: self.supabase.table("presupuesto_linea")
+                .upsert(d, on_conflict="presupuesto_linea_id")
+                .execute(),
+                lineas[i : i + _UPSERT_CHUNK],
+            )
+        self.upsert_totales(totales)
+        self.actualizar(presupuestoid, {"total_estimada": totales["total_documento"]})
 
     def borrar_lineas(self, presupuestoid: int):
         self.supabase.table("presupuesto_linea").delete().eq("presupuesto_id", presupuestoid).execute()
@@ -110,6 +253,139 @@ class PresupuestosRepository:
     def upsert_totales(self, data: dict):
         self.supabase.table("presupuesto_totales").upsert(data).execute()
 
+    # -----------------------------
+    # Totales incrementales
+    # -----------------------------
+    def aplicar_delta_totales(self, presupuestoid: int, base: float, iva: float, total: float) -> Optional[float]:
+        """
+        Suma el delta a presupuesto_totales y presupuesto.total_estimada
+        (RPC presupuesto_aplicar_delta, ver backend/sql/presupuesto_totales_delta.sql).
+        Devuelve el nuevo total_estimada.
+        """
+        try:
+            res = self.supabase.rpc(
+                "presupuesto_aplicar_delta",
+                {"p_presupuesto_id": presupuestoid, "p_base": base, "p_iva": iva, "p_total": total},
+            ).execute()
+            return float(res.data) if res.data is not None else None
+        except APIError as e:
+            if _codigo_error(e) != "PGRST202":
+                raise
+        return self._aplicar_delta_sin_rpc(presupuestoid, base, iva, total)
+
+    def _aplicar_delta_sin_rpc(self, presupuestoid: int, base: float, iva: float, total: float) -> float:
+        actual = self.obtener_totales([presupuestoid]).get(presupuestoid) or {}
+        self.upsert_totales(
+            {
+                "presupuesto_id": presupuestoid,
+                "base_imponible": round(float(actual.get("base_imponible") or 0) + base, 2),
+                "iva_total": round(float(actual.get("iva_total") or 0) + iva, 2),
+                "total_documento": round(float(actual.get("total_documento") or 0) + total, 2),
+                "fecha_recalculo": datetime.now().isoformat(),
+            }
+        )
+        pres = (
+            self.supabase.table("presupuesto")
+            .select("total_estimada")
+            .eq("presupuesto_id", presupuestoid)
+            .maybe_single()
+            .execute()
+            .data
+            or {}
+        )
+        nuevo = round(float(pres.get("total_estimada") or 0) + total, 2)
+        self.actualizar(presupuestoid, {"total_estimada": nuevo})
+        return nuevo
+
+    def reconciliar_totales(self, presupuestoid: Optional[int] = None) -> List[dict]:
+        """
+        Recalculo completo desde las lineas (RPC presupuesto_reconciliar_totales).
+        Devuelve solo los presupuestos que estaban descuadrados.
+        """
+        try:
+            res = self.supabase.rpc("presupuesto_reconciliar_totales", {"p_presupuesto_id": presupuestoid}).execute()
+            return res.data or []
+        except APIError as e:
+            if _codigo_error(e) != "PGRST202":
+                raise
+        return self._reconciliar_totales_sin_rpc(presupuestoid)
+
+    def _fetch_paginado(self, table: str, columns: str, order: str, presupuestoid: Optional[int]) -> List[dict]:
+        rows: List[dict] = []
+        start = 0
+        while True:
+            q = self.supabase.table(table).select(columns)
+            if presupuestoid is not None:
+                q = q.eq("presupuesto_id", presupuestoid)
+            chunk = q.order(order).range(start, start + _PAGE - 1).execute().data or []
+            rows.extend(chunk)
+            if len(chunk) < _PAGE:
+                return rows
+            start += _PAGE
+
+    def _reconciliar_totales_sin_rpc(self, presupuestoid: Optional[int]) -> List[dict]:
+        presupuestos = self._fetch_paginado("presupuesto", "presupuesto_id,total_estimada", "presupuesto_id", presupuestoid)
+        lineas = self._fetch_paginado(
+            "presupuesto_linea",
+            "presupuesto_id,base_linea,iva_importe,total_linea",
+            "presupuesto_linea_id",
+            presupuestoid,
+        )
+        totales = {
+            int(r["presupuesto_id"]): r
+            for r in self._fetch_paginado(
+                "presupuesto_totales",
+                "presupuesto_id,base_imponible,iva_total,total_documento",
+                "presupuesto_id",
+                presupuestoid,
+            )
+        }
+
+        calc: Dict[int, List[float]] = {int(p["presupuesto_id"]): [0.0, 0.0, 0.0] for p in presupuestos}
+        for ln in lineas:
+            acc = calc.get(int(ln["presupuesto_id"]))
+            if acc is not None:
+                acc[0] += float(ln.get("base_linea") or 0)
+                acc[1] += float(ln.get("iva_importe") or 0)
+                acc[2] += float(ln.get("total_linea") or 0)
+
+        ahora = datetime.now().isoformat()
+        descuadres: List[dict] = []
+        for p in presupuestos:
+            pid = int(p["presupuesto_id"])
+            base, iva, total = (round(v, 2) for v in calc[pid])
+            t = totales.get(pid)
+            ok = (
+                t is not None
+                and round(float(t.get("base_imponible") or 0), 2) == base
+                and round(float(t.get("iva_total") or 0), 2) == iva
+                and round(float(t.get("total_documento") or 0), 2) == total
+                and round(float(p.get("total_estimada") or 0), 2) == total
+            )
+            if not ok:
+                descuadres.append(
+                    {
+                        "presupuesto_id": pid,
+                        "base_imponible": base,
+                        "iva_total": iva,
+                        "total_documento": total,
+                        "total_estimada_anterior": p.get("total_estimada"),
+                    }
+                )
+
+        if descuadres:
+            self.supabase.table("presupuesto_totales").upsert(
+                [
+                    {k: d[k] for k in ("presupuesto_id", "base_imponible", "iva_total", "total_documento")}
+                    | {"fecha_recalculo": ahora}
+                    for d in descuadres
+                ],
+                on_conflict="presupuesto_id",
+            ).execute()
+            for d in descuadres:
+                self.actualizar(d["presupuesto_id"], {"total_estimada": d["total_documento"]})
+        return descuadres
+
     def obtener_totales(self, presupuesto_ids: List[int]) -> Dict[int, dict]:
         if not presupuesto_ids:
             return {}
@@ -136,21 +412,49 @@ class PresupuestosRepository:
                 return _fetch("presupuestoid")
             raise
 
-    def contar_lineas(self, presupuestoid: int) -> int:
-        for table, id_col in [("presupuesto_linea", "presupuesto_id"), ("presupuesto_detalle", "presupuestoid")]:
-            try:
-                res = (
-                    self.supabase.table(table)
-                    .select(id_col, count="exact")
-                    .eq(id_col, presupuestoid)
-                    .execute()
-                )
-                return res.count or 0
-            except APIError as e:
-                if getattr(e, "args", None) and isinstance(e.args[0], dict) and e.args[0].get("code") in ("PGRST204", "PGRST205"):
-                    continue
-                raise
-        return 0
+    def resumen_listado(self, presupuesto_ids: List[int]) -> Dict[int, dict]:
+        """
+        num_lineas + totales de todos los presupuestos de una pagina en una
+        consulta (vista presupuesto_resumen, ver backend/sql/presupuesto_resumen.sql).
+        """
+        if not presupuesto_ids:
+            return {}
+        try:
+            res = (
+                self.supabase.table("presupuesto_resumen")
+                .select("presupuesto_id,num_lineas,base_imponible,iva_total,total_documento")
+                .in_("presupuesto_id", presupuesto_ids)
+                .execute()
+            )
+        except APIError as e:
+            if _codigo_error(e) in ("PGRST204", "PGRST205"):
+                return self._resumen_listado_sin_vista(presupuesto_ids)
+            raise
+        return {int(r["presupuesto_id"]): r for r in (res.data or []) if r.get("presupuesto_id") is not None}
+
+    def _resumen_listado_sin_vista(self, presupuesto_ids: List[int]) -> Dict[int, dict]:
+        # Sin la vista: totales en una consulta y lineas agrupadas en memoria
+        out = {pid: dict(t) for pid, t in self.obtener_totales(presupuesto_ids).items()}
+        for pid in presupuesto_ids:
+            out.setdefault(int(pid), {})["num_lineas"] = 0
+        start = 0
+        while True:
+            rows = (
+                self.supabase.table("presupuesto_linea")
+                .select("presupuesto_id")
+                .in_("presupuesto_id", presupuesto_ids)
+                .order("presupuesto_linea_id")
+                .range(start, start + _PAGE - 1)
+                .execute()
+                .data
+                or []
+            )
+            for r in rows:
+                out[int(r["presupuesto_id"])]["num_lineas"] += 1
+            if len(rows) < _PAGE:
+                break
+            start += _PAGE
+        return out
 
     # -----------------------------
     # Apoyos
@@ -219,6 +523,25 @@ class PresupuestosRepository:
             pass
         return None
 
+    def siguiente_numero(self, prefijo: str) -> int:
+        """
+        Reserva el siguiente correlativo del prefijo en una llamada atomica
+        (RPC presupuesto_siguiente_numero, ver backend/sql/presupuesto_contador.sql).
+        """
+        try:
+            res = self.supabase.rpc("presupuesto_siguiente_numero", {"p_prefijo": prefijo}).execute()
+            return int(res.data)
+        except APIError as e:
+            if _codigo_error(e) != "PGRST202":
+                raise
+        # Sin la funcion desplegada: maximo de los numeros existentes (no atomico)
+        usados = [
+            int(x.split("-")[-1])
+            for x in self.ultimo_numero_prefijo(prefijo)
+            if x.split("-")[-1].isdigit()
+        ]
+        return max(usados) + 1 if usados else 1
+
     def ultimo_numero_prefijo(self, prefijo: str) -> List[str]:
         res = (
             self.supabase.table("presupuesto")
@@ -243,14 +566,49 @@ class PresupuestosRepository:
         res = self.supabase.table("pedido").insert(data).execute()
         return (res.data or [None])[0]
 
-    def insertar_linea_pedido(self, data: dict):
-        self.supabase.table("pedido_detalle").insert(data).execute()
+    def insertar_lineas_pedido(self, rows: List[dict]):
+        for i in range(0, len(rows), _UPSERT_CHUNK):
+            self.supabase.table("pedido_detalle").insert(rows[i : i + _UPSERT_CHUNK]).execute()
+
+    def crear_totales_pedido(self, data: dict):
+        self.supabase.table("pedido_totales").insert(data).execute()
+
+    def borrar_pedido(self, pedidoid: int):
+        for table in ("pedido_totales", "pedido_detalle", "pedido"):
+            self.supabase.table(table).delete().eq("pedidoid", pedidoid).execute()
+
+    def convertir_a_pedido(self, presupuestoid: int) -> Optional[dict]:
+        """
+        RPC presupuesto_convertir_a_pedido: cabecera, lineas y totales en una
+        transaccion (backend/sql/presupuesto_convertir.sql). None si la
+        funcion no esta instalada.
+        """
+        try:
+            res = self.supabase.rpc("presupuesto_convertir_a_pedido", {"p_presupuesto_id": presupuestoid}).execute()
+        except APIError as e:
+            code = _codigo_error(e)
+            if code == "PGRST202":
+                return None
+            if code == "P0002":
+                raise ValueError("Presupuesto no encontrado")
+            raise
+        return res.data or None
 
     def marcar_presupuesto_estado(self, presupuestoid: int, estadoid: int, editable: Optional[bool] = None):
-        update_data: Dict[str, object] = {"estado_presupuestoid": estadoid}
+        update_data: Dict[str, object] = {"presupuesto_estadoid": estadoid}
         if editable is not None:
             update_data["editable"] = editable
-        self.supabase.table("presupuesto").update(update_data).eq("presupuestoid", presupuestoid).execute()
+        self.supabase.table("presupuesto").update(update_data).eq("presupuesto_id", presupuestoid).execute()
+
+    def nombre_producto(self, productoid: int) -> Optional[str]:
+        res = (
+            self.supabase.table("producto")
+            .select("nombre")
+            .eq("catalogo_productoid", productoid)
+            .limit(1)
+            .execute()
+        )
+        return (res.data or [{}])[0].get("nombre")
 
     def cliente_basico(self, clienteid: int) -> Optional[dict]:
         res = (
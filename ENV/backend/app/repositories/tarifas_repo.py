@@ -84,3 +84,13 @@ class TarifasRepository:
         )
         d = res.data or None
         return d.get("producto_familiaid") if d else None
+
+    def cliente_existe(self, clienteid: int) -> bool:
+        res = (
+            self.supabase.table("cliente")
+            .select("clienteid")
+            .eq("clienteid", clienteid)
+            .limit(1)
+            .execute()
+        )
+        return bool(res.data)
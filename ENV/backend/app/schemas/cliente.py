@@ -1,5 +1,5 @@
 # backend/app/schemas/cliente.py
-from typing import Optional, List
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
 
 
@@ -41,16 +41,79 @@ class ClienteOut(BaseModel):
 
     idgrupo: Optional[int] = None
 
+    # Version de la ficha (solo en el detalle; ETag / Last-Modified)
+    updated_at: Optional[str] = None
+
     class Config:
         from_attributes = True
 
 
 class ClienteListResponse(BaseModel):
-    data: List[ClienteOut]
-    total: int
-    total_pages: int
+    """
+    Forma de GET /api/clientes (solo documentacion: la ruta devuelve el JSON
+    sin validarlo). Cada fila trae unicamente las columnas de ClienteOut
+    pedidas en `fields` (por defecto la proyeccion ligera del listado); las
+    demas no aparecen, ni siquiera como null.
+    """
+
+    data: List[Dict[str, Any]]
+    total: Optional[int] = None
+    total_pages: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
+
+
+# ============================
+# Autocompletado
+# ============================
+class ClienteSugerencia(BaseModel):
+    clienteid: int
+    razonsocial: Optional[str] = None
+    nombre: Optional[str] = None
+    cifdni: Optional[str] = None
+    score: float = 0.0
+
+
+class ClienteSugerenciasResponse(BaseModel):
+    data: List[ClienteSugerencia]
+
+
+# ============================
+# Duplicados
+# ============================
+class ClienteDuplicadoResumen(BaseModel):
+    clienteid: int
+    razonsocial: Optional[str] = None
+    nombre: Optional[str] = None
+    cifdni: Optional[str] = None
+    cif_normalizado: Optional[str] = None
+    clienteoproveedor: Optional[str] = None
+
+
+class ClienteFusionPropuesta(BaseModel):
+    clienteid_principal: int
+    clienteids_duplicados: List[int]
+    motivos: List[str]
+    confianza: str
+    clientes: List[ClienteDuplicadoResumen]
+
+
+class ClienteDuplicadosInforme(BaseModel):
+    total_clientes: int = 0
+    cif_actualizados: int = 0
+    bloques_omitidos: int = 0
+    conflictos_cif: int = 0
+    total_propuestas: int = 0
+    propuestas: List[ClienteFusionPropuesta] = []
+
+
+class ClienteDuplicadosEstado(BaseModel):
+    estado: str
+    iniciado_en: Optional[str] = None
+    terminado_en: Optional[str] = None
+    error: Optional[str] = None
+    informe: Optional[ClienteDuplicadosInforme] = None
 
 
 # ============================
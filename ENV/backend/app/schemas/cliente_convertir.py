@@ -0,0 +1,28 @@
+# backend/app/schemas/cliente_convertir.py
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class ClienteConvertirResponse(BaseModel):
+    clienteid: int
+    tipo_cliente: str
+    perfil_completo: bool
+    mensaje: str
+
+
+class ClientesConvertirLoteIn(BaseModel):
+    # Seleccion explicita o, si no llega, todos los potenciales del filtro
+    clienteids: Optional[List[int]] = Field(None, max_length=5000)
+    q: Optional[str] = None
+    idgrupo: Optional[int] = None
+
+
+class ClienteConversionFallida(BaseModel):
+    clienteid: int
+    motivo: str
+
+
+class ClientesConvertirLoteOut(BaseModel):
+    total: int
+    convertidos: List[int]
+    fallidos: List[ClienteConversionFallida]
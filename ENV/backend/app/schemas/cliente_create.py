@@ -1,5 +1,5 @@
 from typing import Optional, List
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ClienteContactoIn(BaseModel):
@@ -67,3 +67,24 @@ class ClienteCreateIn(BaseModel):
 class ClienteCreateOut(BaseModel):
     clienteid: int
     mensaje: str
+
+
+class ClientesBatchIn(BaseModel):
+    clientes: List[ClienteCreateIn] = Field(..., min_length=1, max_length=10000)
+
+
+class ClienteBatchResultado(BaseModel):
+    indice: int
+    ok: bool
+    clienteid: Optional[int] = None
+    contactos: int = 0
+    direcciones: int = 0
+    error: Optional[str] = None
+    avisos: List[str] = []
+
+
+class ClientesBatchOut(BaseModel):
+    total: int
+    creados: int
+    errores: int
+    resultados: List[ClienteBatchResultado]
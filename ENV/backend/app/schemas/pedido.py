@@ -21,10 +21,11 @@ class PedidoOut(BaseModel):
 
 class PedidoListResponse(BaseModel):
     data: List[PedidoOut]
-    total: int
-    total_pages: int
+    total: Optional[int] = None
+    total_pages: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class PedidoDetalleOut(PedidoOut):
@@ -85,6 +86,15 @@ class PedidoLineaCreate(BaseModel):
     descuento_pct: Optional[float] = 0.0
 
 
+class PedidoLineaSyncIn(PedidoLineaCreate):
+    # Sin id = linea nueva; con id = linea existente que se conserva
+    pedido_detalleid: Optional[int] = None
+
+
+class PedidoLineasSyncIn(BaseModel):
+    lineas: List[PedidoLineaSyncIn]
+
+
 class PedidoTotalesOut(BaseModel):
     pedidoid: int
     base_imponible: Optional[float] = None
@@ -92,9 +102,24 @@ class PedidoTotalesOut(BaseModel):
     total_importe: Optional[float] = None
     gastos_envio: Optional[float] = None
     envio_sin_cargo: Optional[bool] = None
+    use_iva: Optional[bool] = None
     fecha_recalculo: Optional[datetime] = None
 
 
+class PedidoTotalesLoteOut(BaseModel):
+    data: List[PedidoTotalesOut]
+    # Pedidos sin totales guardados o con recalculo en cola
+    pendientes: List[int] = []
+
+
+class PedidoLineasSyncOut(BaseModel):
+    insertadas: int
+    actualizadas: int
+    borradas: int
+    sin_cambios: int
+    totales: Optional[PedidoTotalesOut] = None
+
+
 class PedidoObservacionIn(BaseModel):
     tipo: str
     comentario: str
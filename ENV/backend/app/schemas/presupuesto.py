@@ -25,10 +25,11 @@ class PresupuestoListItem(BaseModel):
 
 class PresupuestoListResponse(BaseModel):
     data: List[PresupuestoListItem]
-    total: int
-    total_pages: int
+    total: Optional[int] = None
+    total_pages: Optional[int] = None
     page: int
     page_size: int
+    next_cursor: Optional[str] = None
 
 
 class PresupuestoBase(BaseModel):
@@ -92,6 +93,23 @@ class PresupuestoLineaIn(PresupuestoLineaBase):
     pass
 
 
+class PresupuestoLineaUpdateIn(BaseModel):
+    productoid: Optional[int] = None
+    cantidad: Optional[float] = None
+    descuento_pct: Optional[float] = None
+    descripcion: Optional[str] = None
+
+
+class PresupuestoLineasBatchIn(BaseModel):
+    lineas: List[PresupuestoLineaIn]
+
+
+class PresupuestoLineasBatchOut(BaseModel):
+    presupuesto_detalleids: List[int]
+    insertadas: int
+    total_estimada: float
+
+
 class PresupuestoLineaOut(BaseModel):
     presupuesto_detalleid: int
     productoid: Optional[int] = None
@@ -117,6 +135,30 @@ class PresupuestoRecalcResponse(BaseModel):
     fecha_recalculo: datetime
 
 
+class PresupuestoTotalesDescuadre(BaseModel):
+    presupuesto_id: int
+    base_imponible: float
+    iva_total: float
+    total_documento: float
+    total_estimada_anterior: Optional[float] = None
+
+
+class PresupuestoReconciliacionOut(BaseModel):
+    corregidos: int
+    detalle: List[PresupuestoTotalesDescuadre]
+
+
+class PresupuestoPdfZipIn(BaseModel):
+    # Ids concretos; si va vacio se exportan los que cumplan los filtros
+    presupuesto_ids: List[int] = []
+    q: Optional[str] = None
+    estadoid: Optional[int] = None
+    clienteid: Optional[int] = None
+    ambito_impuesto: Optional[str] = None
+    fecha_desde: Optional[date] = None
+    fecha_hasta: Optional[date] = None
+
+
 class PresupuestoCatalogos(BaseModel):
     estados: List[dict]
     clientes: List[dict]
@@ -1,5 +1,5 @@
 from datetime import date
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, model_validator
 
@@ -93,3 +93,58 @@ class PrecioResponse(BaseModel):
     iva_origen: Optional[str] = None
     region: Optional[str] = None
     region_origen: Optional[str] = None
+
+
+class PrecioBatchRequest(BaseModel):
+    lineas: List[PrecioRequest]
+
+
+class PrecioBatchResponse(BaseModel):
+    data: List[PrecioResponse]
+    total: int
+
+
+# -----------------------------
+# Simulador de tarifas (what-if sobre albaranes)
+# -----------------------------
+class TarifaReglaSimulada(TarifaReglaUpdate):
+    tarifaid: Optional[int] = None
+
+
+class SimulacionCambio(BaseModel):
+    accion: Literal["crear", "actualizar", "borrar"]
+    tarifa_reglaid: Optional[int] = None
+    nueva: Optional[TarifaReglaCreate] = None
+    cambios: Optional[TarifaReglaSimulada] = None
+
+    @model_validator(mode="after")
+    def validar_accion(self):
+        if self.accion == "crear" and not self.nueva:
+            raise ValueError("Para crear una regla indica 'nueva'")
+        if self.accion != "crear" and not self.tarifa_reglaid:
+            raise ValueError("Indica tarifa_reglaid de la regla a modificar")
+        return self
+
+
+class SimulacionRequest(BaseModel):
+    fecha_desde: date
+    fecha_hasta: date
+    clienteid: Optional[int] = None
+    cambios: List[SimulacionCambio] = []
+
+
+class SimulacionFila(BaseModel):
+    clave: Optional[int] = None
+    lineas: int
+    total_historico: float
+    total_actual: float
+    total_simulado: float
+    diferencia: float
+    diferencia_pct: Optional[float] = None
+
+
+class SimulacionResponse(BaseModel):
+    resumen: SimulacionFila
+    por_cliente: List[SimulacionFila]
+    por_grupo: List[SimulacionFila]
+    por_familia: List[SimulacionFila]
@@ -1,13 +1,60 @@
 # backend/app/services/cliente_convertir_service.py
+from typing import Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+from backend.app.repositories.clientes_repo import filtro_busqueda
+
+_IN_CHUNK = 200
+_PAGE = 1000
+_MAX_LOTE = 5000
+
+_CAMPOS_PERFIL = "clienteid, clienteoproveedor, razonsocial, nombre, cifdni, domicilio, municipio, codigopostal"
+_CAMPOS_DIRECCION = "direccion, municipio, codigopostal"
+
+# Mismo campo que filtra el listado (GET /api/clientes?tipo=potencial)
+_TIPO = "clienteoproveedor"
+# Al convertir se actualiza tambien tipo_cliente para que no quede desfasado
+_CONVERTIDO = {_TIPO: "cliente", "tipo_cliente": "cliente", "perfil_completo": True}
+
+# None = sin comprobar; False = la base no tiene la FK clientes_direccion -> cliente
+_EMBED_DISPONIBLE = None
+
+
+def _codigo_error(e: Exception) -> Optional[str]:
+    code = getattr(e, "code", None)
+    if not code and getattr(e, "args", None) and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
+
+
 class ClienteConvertirService:
     def __init__(self, supabase):
         self.supabase = supabase
 
-    def _perfil_esta_completo(self, clienteid: int) -> bool:
+    @staticmethod
+    def _motivo_incompleto(cli: dict, direcciones: List[dict]) -> Optional[str]:
         """
         Regla CENTRAL:
-        define si un potencial puede convertirse.
+        define si un potencial puede convertirse (None = perfil completo).
         """
+        nombre = cli.get("razonsocial") or cli.get("nombre")
+        if not nombre:
+            return "Falta la razon social o el nombre"
+        if not cli.get("cifdni"):
+            return "Falta el CIF/DNI"
+
+        # Dirección fiscal
+        for row in direcciones:
+            if row.get("direccion") and row.get("municipio") and row.get("codigopostal"):
+                return None
+
+        if not (cli.get("domicilio") and cli.get("municipio") and cli.get("codigopostal")):
+            return "Falta una direccion completa (direccion, municipio y codigo postal)"
+
+        return None
+
+    def _perfil_esta_completo(self, clienteid: int) -> bool:
         # Cliente base
         cli = (
             self.supabase.table("cliente")
@@ -21,34 +68,21 @@ class ClienteConvertirService:
         if not cli:
             return False
 
-        nombre = cli.get("razonsocial") or cli.get("nombre")
-        if not nombre or not cli.get("cifdni"):
-            return False
-
-        # Dirección fiscal
-        direccion = (
+        # Direcciones: basta una completa (misma regla que convertir_lote)
+        direcciones = (
             self.supabase.table("clientes_direccion")
             .select("direccion, municipio, codigopostal")
             .eq("idtercero", clienteid)
-            .limit(1)
             .execute()
             .data
         )
 
-        if direccion:
-            row = direccion[0]
-            if row.get("direccion") and row.get("municipio") and row.get("codigopostal"):
-                return True
-
-        if not (cli.get("domicilio") and cli.get("municipio") and cli.get("codigopostal")):
-            return False
-
-        return True
+        return self._motivo_incompleto(cli, direcciones or []) is None
 
     def convertir(self, clienteid: int):
         cli = (
             self.supabase.table("cliente")
-            .select("clienteid, tipo_cliente")
+            .select(f"clienteid, {_TIPO}")
             .eq("clienteid", clienteid)
             .single()
             .execute()
@@ -58,18 +92,13 @@ class ClienteConvertirService:
         if not cli:
             raise ValueError("Cliente potencial no encontrado")
 
-        if cli.get("tipo_cliente") != "potencial":
+        if cli.get(_TIPO) != "potencial":
             raise ValueError("El cliente no es potencial")
 
         if not self._perfil_esta_completo(clienteid):
             raise ValueError("El perfil no está completo. No se puede convertir.")
 
-        self.supabase.table("cliente").update(
-            {
-                "tipo_cliente": "cliente",
-                "perfil_completo": True,
-            }
-        ).eq("clienteid", clienteid).execute()
+        self.supabase.table("cliente").update(_CONVERTIDO).eq("clienteid", clienteid).eq(_TIPO, "potencial").execute()
 
         return {
             "clienteid": clienteid,
@@ -77,3 +106,136 @@ class ClienteConvertirService:
             "perfil_completo": True,
             "mensaje": "Cliente potencial convertido correctamente",
         }
+
+    # -----------------------------
+    # Conversion masiva
+    # -----------------------------
+    def _perfiles(self, clienteids: Optional[List[int]], q: Optional[str], idgrupo: Optional[int]) -> List[dict]:
+        """
+        Clientes con sus direcciones embebidas (una select con join por
+        bloque de ids o por pagina del filtro). Sin la FK de
+        backend/sql/cliente_updated_at.sql, las direcciones van en una
+        consulta IN aparte.
+        """
+        global _EMBED_DISPONIBLE
+        campos = _CAMPOS_PERFIL
+        if _EMBED_DISPONIBLE is not False:
+            campos += f", direcciones:clientes_direccion!idtercero({_CAMPOS_DIRECCION})"
+
+        def consulta(columnas: str) -> List[dict]:
+            filas: List[dict] = []
+            if clienteids is not None:
+                for i in range(0, len(clienteids), _IN_CHUNK):
+                    trozo = clienteids[i : i + _IN_CHUNK]
+                    filas.extend(
+                        self.supabase.table("cliente").select(columnas).in_("clienteid", trozo).execute().data or []
+                    )
+                return filas
+            start = 0
+            while start < _MAX_LOTE:
+                query = self.supabase.table("cliente").select(columnas).eq(_TIPO, "potencial")
+                if q:
+                    query = query.or_(filtro_busqueda(q))
+                if idgrupo:
+                    query = query.eq("idgrupo", idgrupo)
+                lote = query.order("clienteid").range(start, min(start + _PAGE, _MAX_LOTE) - 1).execute().data or []
+                filas.extend(lote)
+                if len(lote) < _PAGE:
+                    break
+                start += _PAGE
+            return filas
+
+        try:
+            filas = consulta(campos)
+        except APIError as e:
+            if campos == _CAMPOS_PERFIL or _codigo_error(e) != "PGRST200":
+                raise
+            _EMBED_DISPONIBLE = False
+            filas = consulta(_CAMPOS_PERFIL)
+
+        if filas and "direcciones" not in filas[0]:
+            ids = [f["clienteid"] for f in filas]
+            por_cliente: Dict[int, List[dict]] = {}
+            for i in range(0, len(ids), _IN_CHUNK):
+                start = 0
+                while True:
+                    rows = (
+                        self.supabase.table("clientes_direccion")
+                        .select(f"clientes_direccionid, idtercero, {_CAMPOS_DIRECCION}")
+                        .in_("idtercero", ids[i : i + _IN_CHUNK])
+                        .order("clientes_direccionid")
+                        .range(start, start + _PAGE - 1)
+                        .execute()
+                        .data
+                        or []
+                    )
+                    for r in rows:
+                        por_cliente.setdefault(r["idtercero"], []).append(r)
+                    if len(rows) < _PAGE:
+                        break
+                    start += _PAGE
+            for f in filas:
+                f["direcciones"] = por_cliente.get(f["clienteid"], [])
+        return filas
+
+    def convertir_lote(
+        self,
+        clienteids: Optional[List[int]] = None,
+        q: Optional[str] = None,
+        idgrupo: Optional[int] = None,
+    ) -> dict:
+        """
+        Convierte una seleccion (clienteids) o todos los potenciales del
+        filtro (q, idgrupo; como mucho _MAX_LOTE): una lectura con join
+        para evaluar los perfiles y un UPDATE ... IN por bloque para los
+        que cumplen. Devuelve los convertidos y los fallidos con su motivo.
+        """
+        if clienteids is not None:
+            clienteids = list(dict.fromkeys(int(c) for c in clienteids))
+            if not clienteids:
+                raise ValueError("No hay clientes seleccionados")
+
+        filas = self._perfiles(clienteids, q, idgrupo)
+        fallidos: List[dict] = []
+        elegibles: List[int] = []
+
+        if clienteids is not None:
+            encontrados = {f["clienteid"] for f in filas}
+            fallidos.extend(
+                {"clienteid": cid, "motivo": "Cliente potencial no encontrado"} for cid in clienteids if cid not in encontrados
+            )
+
+        for cli in filas:
+            if cli.get(_TIPO) != "potencial":
+                fallidos.append({"clienteid": cli["clienteid"], "motivo": "El cliente no es potencial"})
+                continue
+            motivo = self._motivo_incompleto(cli, cli.get("direcciones") or [])
+            if motivo:
+                fallidos.append({"clienteid": cli["clienteid"], "motivo": motivo})
+            else:
+                elegibles.append(cli["clienteid"])
+
+        convertidos: List[int] = []
+        for i in range(0, len(elegibles), _IN_CHUNK):
+            trozo = elegibles[i : i + _IN_CHUNK]
+            # El filtro por tipo evita convertir dos veces si otra peticion se adelanta
+            res = (
+                self.supabase.table("cliente")
+                .update(_CONVERTIDO)
+                .in_("clienteid", trozo)
+                .eq(_TIPO, "potencial")
+                .execute()
+            )
+            hechos = {r["clienteid"] for r in (res.data or [])}
+            convertidos.extend(c for c in trozo if c in hechos)
+            fallidos.extend(
+                {"clienteid": c, "motivo": "El cliente dejo de ser potencial durante la conversion"}
+                for c in trozo
+                if c not in hechos
+            )
+
+        return {
+            "total": len(convertidos) + len(fallidos),
+            "convertidos": convertidos,
+            "fallidos": sorted(fallidos, key=lambda f: f["clienteid"]),
+        }
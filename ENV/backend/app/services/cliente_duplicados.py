@@ -0,0 +1,321 @@
+# backend/app/services/cliente_duplicados.py
+"""
+Deteccion de clientes duplicados por bloques (blocking), en lote.
+
+1) Lee la tabla cliente entera (paginada) a un DataFrame.
+2) Normaliza cifdni -> cif_normalizado con operaciones de texto
+   vectorizadas de pandas y guarda solo los que cambian (RPC
+   cliente_guardar_cif_normalizado por bloques; sin ella, fila a fila).
+3) Agrupa en bloques y solo compara dentro de cada bloque:
+   - mismo CIF normalizado;
+   - misma clave fonetica del nombre (sin acentos, signos ni forma
+     juridica, con las equivalencias del castellano b/v, c/k/qu, c/z,
+     ll/y, h muda... y las palabras ordenadas).
+   Los bloques de nombre con CIFs distintos son empresas distintas y no
+   se proponen; los de mas de _MAX_BLOQUE filas (nombres genericos) se
+   descartan.
+4) Une los bloques que comparten clientes (union-find) y devuelve una
+   propuesta de fusion por grupo: cliente principal (la ficha mas
+   completa, mejor si no es potencial) y los que se fusionarian en el.
+
+No hay comparacion por pares de toda la tabla: el coste es lineal en el
+numero de clientes (segundos para 100k). El job corre en un hilo de fondo;
+el ultimo informe queda en memoria del proceso.
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from postgrest.exceptions import APIError
+
+_PAGE = 1000
+_RPC_BLOQUE = 1000
+_MAX_BLOQUE = 50
+_MIN_CIF = 5
+_MIN_CLAVE = 4
+
+_CAMPOS = (
+    "clienteid, razonsocial, nombre, cifdni, cif_normalizado, clienteoproveedor, "
+    "codigocuenta, idgrupo, telefono, codigopostal, municipio"
+)
+_CAMPOS_COMPLETITUD = ["razonsocial", "nombre", "cifdni", "codigocuenta", "idgrupo", "telefono", "codigopostal", "municipio"]
+
+_FORMAS_JURIDICAS = (
+    r"\b(?:SOCIEDAD LIMITADA(?: UNIPERSONAL)?|SOCIEDAD ANONIMA|SOCIEDAD COOPERATIVA|COOPERATIVA|"
+    r"SLU|SLL|SLNE|SL|SAU|SAL|SA|SCOOP|SCCL|SCL|SC|CB)\b"
+)
+_PALABRAS_VACIAS = r"\b(?:DE|DEL|LA|LAS|EL|LOS|Y|E|I)\b"
+_ABREVIATURAS = [(r"\bHNOS\b", "HERMANOS"), (r"\bCIA\b", "COMPANIA")]
+# Equivalencias foneticas del castellano, en este orden
+_FONETICA = [
+    ("CH", "X"),
+    ("PH", "F"),
+    ("H", ""),
+    ("LL", "Y"),
+    ("QU", "K"),
+    (r"C(?=[EI])", "S"),
+    ("Z", "S"),
+    ("C", "K"),
+    ("V", "B"),
+    ("W", "B"),
+    (r"G(?=[EI])", "J"),
+    (r"Y\b", "I"),
+]
+
+log = logging.getLogger(__name__)
+
+
+def _valor(v):
+    return None if v is None or (not isinstance(v, str) and pd.isna(v)) else v
+
+
+def _codigo_error(e: Exception) -> Optional[str]:
+    code = getattr(e, "code", None)
+    if not code and getattr(e, "args", None) and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
+
+
+# -----------------------------
+# Normalizacion vectorizada
+# -----------------------------
+def normalizar_cifs(cifs: pd.Series) -> pd.Series:
+    """'es-b 12.345.678' -> 'B12345678'; DNIs cortos con ceros a la izquierda; basura -> None."""
+    s = cifs.fillna("").astype(str).str.upper().str.replace(r"[^0-9A-Z]", "", regex=True)
+    # Prefijo de pais del NIF-IVA
+    s = s.str.replace(r"^ES(?=[0-9A-Z]{9}$)", "", regex=True)
+    dni_corto = s.str.fullmatch(r"[0-9]{6,7}[A-Z]")
+    s = s.where(~dni_corto, s.str.zfill(9))
+    return s.where(s.str.len() >= _MIN_CIF, None)
+
+
+def clave_nombre(nombres: pd.Series) -> pd.Series:
+    """'Hermanos García-Vázquez, S.L.' y 'GARCIA BAZQUEZ HNOS SL' comparten clave si suenan igual."""
+    s = (
+        nombres.fillna("")
+        .astype(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.upper()
+        .str.replace(".", "", regex=False)
+        .str.replace(r"[^A-Z0-9]+", " ", regex=True)
+        .str.replace(_FORMAS_JURIDICAS, " ", regex=True)
+        .str.replace(_PALABRAS_VACIAS, " ", regex=True)
+    )
+    for patron, reemplazo in _ABREVIATURAS + _FONETICA:
+        s = s.str.replace(patron, reemplazo, regex=True)
+    s = s.str.replace(r"([A-Z])\1+", r"\1", regex=True)
+    return s.str.split().map(lambda palabras: " ".join(sorted(palabras)))
+
+
+# -----------------------------
+# Lectura y escritura
+# -----------------------------
+def _leer_clientes(supabase) -> pd.DataFrame:
+    filas: List[dict] = []
+    start = 0
+    while True:
+        lote = (
+            supabase.table("cliente")
+            .select(_CAMPOS)
+            .order("clienteid")
+            .range(start, start + _PAGE - 1)
+            .execute()
+            .data
+            or []
+        )
+        filas.extend(lote)
+        if len(lote) < _PAGE:
+            break
+        start += _PAGE
+    columnas = [c.strip() for c in _CAMPOS.split(",")]
+    return pd.DataFrame(filas, columns=columnas)
+
+
+def _guardar_cifs(supabase, cambios: pd.DataFrame) -> int:
+    filas = [{"clienteid": int(cid), "cif_normalizado": _valor(cif)} for cid, cif in zip(cambios["clienteid"], cambios["cif_n"])]
+    try:
+        for i in range(0, len(filas), _RPC_BLOQUE):
+            supabase.rpc("cliente_guardar_cif_normalizado", {"p_filas": filas[i : i + _RPC_BLOQUE]}).execute()
+        return len(filas)
+    except APIError as e:
+        if _codigo_error(e) != "PGRST202":
+            raise
+    # Sin backend/sql/cliente_cif_normalizado.sql: una actualizacion por cliente
+    for f in filas:
+        supabase.table("cliente").update({"cif_normalizado": f["cif_normalizado"]}).eq("clienteid", f["clienteid"]).execute()
+    return len(filas)
+
+
+# -----------------------------
+# Bloques y propuestas
+# -----------------------------
+class _Grupos:
+    """Union-find sobre posiciones del DataFrame."""
+
+    def __init__(self):
+        self.padre: Dict[int, int] = {}
+
+    def raiz(self, x: int) -> int:
+        self.padre.setdefault(x, x)
+        while self.padre[x] != x:
+            self.padre[x] = self.padre[self.padre[x]]
+            x = self.padre[x]
+        return x
+
+    def unir(self, posiciones) -> int:
+        posiciones = list(posiciones)
+        r = self.raiz(posiciones[0])
+        for p in posiciones[1:]:
+            otra = self.raiz(p)
+            if otra != r:
+                self.padre[otra] = r
+        return r
+
+
+def proponer_fusiones(df: pd.DataFrame) -> dict:
+    """
+    Propuestas de fusion para un DataFrame con las columnas de _CAMPOS e
+    indice 0..n-1. Anade al DataFrame las columnas cif_n y clave.
+    """
+    df["cif_n"] = normalizar_cifs(df["cifdni"])
+    df["clave"] = clave_nombre(df["razonsocial"].where(df["razonsocial"].notna() & (df["razonsocial"] != ""), df["nombre"]))
+
+    grupos = _Grupos()
+    motivos_por_raiz: Dict[int, set] = {}
+    pendientes: List[tuple] = []
+    omitidos = conflictos = 0
+
+    # Bloque 1: mismo CIF normalizado
+    con_cif = df[df["cif_n"].notna()]
+    con_cif = con_cif[con_cif.duplicated("cif_n", keep=False)]
+    for posiciones in con_cif.groupby("cif_n").indices.values():
+        idx = con_cif.index[posiciones]
+        if len(idx) > _MAX_BLOQUE:
+            omitidos += 1
+            continue
+        grupos.unir(idx)
+        pendientes.append((idx[0], "cif"))
+
+    # Bloque 2: misma clave fonetica de nombre (sin CIFs en conflicto)
+    con_clave = df[df["clave"].str.len() >= _MIN_CLAVE]
+    con_clave = con_clave[con_clave.duplicated("clave", keep=False)]
+    for posiciones in con_clave.groupby("clave").indices.values():
+        bloque = con_clave.iloc[posiciones]
+        if len(bloque) > _MAX_BLOQUE:
+            omitidos += 1
+            continue
+        if bloque["cif_n"].nunique(dropna=True) > 1:
+            conflictos += 1
+            continue
+        grupos.unir(bloque.index)
+        pendientes.append((bloque.index[0], "nombre"))
+
+    for pos, motivo in pendientes:
+        motivos_por_raiz.setdefault(grupos.raiz(pos), set()).add(motivo)
+
+    if not grupos.padre:
+        return {"propuestas": [], "bloques_omitidos": omitidos, "conflictos_cif": conflictos}
+
+    en_grupo = np.fromiter(grupos.padre.keys(), dtype="int64")
+    dup = df.loc[en_grupo].copy()
+    dup["grupo"] = [grupos.raiz(int(p)) for p in en_grupo]
+    rellenos = dup[_CAMPOS_COMPLETITUD].notna() & (dup[_CAMPOS_COMPLETITUD].astype(str) != "")
+    dup["_completitud"] = rellenos.sum(axis=1)
+    dup["_no_potencial"] = (dup["clienteoproveedor"].fillna("").str.lower() != "potencial").astype(int)
+    # Principal: no potencial, ficha mas completa y, a igualdad, el mas antiguo
+    dup = dup.sort_values(["grupo", "_no_potencial", "_completitud", "clienteid"], ascending=[True, False, False, True])
+
+    propuestas = []
+    for raiz, g in dup.groupby("grupo", sort=False):
+        motivos = sorted(motivos_por_raiz.get(raiz, set()))
+        confianza = "alta" if len(motivos) == 2 else ("media" if motivos == ["cif"] else "baja")
+        ids = [int(x) for x in g["clienteid"]]
+        propuestas.append(
+            {
+                "clienteid_principal": ids[0],
+                "clienteids_duplicados": ids[1:],
+                "motivos": motivos,
+                "confianza": confianza,
+                "clientes": [
+                    {
+                        "clienteid": int(r.clienteid),
+                        "razonsocial": _valor(r.razonsocial),
+                        "nombre": _valor(r.nombre),
+                        "cifdni": _valor(r.cifdni),
+                        "cif_normalizado": _valor(r.cif_n),
+                        "clienteoproveedor": _valor(r.clienteoproveedor),
+                    }
+                    for r in g.itertuples(index=False)
+                ],
+            }
+        )
+    orden = {"alta": 0, "media": 1, "baja": 2}
+    propuestas.sort(key=lambda p: (orden[p["confianza"]], -len(p["clientes"]), p["clienteid_principal"]))
+    return {"propuestas": propuestas, "bloques_omitidos": omitidos, "conflictos_cif": conflictos}
+
+
+def detectar_duplicados(supabase, guardar_cif: bool = True) -> dict:
+    df = _leer_clientes(supabase)
+    informe = proponer_fusiones(df)
+    actualizados = 0
+    if guardar_cif and len(df):
+        previo = df["cif_normalizado"].where(df["cif_normalizado"].notna() & (df["cif_normalizado"] != ""), None)
+        cambia = df["cif_n"].fillna("\0") != previo.fillna("\0")
+        if cambia.any():
+            actualizados = _guardar_cifs(supabase, df.loc[cambia, ["clienteid", "cif_n"]])
+    informe["total_clientes"] = int(len(df))
+    informe["cif_actualizados"] = actualizados
+    return informe
+
+
+# -----------------------------
+# Job en segundo plano
+# -----------------------------
+class TrabajoDuplicados:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estado = {"estado": "sin_ejecutar"}
+
+    def lanzar(self, supabase, guardar_cif: bool = True) -> dict:
+        with self._lock:
+            if self._estado.get("estado") == "en_curso":
+                return dict(self._estado)
+            anterior = self._estado
+            self._estado = {
+                "estado": "en_curso",
+                "iniciado_en": datetime.now(timezone.utc).isoformat(),
+                # El informe anterior sigue disponible mientras se calcula el nuevo
+                "informe": anterior.get("informe"),
+            }
+        threading.Thread(target=self._ejecutar, args=(supabase, guardar_cif), name="cliente_duplicados", daemon=True).start()
+        return self.estado()
+
+    def _ejecutar(self, supabase, guardar_cif: bool):
+        try:
+            informe = detectar_duplicados(supabase, guardar_cif)
+            cambios = {"estado": "terminado", "informe": informe, "error": None}
+        except Exception as e:
+            log.exception("Fallo la deteccion de clientes duplicados")
+            cambios = {"estado": "error", "error": str(e)}
+        with self._lock:
+            self._estado = {**self._estado, **cambios, "terminado_en": datetime.now(timezone.utc).isoformat()}
+
+    def estado(self) -> dict:
+        with self._lock:
+            return dict(self._estado)
+
+
+_TRABAJO = TrabajoDuplicados()
+
+
+def lanzar_deteccion(supabase, guardar_cif: bool = True) -> dict:
+    return _TRABAJO.lanzar(supabase, guardar_cif)
+
+
+def estado_deteccion() -> dict:
+    return _TRABAJO.estado()
@@ -0,0 +1,341 @@
+# backend/app/services/cliente_sugerencias.py
+"""
+Indice en memoria para el autocompletado de clientes (GET /api/clientes/suggest).
+
+Cada cliente se guarda como texto normalizado (sin acentos, minusculas,
+solo letras y numeros) de razonsocial + nombre + cifdni, y se indexa de
+dos formas:
+  - palabras ordenadas (bisect): coincidencias de palabra exacta y de
+    prefijo de palabra, que son las que mejor puntuan;
+  - trigramas -> ids: subcadenas ("arcia" en "garcia") recorriendo la
+    lista mas corta de sus trigramas y comprobando las demas.
+Los candidatos salen por niveles del token mas selectivo y se puntuan
+un numero acotado de ellos: el coste no depende del tamano de la tabla ni
+hay viajes a la base de datos.
+
+Refresco: la primera busqueda carga todo (paginado). Despues, cada
+_REFRESCO_SEGUNDOS un hilo de fondo trae solo los clientes con updated_at
+posterior al ultimo visto (backend/sql/cliente_updated_at.sql) y los
+aplica sobre una copia que sustituye al indice de golpe (si son mas de
+_MAX_DELTA, recarga entero). Las bajas no dejan rastro en updated_at:
+cada _RECARGA_SEGUNDOS se recarga entero. Sin la columna updated_at solo
+hay recargas completas.
+"""
+import bisect
+import gc
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from postgrest.exceptions import APIError
+
+_PAGE = 1000
+_REFRESCO_SEGUNDOS = 15
+_RECARGA_SEGUNDOS = 3600
+_RECARGA_SIN_VERSION_SEGUNDOS = 300
+# Por encima de tantos clientes cambiados sale mas barato recargar entero
+_MAX_DELTA = 300
+# Presupuesto por busqueda: coincidencias a puntuar (por resultado pedido)
+# y candidatos a mirar. Acota el coste aunque la consulta coincida con
+# media tabla.
+_CANDIDATOS_POR_RESULTADO = 5
+_MAX_EXAMINADOS = 2000
+# Trigramas muy comunes no aportan a la busqueda aproximada y la encarecen
+_MAX_LISTA_APROX = 5000
+
+_CAMPOS = "clienteid, razonsocial, nombre, cifdni"
+_ERRORES_ESQUEMA = {"PGRST204", "42703"}
+
+log = logging.getLogger(__name__)
+
+
+def _codigo_error(e: Exception) -> Optional[str]:
+    code = getattr(e, "code", None)
+    if not code and getattr(e, "args", None) and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """'García-López, S.L.' -> 'garcia lopez sl'."""
+    if not texto:
+        return ""
+    sin_acentos = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    # Los puntos unen (S.L. -> sl); el resto de signos separan palabras
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", sin_acentos.lower().replace(".", "")).split())
+
+
+def _trigramas(palabra: str) -> Set[str]:
+    return {palabra[i : i + 3] for i in range(len(palabra) - 2)}
+
+
+def _texto(fila: dict) -> str:
+    cif = re.sub(r"[^0-9A-Za-z]", "", fila.get("cifdni") or "")
+    return " ".join(p for p in (normalizar(fila.get("razonsocial")), normalizar(fila.get("nombre")), cif.lower()) if p)
+
+
+class IndiceClientes:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carga = threading.Lock()
+        self._filas: Dict[int, Tuple[Optional[str], Optional[str], Optional[str], str]] = {}
+        self._trigramas: Dict[str, Set[int]] = {}
+        self._palabras: List[Tuple[str, int]] = []
+        self._ultimo: Optional[str] = None
+        self._con_version = True
+        self._refrescado_en: Optional[float] = None
+        self._recargado_en: Optional[float] = None
+        self._refrescando = False
+
+    # -----------------------------
+    # Mantenimiento del indice
+    # -----------------------------
+    def _poner(self, fila: dict, ordenado: bool = True):
+        cid = int(fila["clienteid"])
+        texto = _texto(fila)
+        self._filas[cid] = (fila.get("razonsocial"), fila.get("nombre"), fila.get("cifdni"), texto)
+        trigramas = self._trigramas
+        for palabra in set(texto.split()):
+            for t in _trigramas(palabra):
+                ids = trigramas.get(t)
+                if ids is None:
+                    trigramas[t] = ids = set()
+                ids.add(cid)
+            if ordenado:
+                bisect.insort(self._palabras, (palabra, cid))
+            else:
+                self._palabras.append((palabra, cid))
+
+    def _quitar(self, cid: int):
+        previa = self._filas.pop(cid, None)
+        if not previa:
+            return
+        for palabra in set(previa[3].split()):
+            for t in _trigramas(palabra):
+                ids = self._trigramas.get(t)
+                if ids is not None:
+                    ids.discard(cid)
+                    if not ids:
+                        del self._trigramas[t]
+            i = bisect.bisect_left(self._palabras, (palabra, cid))
+            if i < len(self._palabras) and self._palabras[i] == (palabra, cid):
+                del self._palabras[i]
+
+    def _leer(self, supabase, desde: Optional[str]) -> List[dict]:
+        campos = f"{_CAMPOS}, updated_at" if self._con_version else _CAMPOS
+        filas: List[dict] = []
+        start = 0
+        while True:
+            q = supabase.table("cliente").select(campos)
+            if desde:
+                # gte: las filas con el mismo updated_at que la ultima vista se reaplican
+                q = q.gte("updated_at", desde).order("updated_at").order("clienteid")
+            else:
+                q = q.order("clienteid")
+            try:
+                lote = q.range(start, start + _PAGE - 1).execute().data or []
+            except APIError as e:
+                if not self._con_version or _codigo_error(e) not in _ERRORES_ESQUEMA:
+                    raise
+                # Base sin cliente.updated_at: solo recargas completas
+                self._con_version = False
+                return self._leer(supabase, None)
+            filas.extend(lote)
+            if len(lote) < _PAGE:
+                return filas
+            start += _PAGE
+
+    def recargar(self, supabase):
+        filas = self._leer(supabase, None)
+        nuevo = IndiceClientes()
+        # Millones de sets pequenos: sin pausas del recolector mientras se construyen
+        gc_activo = gc.isenabled()
+        gc.disable()
+        try:
+            for f in filas:
+                nuevo._poner(f, ordenado=False)
+        finally:
+            if gc_activo:
+                gc.enable()
+        nuevo._palabras.sort()
+        ultimo = max((f.get("updated_at") for f in filas if f.get("updated_at")), default=None)
+        ahora = time.monotonic()
+        with self._lock:
+            self._filas, self._trigramas, self._palabras = nuevo._filas, nuevo._trigramas, nuevo._palabras
+            self._ultimo = ultimo
+            self._refrescado_en = self._recargado_en = ahora
+
+    def refrescar(self, supabase):
+        """Aplica los clientes cambiados desde la ultima carga (o recarga si toca)."""
+        periodo = _RECARGA_SEGUNDOS if self._con_version else _RECARGA_SIN_VERSION_SEGUNDOS
+        vencida = time.monotonic() - (self._recargado_en or 0) >= periodo
+        if vencida or (self._con_version and self._ultimo is None):
+            self.recargar(supabase)
+            return
+        filas = self._leer(supabase, self._ultimo) if self._con_version else []
+        if len(filas) > _MAX_DELTA:
+            self.recargar(supabase)
+            return
+        if not filas:
+            self._refrescado_en = time.monotonic()
+            return
+
+        # Como en recargar: se construye una copia fuera del lock y se cambia
+        # de golpe. Solo este hilo escribe el indice (bajo _carga), asi que
+        # la copia no se queda atrasada mientras se construye.
+        nuevo = IndiceClientes()
+        nuevo._filas = dict(self._filas)
+        nuevo._trigramas = dict(self._trigramas)
+        nuevo._palabras = list(self._palabras)
+        # Los sets de trigramas siguen compartidos con el indice vivo: se
+        # copian los que va a tocar el delta antes de modificarlos
+        tocados: Set[str] = set()
+        for f in filas:
+            previa = self._filas.get(int(f["clienteid"]))
+            for palabra in set(_texto(f).split()) | set(previa[3].split() if previa else ()):
+                tocados |= _trigramas(palabra)
+        for t in tocados:
+            if t in nuevo._trigramas:
+                nuevo._trigramas[t] = set(nuevo._trigramas[t])
+        for f in filas:
+            nuevo._quitar(int(f["clienteid"]))
+        for f in filas:
+            nuevo._poner(f, ordenado=False)
+        nuevo._palabras.sort()
+
+        ultimo = max([self._ultimo] + [f["updated_at"] for f in filas if f.get("updated_at")])
+        with self._lock:
+            self._filas, self._trigramas, self._palabras = nuevo._filas, nuevo._trigramas, nuevo._palabras
+            self._ultimo = ultimo
+            self._refrescado_en = time.monotonic()
+
+    def asegurar(self, supabase):
+        """Carga sincrona la primera vez; despues refresca en segundo plano si toca."""
+        if self._refrescado_en is None:
+            with self._carga:
+                if self._refrescado_en is None:
+                    self.recargar(supabase)
+            return
+        if self._refrescando or time.monotonic() - self._refrescado_en < _REFRESCO_SEGUNDOS:
+            return
+        with self._lock:
+            if self._refrescando:
+                return
+            self._refrescando = True
+        threading.Thread(target=self._refrescar_fondo, args=(supabase,), name="cliente_sugerencias", daemon=True).start()
+
+    def _refrescar_fondo(self, supabase):
+        try:
+            with self._carga:
+                self.refrescar(supabase)
+        except Exception:
+            log.exception("No se pudo refrescar el indice de clientes")
+            # No reintentar en bucle: esperar al siguiente periodo
+            self._refrescado_en = time.monotonic()
+        finally:
+            self._refrescando = False
+
+    # -----------------------------
+    # Busqueda
+    # -----------------------------
+    def _selectividad(self, tok: str) -> int:
+        """Tamano estimado de las coincidencias de un token (la lista mas corta)."""
+        if len(tok) < 3:
+            return len(self._filas)
+        return min((len(self._trigramas.get(t, ())) for t in _trigramas(tok)), default=0)
+
+    def _candidatos(self, tok: str) -> Iterator[int]:
+        """
+        Ids que contienen `tok`, por niveles: palabra exacta, prefijo de
+        palabra y (tokens de 3+ letras) subcadena via trigramas. Es un
+        generador: buscar() deja de pedir cuando ya tiene bastantes.
+        """
+        vistos: Set[int] = set()
+        i = bisect.bisect_left(self._palabras, (tok, -1))
+        while i < len(self._palabras) and self._palabras[i][0].startswith(tok):
+            cid = self._palabras[i][1]
+            i += 1
+            if cid not in vistos:
+                vistos.add(cid)
+                yield cid
+        if len(tok) < 3:
+            return
+        listas = sorted((self._trigramas.get(t, set()) for t in _trigramas(tok)), key=len)
+        for cid in listas[0]:
+            if cid not in vistos and all(cid in otra for otra in listas[1:]):
+                yield cid
+
+    def _aproximados(self, tokens: List[str], excluir: Set[int], limite: int) -> List[Tuple[float, int]]:
+        """Coincidencias por trigramas compartidos (erratas): al menos la mitad de los de la consulta."""
+        tris = set().union(*(_trigramas(t) for t in tokens if len(t) >= 4)) if tokens else set()
+        if not tris:
+            return []
+        votos: Counter = Counter()
+        for t in tris:
+            ids = self._trigramas.get(t)
+            if ids and len(ids) <= _MAX_LISTA_APROX:
+                votos.update(ids)
+        minimo = max(2, (len(tris) + 1) // 2)
+        return [
+            (0.5 * n / len(tris), cid)
+            for cid, n in votos.most_common(limite * 4)
+            if n >= minimo and cid not in excluir
+        ][:limite]
+
+    def buscar(self, q: str, limite: int = 20) -> List[dict]:
+        consulta = normalizar(q)
+        tokens = consulta.split()
+        if not tokens:
+            return []
+        with self._lock:
+            # El token mas selectivo genera candidatos; el resto solo se verifica
+            tokens.sort(key=self._selectividad)
+            puntuados: List[Tuple[float, int]] = []
+            for examinados, cid in enumerate(self._candidatos(tokens[0])):
+                if len(puntuados) >= limite * _CANDIDATOS_POR_RESULTADO or examinados >= _MAX_EXAMINADOS:
+                    break
+                texto = self._filas[cid][3]
+                if not all(tok in texto for tok in tokens[1:]):
+                    continue
+                palabras = texto.split()
+                puntos = 0
+                for tok in tokens:
+                    if tok in palabras:
+                        puntos += 3
+                    elif any(p.startswith(tok) for p in palabras):
+                        puntos += 2
+                    else:
+                        puntos += 1
+                # Exactitud por palabra y, a igualdad, textos mas cortos (mas parecidos)
+                score = 0.8 * puntos / (3 * len(tokens)) + 0.2 * min(1.0, len(consulta) / len(texto))
+                if texto.startswith(consulta):
+                    score = min(1.0, score + 0.1)
+                puntuados.append((score, cid))
+            if len(puntuados) < limite:
+                puntuados.extend(self._aproximados(tokens, {cid for _, cid in puntuados}, limite - len(puntuados)))
+            puntuados.sort(key=lambda x: (-x[0], self._filas[x[1]][3]))
+            return [
+                {
+                    "clienteid": cid,
+                    "razonsocial": self._filas[cid][0],
+                    "nombre": self._filas[cid][1],
+                    "cifdni": self._filas[cid][2],
+                    "score": round(score, 3),
+                }
+                for score, cid in puntuados[:limite]
+            ]
+
+    def __len__(self) -> int:
+        return len(self._filas)
+
+
+_INDICE = IndiceClientes()
+
+
+def sugerir_clientes(supabase, q: str, limite: int = 20) -> List[dict]:
+    _INDICE.asegurar(supabase)
+    return _INDICE.buscar(q, limite)
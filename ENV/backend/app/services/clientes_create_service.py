@@ -1,17 +1,29 @@
+import itertools
 import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
 from fastapi import HTTPException
-from backend.app.schemas.cliente_create import ClienteCreateIn, ClienteCreateOut
+from backend.app.schemas.cliente_create import (
+    ClienteBatchResultado,
+    ClienteContactoIn,
+    ClienteCreateIn,
+    ClienteCreateOut,
+    ClienteDireccionIn,
+    ClientesBatchOut,
+)
+
+_CHUNK = 500
+# Insertado pero sin fila de vuelta: no se reintenta para no duplicarlo
+_SIN_DEVOLVER = "El cliente se insertó pero la base no lo devolvió; revísalo antes de reintentar."
 
 
 class ClientesCreateService:
     def __init__(self, supabase):
         self.supabase = supabase
 
-    def crear(self, data: ClienteCreateIn) -> ClienteCreateOut:
-        if not (data.razonsocial or data.nombre):
-            raise HTTPException(status_code=400, detail="Razonsocial o nombre es obligatorio.")
-
-        cliente_payload = {
+    @staticmethod
+    def _cliente_payload(data: ClienteCreateIn) -> dict:
+        return {
             "codigocuenta": data.codigocuenta,
             "codigoclienteoproveedor": data.codigoclienteoproveedor,
             "clienteoproveedor": data.clienteoproveedor,
@@ -40,6 +52,26 @@ class ClientesCreateService:
             "idgrupo": data.idgrupo,
         }
 
+    @staticmethod
+    def _direccion_row(d: ClienteDireccionIn, clienteid: int, origen_id: int) -> dict:
+        payload = d.dict(exclude_none=True)
+        payload["idtercero"] = payload.get("idtercero") or clienteid
+        if not payload.get("direccion_origen_id"):
+            payload["direccion_origen_id"] = origen_id
+        return payload
+
+    @staticmethod
+    def _contacto_row(c: ClienteContactoIn, clienteid: int) -> dict:
+        row = c.dict(exclude_none=True)
+        row["clienteid"] = clienteid
+        return row
+
+    def crear(self, data: ClienteCreateIn) -> ClienteCreateOut:
+        if not (data.razonsocial or data.nombre):
+            raise HTTPException(status_code=400, detail="Razonsocial o nombre es obligatorio.")
+
+        cliente_payload = self._cliente_payload(data)
+
         res = self.supabase.table("cliente").insert(cliente_payload).execute()
         if not res.data:
             raise HTTPException(status_code=500, detail="No se pudo crear el cliente.")
@@ -47,17 +79,134 @@ class ClientesCreateService:
 
         if data.direcciones:
             for d in data.direcciones:
-                payload = d.dict(exclude_none=True)
-                payload["idtercero"] = payload.get("idtercero") or clienteid
-                if not payload.get("direccion_origen_id"):
-                    payload["direccion_origen_id"] = int(time.time() * 1000)
+                payload = self._direccion_row(d, clienteid, int(time.time() * 1000))
                 self.supabase.table("clientes_direccion").insert(payload).execute()
 
         if data.contactos:
             for c in data.contactos:
-                row = c.dict(exclude_none=True)
-                row["clienteid"] = clienteid
+                row = self._contacto_row(c, clienteid)
                 self.supabase.table("cliente_contacto").insert(row).execute()
 
         msg = "Cliente creado correctamente."
         return ClienteCreateOut(clienteid=clienteid, mensaje=msg)
+
+    # -----------------------------
+    # Alta masiva (POST /api/clientes:batch)
+    # -----------------------------
+    def crear_lote(self, clientes: List[ClienteCreateIn]) -> ClientesBatchOut:
+        """
+        Alta de muchos clientes con sus contactos y direcciones: por cada
+        bloque de _CHUNK clientes, un INSERT de cliente, uno de direcciones
+        y uno de contactos (los hijos llevan el id devuelto por el primero).
+        Si un INSERT en bloque falla, ese bloque se repite fila a fila para
+        saber que filas fallan; el resto del lote sigue adelante.
+        Devuelve un resultado por cliente, en el orden recibido.
+        """
+        resultados = [ClienteBatchResultado(indice=i, ok=False) for i in range(len(clientes))]
+        # direccion_origen_id distinto por fila aunque se creen en el mismo milisegundo
+        origen = itertools.count(int(time.time() * 1000))
+        validos: List[int] = []
+        for i, data in enumerate(clientes):
+            if data.razonsocial or data.nombre:
+                validos.append(i)
+            else:
+                resultados[i].error = "Razonsocial o nombre es obligatorio."
+
+        for k in range(0, len(validos), _CHUNK):
+            bloque = validos[k : k + _CHUNK]
+            ids = self._insertar_clientes([self._cliente_payload(clientes[i]) for i in bloque])
+            creados = []
+            for i, (clienteid, error) in zip(bloque, ids):
+                if clienteid is None:
+                    resultados[i].error = error or "No se pudo crear el cliente."
+                    continue
+                resultados[i].ok = True
+                resultados[i].clienteid = clienteid
+                creados.append(i)
+            self._insertar_hijos(clientes, creados, resultados, origen)
+
+        creados_total = sum(1 for r in resultados if r.ok)
+        return ClientesBatchOut(
+            total=len(clientes),
+            creados=creados_total,
+            errores=len(clientes) - creados_total,
+            resultados=resultados,
+        )
+
+    def _insertar_clientes(self, payloads: List[dict]) -> List[Tuple[Optional[int], Optional[str]]]:
+        """[(clienteid, error)] en el orden de payloads."""
+        try:
+            filas = self.supabase.table("cliente").insert(payloads).execute().data or []
+        except Exception:
+            filas = None
+        if filas is not None:
+            # El INSERT se hizo aunque devuelva menos filas (RLS, returning=minimal):
+            # repetirlo fila a fila duplicaria el bloque; los no devueltos se informan
+            return self._emparejar(payloads, filas)
+        # El bloque fallo entero (una fila invalida tumba el INSERT): fila a fila
+        out = []
+        for p in payloads:
+            try:
+                res = self.supabase.table("cliente").insert(p).execute().data or []
+                out.append((res[0]["clienteid"], None) if res else (None, _SIN_DEVOLVER))
+            except Exception as e:
+                out.append((None, getattr(e, "message", None) or str(e)))
+        return out
+
+    @staticmethod
+    def _emparejar(payloads: List[dict], filas: List[dict]) -> List[Tuple[Optional[int], Optional[str]]]:
+        """
+        PostgREST devuelve las filas en el orden del INSERT; se comprueba con
+        (razonsocial, nombre, cifdni) y, si no cuadra o faltan filas, se
+        empareja por esa huella.
+        """
+
+        def huella(r: dict):
+            return (r.get("razonsocial"), r.get("nombre"), r.get("cifdni"))
+
+        if len(filas) == len(payloads) and all(huella(p) == huella(f) for p, f in zip(payloads, filas)):
+            return [(f["clienteid"], None) for f in filas]
+        por_huella: Dict[tuple, List[int]] = {}
+        for f in filas:
+            por_huella.setdefault(huella(f), []).append(f["clienteid"])
+        out = []
+        for p in payloads:
+            ids = por_huella.get(huella(p))
+            out.append((ids.pop(0), None) if ids else (None, _SIN_DEVOLVER))
+        return out
+
+    def _insertar_hijos(
+        self,
+        clientes: List[ClienteCreateIn],
+        creados: List[int],
+        resultados: List[ClienteBatchResultado],
+        origen: Iterator[int],
+    ):
+        direcciones: List[Tuple[int, dict]] = []
+        contactos: List[Tuple[int, dict]] = []
+        for i in creados:
+            clienteid = resultados[i].clienteid
+            for d in clientes[i].direcciones or []:
+                direcciones.append((i, self._direccion_row(d, clienteid, next(origen))))
+            for c in clientes[i].contactos or []:
+                contactos.append((i, self._contacto_row(c, clienteid)))
+
+        for tabla, filas, campo in (
+            ("clientes_direccion", direcciones, "direcciones"),
+            ("cliente_contacto", contactos, "contactos"),
+        ):
+            for k in range(0, len(filas), _CHUNK):
+                trozo = filas[k : k + _CHUNK]
+                try:
+                    self.supabase.table(tabla).insert([row for _, row in trozo]).execute()
+                    for i, _ in trozo:
+                        setattr(resultados[i], campo, getattr(resultados[i], campo) + 1)
+                    continue
+                except Exception:
+                    pass
+                for i, row in trozo:
+                    try:
+                        self.supabase.table(tabla).insert(row).execute()
+                        setattr(resultados[i], campo, getattr(resultados[i], campo) + 1)
+                    except Exception as e:
+                        resultados[i].avisos.append(f"{tabla}: {getattr(e, 'message', None) or e}")
@@ -1,15 +1,14 @@
 # backend/app/services/clientes_service.py
 import math
-from typing import Optional
+from typing import List, Optional
 
 from backend.app.schemas.cliente import (
-    ClienteListResponse,
     ClienteOut,
     ClienteDetalle,
     ClienteDireccion,
     ClienteContacto,
 )
-from backend.app.repositories.clientes_repo import ClientesRepository
+from backend.app.repositories.clientes_repo import CAMPOS_CLIENTE, CAMPOS_LISTA, ClientesRepository
 from backend.app.schemas.cliente_create import ClienteCreateIn
 
 
@@ -17,6 +16,22 @@ class ClientesService:
     def __init__(self, repo: ClientesRepository):
         self.repo = repo
 
+    @staticmethod
+    def campos_lista(fields: Optional[str]) -> List[str]:
+        """
+        Columnas pedidas con fields= ("razonsocial,cifdni", "*" = todas).
+        Sin fields, la proyeccion ligera del listado. clienteid siempre va.
+        """
+        if not fields:
+            return list(CAMPOS_LISTA)
+        pedidos = [f.strip() for f in fields.split(",") if f.strip()]
+        if "*" in pedidos:
+            return list(CAMPOS_CLIENTE)
+        desconocidos = [f for f in pedidos if f not in CAMPOS_CLIENTE]
+        if desconocidos:
+            raise ValueError(f"Campos no validos: {', '.join(desconocidos)}")
+        return list(dict.fromkeys(["clienteid", *pedidos]))
+
     def listar_clientes(
         self,
         q: Optional[str],
@@ -26,8 +41,17 @@ class ClientesService:
         page_size: int,
         sort_field: str,
         sort_dir: str,
-    ) -> ClienteListResponse:
-        clientes_raw, total = self.repo.get_clientes(
+        cursor: Optional[str] = None,
+        count: str = "exact",
+        fields: Optional[str] = None,
+    ) -> dict:
+        """
+        Pagina de clientes como dict plano (forma de ClienteListResponse).
+        Las filas salen tal cual de PostgREST con solo las columnas pedidas:
+        sin un ClienteOut por fila, la API las serializa directamente.
+        """
+        campos = self.campos_lista(fields)
+        clientes_raw, total, next_cursor = self.repo.get_clientes(
             q=q,
             tipo=tipo,
             idgrupo=idgrupo,
@@ -35,54 +59,21 @@ class ClientesService:
             page_size=page_size,
             sort_field=sort_field,
             sort_dir=sort_dir,
+            cursor=cursor,
+            count=count,
+            campos=campos,
         )
 
-        clientes: list[ClienteOut] = []
-
-        for c in clientes_raw:
-            data = dict(c) if isinstance(c, dict) else c.__dict__
-
-            cliente = ClienteOut(
-                clienteid=data.get("clienteid"),
-                codigocuenta=data.get("codigocuenta"),
-                codigoclienteoproveedor=data.get("codigoclienteoproveedor"),
-                clienteoproveedor=data.get("clienteoproveedor"),
-                razonsocial=data.get("razonsocial"),
-                nombre=data.get("nombre"),
-                cifdni=data.get("cifdni"),
-                cif_normalizado=data.get("cif_normalizado"),
-                viapublica=data.get("viapublica"),
-                domicilio=data.get("domicilio"),
-                codigopostal=data.get("codigopostal"),
-                provincia=data.get("provincia"),
-                municipio=data.get("municipio"),
-                telefono=data.get("telefono"),
-                telefono2=data.get("telefono2"),
-                telefono3=data.get("telefono3"),
-                fax=data.get("fax"),
-                iban=data.get("iban"),
-                codigobanco=data.get("codigobanco"),
-                codigoagencia=data.get("codigoagencia"),
-                dc=data.get("dc"),
-                ccc=data.get("ccc"),
-                codigotipoefecto=data.get("codigotipoefecto"),
-                codigocuentaefecto=data.get("codigocuentaefecto"),
-                codigocuentaimpagado=data.get("codigocuentaimpagado"),
-                remesahabitual=data.get("remesahabitual"),
-                idgrupo=data.get("idgrupo"),
-            )
+        total_pages = max(1, math.ceil(total / page_size)) if total is not None else None
 
-            clientes.append(cliente)
-
-        total_pages = max(1, math.ceil(total / page_size))
-
-        return ClienteListResponse(
-            data=clientes,
-            total=total,
-            total_pages=total_pages,
-            page=page,
-            page_size=page_size,
-        )
+        return {
+            "data": clientes_raw or [],
+            "total": total,
+            "total_pages": total_pages,
+            "page": page,
+            "page_size": page_size,
+            "next_cursor": next_cursor,
+        }
 
     def obtener_detalle(self, clienteid: int) -> ClienteDetalle:
         raw = self.repo.get_cliente_detalle(clienteid)
@@ -118,6 +109,7 @@ class ClientesService:
             codigocuentaimpagado=cli.get("codigocuentaimpagado"),
             remesahabitual=cli.get("remesahabitual"),
             idgrupo=cli.get("idgrupo"),
+            updated_at=cli.get("updated_at"),
         )
 
         return ClienteDetalle(
@@ -127,6 +119,10 @@ class ClientesService:
             contacto_principal=ClienteContacto(**raw["contacto_principal"]) if raw.get("contacto_principal") else None,
         )
 
+    def version_detalle(self, clienteid: int) -> Optional[str]:
+        """updated_at del cliente sin leer la ficha (para revalidar con 304)."""
+        return self.repo.get_cliente_version(clienteid)
+
     def actualizar_cliente(self, clienteid: int, body: ClienteCreateIn) -> dict:
         data = body.dict(exclude_none=True)
         data.pop("contactos", None)
@@ -0,0 +1,35 @@
+# backend/app/services/impuesto_resolver.py
+"""
+Cache de proceso del resolver de impuestos para el motor del backend.
+ImpuestoResolver vive en comun/impuesto_resolver.py (compartido con la UI).
+"""
+from comun.impuesto_resolver import ImpuestoResolver, ImpuestoResolverCache
+
+
+def cargar_impuestos(supabase) -> ImpuestoResolver:
+    filas = (
+        supabase.table("impuesto")
+        .select(
+            "impuestoid, impuesto_nombre, tasa_pct, ambito, producto_tipoid, habilitado, fecha_inicio, fecha_fin"
+        )
+        .eq("habilitado", True)
+        .execute()
+        .data
+        or []
+    )
+    return ImpuestoResolver(filas)
+
+
+_CACHE = ImpuestoResolverCache(cargar_impuestos)
+
+
+def get_impuesto_resolver(supabase) -> ImpuestoResolver:
+    return _CACHE.get(supabase)
+
+
+def recargar_impuestos(supabase) -> ImpuestoResolver:
+    return _CACHE.recargar(supabase)
+
+
+def invalidar_impuestos():
+    _CACHE.invalidar()
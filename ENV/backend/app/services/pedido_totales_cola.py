@@ -0,0 +1,127 @@
+# backend/app/services/pedido_totales_cola.py
+"""
+Cola en segundo plano para refrescar pedido_totales en bloque.
+
+Las lecturas de totales (GET /api/pedidos/totales) nunca recalculan: leen
+pedido_totales y encolan los pedidos cuya fila esta pendiente (sin fila,
+sin recalcular o con lineas cambiadas; ver backend/sql/pedido_totales.sql).
+Que un pedido esta pendiente se sabe por la fila, no por esta cola, asi que
+todos los workers responden lo mismo. Un hilo de fondo junta lo encolado
+durante _ESPERA_SEGUNDOS y lo recalcula en lotes de _LOTE pedidos con
+PedidosService.recalcular_totales_lote (consultas IN + precios por lotes +
+un upsert), no pedido a pedido.
+
+Si un lote falla se parte en mitades hasta aislar los pedidos que fallan;
+esos se reintentan con espera creciente (_REINTENTO_SEGUNDOS, doblando
+hasta _REINTENTO_MAX_SEGUNDOS); su fila sigue pendiente mientras tanto.
+
+La cola vive en memoria del proceso: si se reinicia, o si otro worker
+recibe la lectura, los pedidos pendientes se encolan en la siguiente.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_LOTE = 200
+_ESPERA_SEGUNDOS = 0.5
+_REINTENTO_SEGUNDOS = 2.0
+_REINTENTO_MAX_SEGUNDOS = 300.0
+
+log = logging.getLogger(__name__)
+
+
+class ColaTotales:
+    def __init__(self, lote: int = _LOTE, espera: float = _ESPERA_SEGUNDOS):
+        self.lote = lote
+        self.espera = espera
+        self._pendientes: Set[int] = set()
+        self._en_curso: Set[int] = set()
+        # pedidoid -> (intentos fallidos, instante del proximo intento)
+        self._fallidos: Dict[int, Tuple[int, float]] = {}
+        self._supabase = None
+        self._cond = threading.Condition()
+        self._hilo: Optional[threading.Thread] = None
+
+    def encolar(self, supabase, pedido_ids: Iterable[int]):
+        ids = {int(i) for i in pedido_ids if i}
+        if not ids:
+            return
+        with self._cond:
+            self._supabase = supabase
+            # Los que esperan reintento siguen su espera; los que se estan
+            # recalculando no se repiten (si cambian, la fila sigue pendiente)
+            self._pendientes |= ids - set(self._fallidos) - self._en_curso
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="pedido_totales_cola", daemon=True)
+                self._hilo.start()
+            self._cond.notify()
+
+    def _reintentos_vencidos(self) -> Optional[float]:
+        """Pasa a pendientes los fallidos cuyo reintento toca; devuelve la espera hasta el siguiente."""
+        ahora = time.monotonic()
+        proximo = None
+        for pid, (_, cuando) in list(self._fallidos.items()):
+            if cuando <= ahora:
+                self._pendientes.add(pid)
+            else:
+                proximo = cuando - ahora if proximo is None else min(proximo, cuando - ahora)
+        return proximo
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                while True:
+                    espera = self._reintentos_vencidos()
+                    if self._pendientes:
+                        break
+                    self._cond.wait(espera)
+            # Dejar que se acumulen ediciones seguidas antes de recalcular
+            time.sleep(self.espera)
+            with self._cond:
+                lote = set(sorted(self._pendientes)[: self.lote])
+                self._pendientes -= lote
+                self._en_curso = lote
+                supabase = self._supabase
+            fallidos: Set[int] = set()
+            try:
+                fallidos = self._procesar_aislando(supabase, sorted(lote))
+            finally:
+                with self._cond:
+                    self._en_curso = set()
+                    ahora = time.monotonic()
+                    for pid in lote:
+                        if pid in fallidos:
+                            intentos = self._fallidos.get(pid, (0, 0.0))[0] + 1
+                            pausa = min(_REINTENTO_SEGUNDOS * 2 ** (intentos - 1), _REINTENTO_MAX_SEGUNDOS)
+                            self._fallidos[pid] = (intentos, ahora + pausa)
+                        else:
+                            self._fallidos.pop(pid, None)
+
+    def _procesar_aislando(self, supabase, pedido_ids: List[int]) -> Set[int]:
+        """Procesa el lote; si falla, sus mitades por separado. Devuelve los pedidos que fallan solos."""
+        try:
+            self._procesar(supabase, pedido_ids)
+            return set()
+        except Exception:
+            if len(pedido_ids) == 1:
+                log.exception("No se pudieron recalcular los totales del pedido %s", pedido_ids[0])
+                return set(pedido_ids)
+        mitad = len(pedido_ids) // 2
+        return self._procesar_aislando(supabase, pedido_ids[:mitad]) | self._procesar_aislando(
+            supabase, pedido_ids[mitad:]
+        )
+
+    def _procesar(self, supabase, pedido_ids):
+        # Import diferido: pedidos_service importa este modulo
+        from backend.app.repositories.pedidos_repo import PedidosRepository
+        from backend.app.services.pedidos_service import PedidosService
+
+        PedidosService(PedidosRepository(supabase)).recalcular_totales_lote(pedido_ids)
+
+
+_COLA = ColaTotales()
+
+
+def encolar_totales(supabase, pedido_ids: Iterable[int]):
+    _COLA.encolar(supabase, pedido_ids)
@@ -1,6 +1,6 @@
 import math
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, List, Optional
 
 from backend.app.repositories.pedidos_repo import PedidosRepository
 from backend.app.schemas.pedido import (
@@ -9,14 +9,21 @@ from backend.app.schemas.pedido import (
     PedidoDetalleOut,
     PedidoLineaOut,
     PedidoTotalesOut,
+    PedidoTotalesLoteOut,
     PedidoObservacionIn,
     PedidoCreateIn,
     PedidoUpdateIn,
     PedidoLineaCreate,
+    PedidoLineaSyncIn,
+    PedidoLineasSyncOut,
     PedidoCatalogos,
     CatalogoItem,
 )
-from backend.app.services.precio_engine import calcular_precio_linea
+from backend.app.services.pedido_totales_cola import encolar_totales
+from backend.app.services.precio_engine import calcular_precios_lineas
+
+
+_CAMPOS_LINEA = ("productoid", "nombre_producto", "cantidad", "precio_unitario", "descuento_pct")
 
 
 class PedidosService:
@@ -31,16 +38,19 @@ class PedidosService:
         filtros: dict,
         page: int,
         page_size: int,
+        cursor: Optional[str] = None,
+        count: str = "exact",
     ) -> PedidoListResponse:
-        rows, total = self.repo.listar(filtros, page, page_size)
+        rows, total, next_cursor = self.repo.listar(filtros, page, page_size, cursor=cursor, count=count)
         data = [PedidoOut(**r) for r in rows]
-        total_pages = max(1, math.ceil((total or 0) / page_size))
+        total_pages = max(1, math.ceil(total / page_size)) if total is not None else None
         return PedidoListResponse(
             data=data,
             total=total,
             total_pages=total_pages,
             page=page,
             page_size=page_size,
+            next_cursor=next_cursor,
         )
 
     # -----------------------------
@@ -77,10 +87,66 @@ class PedidosService:
     def agregar_linea(self, pedidoid: int, data: PedidoLineaCreate) -> int:
         payload = data.dict(exclude_none=True)
         payload["pedidoid"] = pedidoid
-        return self.repo.insertar_linea(payload)
+        detalleid = self.repo.insertar_linea(payload)
+        encolar_totales(self.repo.supabase, [pedidoid])
+        return detalleid
 
     def borrar_linea(self, pedidoid: int, detalleid: int):
         self.repo.borrar_linea(detalleid)
+        encolar_totales(self.repo.supabase, [pedidoid])
+
+    def sincronizar_lineas(self, pedidoid: int, lineas: List[PedidoLineaSyncIn]) -> PedidoLineasSyncOut:
+        """
+        Deja pedido_detalle igual que `lineas`: las que no traen id se
+        insertan, las que cambian se actualizan y las que faltan se borran
+        (como mucho tres sentencias). Los totales se recalculan una vez.
+        """
+        if not self.repo.obtener(pedidoid):
+            raise ValueError("Pedido no encontrado")
+
+        actuales = {l["pedido_detalleid"]: l for l in self.repo.lineas(pedidoid)}
+        ids = [l.pedido_detalleid for l in lineas if l.pedido_detalleid is not None]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Hay líneas repetidas")
+        ajenas = [i for i in ids if i not in actuales]
+        if ajenas:
+            raise ValueError(f"Las líneas {ajenas} no pertenecen al pedido {pedidoid}")
+
+        nuevas, cambiadas = [], []
+        for l in lineas:
+            fila = {campo: getattr(l, campo) for campo in _CAMPOS_LINEA}
+            fila["pedidoid"] = pedidoid
+            if l.pedido_detalleid is None:
+                nuevas.append(fila)
+            elif self._linea_cambia(actuales[l.pedido_detalleid], fila):
+                cambiadas.append({"pedido_detalleid": l.pedido_detalleid, **fila})
+        borrar = [i for i in actuales if i not in set(ids)]
+
+        self.repo.sincronizar_lineas(pedidoid, nuevas, cambiadas, borrar)
+
+        totales = None
+        if nuevas or cambiadas or borrar:
+            filas = self.recalcular_totales_lote([pedidoid])
+            totales = PedidoTotalesOut(**filas[0]) if filas else None
+
+        return PedidoLineasSyncOut(
+            insertadas=len(nuevas),
+            actualizadas=len(cambiadas),
+            borradas=len(borrar),
+            sin_cambios=len(ids) - len(cambiadas),
+            totales=totales,
+        )
+
+    @staticmethod
+    def _linea_cambia(actual: dict, fila: dict) -> bool:
+        for campo in _CAMPOS_LINEA:
+            a, b = actual.get(campo), fila.get(campo)
+            if campo in ("cantidad", "precio_unitario", "descuento_pct"):
+                if round(float(a or 0), 6) != round(float(b or 0), 6):
+                    return True
+            elif (a or None) != (b or None):
+                return True
+        return False
 
     # -----------------------------
     # Totales
@@ -105,35 +171,121 @@ class PedidosService:
         if not ped:
             raise ValueError("Pedido no encontrado")
 
+        # La version se lee antes que las lineas (ver _pendiente)
+        version = self._version_lineas(self.repo.totales(pedidoid) or {})
         lineas = self.repo.lineas(pedidoid)
         if not lineas:
             raise ValueError("No hay líneas en el pedido")
 
-        base_total = iva_total = 0.0
-        for l in lineas:
-            engine = calcular_precio_linea(
-                supabase=self.repo.supabase,
-                clienteid=ped.get("clienteid"),
-                productoid=l.productoid,
-                precio_base_unit=l.precio_unitario,
-                cantidad=l.cantidad or 1,
+        precios = self._precios(lineas, lambda l: ped.get("clienteid"))
+        payload = self._payload_totales(lineas, precios, use_iva, gastos_envio, envio_sin_cargo)
+        self.repo.actualizar_totales(pedidoid, {**payload, "version_calculada": version})
+        return PedidoTotalesOut(pedidoid=pedidoid, **payload)
+
+    def totales_lote(self, pedido_ids: List[int]) -> PedidoTotalesLoteOut:
+        """
+        Totales guardados de muchos pedidos en una consulta. No recalcula:
+        los pendientes segun la propia fila (ver _pendiente) se encolan y
+        salen en `pendientes`, responda el worker que responda.
+        """
+        filas = self.repo.totales_lote(pedido_ids)
+        pendientes = [i for i in pedido_ids if self._pendiente(filas.get(i))]
+        encolar_totales(self.repo.supabase, pendientes)
+        return PedidoTotalesLoteOut(
+            data=[PedidoTotalesOut(**filas[i]) for i in pedido_ids if i in filas],
+            pendientes=pendientes,
+        )
+
+    def recalcular_totales_lote(self, pedido_ids: List[int]) -> List[dict]:
+        """
+        Recalcula y guarda los totales de varios pedidos a la vez: lineas con
+        consultas IN, precios con calcular_precios_lineas y un solo upsert.
+        Conserva IVA si/no, gastos de envio y envio sin cargo de la fila
+        anterior.
+        """
+        pedidos = self.repo.pedidos_lote(pedido_ids)
+        if not pedidos:
+            return []
+        ids = list(pedidos)
+        previos = self.repo.totales_lote(ids)
+        lineas = self.repo.lineas_lote(ids)
+        precios = self._precios(lineas, lambda l: pedidos[l["pedidoid"]].get("clienteid"))
+
+        por_pedido: Dict[int, tuple] = {i: ([], []) for i in ids}
+        for l, precio in zip(lineas, precios):
+            por_pedido[l["pedidoid"]][0].append(l)
+            por_pedido[l["pedidoid"]][1].append(precio)
+
+        filas = []
+        for pedidoid, (lns, prs) in por_pedido.items():
+            previo = previos.get(pedidoid) or {}
+            payload = self._payload_totales(
+                lns,
+                prs,
+                self._use_iva_previo(previo),
+                float(previo.get("gastos_envio") or 0.0),
+                bool(previo.get("envio_sin_cargo")),
             )
-            subtotal = engine["unit_neto_sin_iva"] * (l.cantidad or 1)
+            filas.append({"pedidoid": pedidoid, **payload, "version_calculada": self._version_lineas(previo)})
+        self.repo.upsert_totales(filas)
+        return filas
+
+    def _precios(self, lineas: List[dict], clienteid_de: Callable[[dict], Optional[int]]) -> List[dict]:
+        # Todas las lineas en una llamada: clientes, productos e impuestos se leen una vez
+        return calcular_precios_lineas(
+            self.repo.supabase,
+            [
+                {
+                    "clienteid": clienteid_de(l),
+                    "productoid": l.get("productoid"),
+                    "precio_base_unit": l.get("precio_unitario"),
+                    "cantidad": l.get("cantidad") or 1,
+                }
+                for l in lineas
+            ],
+        )
+
+    @staticmethod
+    def _version_lineas(fila: dict) -> int:
+        return int(fila.get("lineas_version") or 0)
+
+    @classmethod
+    def _pendiente(cls, fila: Optional[dict]) -> bool:
+        # Sin fila o sin recalcular, o con lineas cambiadas despues del ultimo
+        # recalculo (lineas_version la sube un trigger de pedido_detalle)
+        if not fila or not fila.get("fecha_recalculo"):
+            return True
+        return cls._version_lineas(fila) > int(fila.get("version_calculada") or 0)
+
+    @staticmethod
+    def _use_iva_previo(previo: dict) -> bool:
+        if previo.get("use_iva") is not None:
+            return bool(previo["use_iva"])
+        # Fila de antes de la columna use_iva: con base y sin IVA es que se guardo sin IVA
+        return not (float(previo.get("base_imponible") or 0.0) and not float(previo.get("iva_importe") or 0.0))
+
+    @staticmethod
+    def _payload_totales(
+        lineas: List[dict], precios: List[dict], use_iva: bool, gastos_envio: float, envio_sin_cargo: bool
+    ) -> dict:
+        base_total = iva_total = 0.0
+        for l, engine in zip(lineas, precios):
+            cantidad = l.get("cantidad") or 1
+            subtotal = engine["unit_neto_sin_iva"] * cantidad
             base_total += subtotal
             iva_pct = engine["iva_pct"] if use_iva else 0.0
             iva_total += subtotal * (iva_pct / 100.0)
 
         total_importe = base_total + iva_total + (gastos_envio or 0.0)
-        payload = {
+        return {
             "base_imponible": round(base_total, 2),
             "iva_importe": round(iva_total, 2),
             "total_importe": round(total_importe, 2),
             "gastos_envio": round(gastos_envio or 0.0, 2),
             "envio_sin_cargo": bool(envio_sin_cargo),
+            "use_iva": bool(use_iva),
             "fecha_recalculo": datetime.now().isoformat(),
         }
-        self.repo.actualizar_totales(pedidoid, payload)
-        return PedidoTotalesOut(pedidoid=pedidoid, **payload)
 
     # -----------------------------
     # Observaciones
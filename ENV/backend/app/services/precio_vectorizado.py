@@ -0,0 +1,330 @@
+# backend/app/services/precio_vectorizado.py
+"""
+Calculo de precios vectorizado (pandas / NumPy) para muchas lineas a la vez.
+
+Aplica la misma jerarquia que _resolve_tarifa (TarifaReglaIndex), pero con un
+merge por nivel sobre todas las lineas en lugar de una busqueda por linea:
+  producto+cliente > familia+cliente > producto+grupo > familia+grupo
+  > cliente_tarifa > fallback_general
+Lo usan la lista de precios por cliente y el simulador de tarifas.
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.app.services.impuesto_resolver import get_impuesto_resolver
+from backend.app.services.precio_engine import _fetch_clientes_ctx, _today_iso
+from backend.app.services.tarifa_index import (
+    NIVELES,
+    _claves_regla,
+    _fetch_all,
+    get_tarifa_index,
+    tarifa_fallback,
+)
+from comun.impuesto_resolver import ImpuestoResolver
+
+# El motor compara None == None; en las claves se representa con este valor
+_NULO = -1
+_FECHA_MIN = np.datetime64("0001-01-01", "D")
+_FECHA_MAX = np.datetime64("9999-12-31", "D")
+
+COLUMNAS_TARIFA = ["nivel_tarifa", "tarifaid", "tarifa_aplicada", "descuento_pct", "regla_id"]
+
+
+def _ids(valores) -> np.ndarray:
+    return pd.to_numeric(pd.Series(valores), errors="coerce").fillna(_NULO).astype("int64").to_numpy()
+
+
+def _fechas(valores, vacio: np.datetime64) -> np.ndarray:
+    f = pd.to_datetime(pd.Series(valores, dtype="object"), errors="coerce").to_numpy().astype("datetime64[D]")
+    return np.where(np.isnat(f), vacio, f)
+
+
+def _round2(x: np.ndarray) -> np.ndarray:
+    return np.round(np.asarray(x, dtype="float64") + 1e-12, 2)
+
+
+# -----------------------------
+# Reglas en forma de tabla
+# -----------------------------
+def reglas_df(reglas: List[Dict[str, Any]], tarifas: Dict[int, Dict[str, Any]]) -> pd.DataFrame:
+    """Una fila por (regla, nivel, clave) con la tarifa ya unida."""
+    filas = []
+    for r in sorted(reglas, key=lambda r: r.get("tarifa_reglaid") or 0):
+        if not r.get("habilitada"):
+            continue
+        t = tarifas.get(r.get("tarifaid"))
+        if not t or not t.get("habilitada"):
+            continue
+        for nivel, (k1, k2) in _claves_regla(r):
+            filas.append(
+                {
+                    "nivel": nivel,
+                    "k1": k1,
+                    "k2": k2,
+                    "tarifaid": t["tarifaid"],
+                    "tarifa_aplicada": t["nombre"],
+                    "descuento_pct": float(t.get("descuento_pct") or 0.0),
+                    "regla_id": r["tarifa_reglaid"],
+                    "fecha_inicio": r.get("fecha_inicio"),
+                    "fecha_fin": r.get("fecha_fin"),
+                    "prioridad": r.get("prioridad") or 999,
+                }
+            )
+
+    df = pd.DataFrame(
+        filas,
+        columns=[
+            "nivel", "k1", "k2", "tarifaid", "tarifa_aplicada", "descuento_pct",
+            "regla_id", "fecha_inicio", "fecha_fin", "prioridad",
+        ],
+    )
+    df["k1"] = _ids(df["k1"])
+    df["k2"] = _ids(df["k2"])
+    df["fi"] = _fechas(df["fecha_inicio"], _FECHA_MIN)
+    df["ff"] = _fechas(df["fecha_fin"], _FECHA_MAX)
+    return df.drop(columns=["fecha_inicio", "fecha_fin"])
+
+
+def _hay_reglas_vigentes(reglas: List[Dict[str, Any]], fechas: np.ndarray) -> np.ndarray:
+    activas = [r for r in reglas if r.get("habilitada")]
+    if not activas:
+        return np.zeros(len(fechas), dtype=bool)
+    fi = _fechas([r.get("fecha_inicio") for r in activas], _FECHA_MIN)
+    ff = _fechas([r.get("fecha_fin") for r in activas], _FECHA_MAX)
+    orden = np.argsort(fi, kind="mergesort")
+    fi, max_fin = fi[orden], np.maximum.accumulate(ff[orden])
+    hasta = np.searchsorted(fi, fechas, side="right")
+    return (hasta > 0) & (max_fin[np.maximum(hasta - 1, 0)] >= fechas)
+
+
+# -----------------------------
+# Resolucion de tarifa por lotes
+# -----------------------------
+def resolver_tarifas(
+    lineas: pd.DataFrame,
+    reglas: List[Dict[str, Any]],
+    tarifas: Dict[int, Dict[str, Any]],
+    cliente_tarifas: List[Dict[str, Any]],
+) -> pd.DataFrame:
+    """
+    lineas: columnas clienteid, grupoid, productoid, familiaid y fecha.
+    Devuelve COLUMNAS_TARIFA con el mismo indice que lineas.
+    """
+    n = len(lineas)
+    base = pd.DataFrame(
+        {
+            "_pos": np.arange(n),
+            "clienteid": _ids(lineas["clienteid"].to_numpy()),
+            "grupoid": _ids(lineas["grupoid"].to_numpy()),
+            "productoid": _ids(lineas["productoid"].to_numpy()),
+            "familiaid": _ids(lineas["familiaid"].to_numpy()),
+            "fecha": _fechas(lineas["fecha"].to_numpy(), _FECHA_MAX),
+        }
+    )
+
+    fb = tarifa_fallback()
+    nivel = np.full(n, fb["nivel_tarifa"], dtype=object)
+    tarifaid = np.full(n, fb["tarifaid"], dtype=object)
+    tarifa_aplicada = np.full(n, fb["tarifa_aplicada"], dtype=object)
+    descuento = np.full(n, fb["descuento_pct"], dtype="float64")
+    regla_id = np.full(n, None, dtype=object)
+    resuelta = np.zeros(n, dtype=bool)
+
+    # 1-4) Reglas por nivel: merge por clave + ventana de fechas
+    rdf = reglas_df(reglas, tarifas)
+    candidatas = []
+    for orden, nv in enumerate(NIVELES):
+        rn = rdf[rdf["nivel"] == nv]
+        if rn.empty:
+            continue
+        sujeto = "clienteid" if nv.endswith("cliente") else "grupoid"
+        objeto = "productoid" if nv.startswith("producto") else "familiaid"
+        m = base[["_pos", sujeto, objeto, "fecha"]].merge(
+            rn, left_on=[sujeto, objeto], right_on=["k1", "k2"], how="inner"
+        )
+        m = m[(m["fi"] <= m["fecha"]) & (m["ff"] >= m["fecha"])]
+        if not m.empty:
+            m = m.assign(_orden=orden, _neg=-m["descuento_pct"])
+            candidatas.append(m)
+
+    if candidatas:
+        mejor = (
+            pd.concat(candidatas, ignore_index=True)
+            .sort_values(["_pos", "_orden", "_neg", "fi", "prioridad", "regla_id"], kind="mergesort")
+            .drop_duplicates("_pos")
+        )
+        pos = mejor["_pos"].to_numpy()
+        nivel[pos] = mejor["nivel"].to_numpy()
+        tarifaid[pos] = mejor["tarifaid"].to_numpy()
+        tarifa_aplicada[pos] = mejor["tarifa_aplicada"].to_numpy()
+        descuento[pos] = mejor["descuento_pct"].to_numpy()
+        regla_id[pos] = mejor["regla_id"].to_numpy()
+        resuelta[pos] = True
+
+    # 5) cliente_tarifa: la primera vigente del cliente, si su tarifa esta habilitada
+    pendientes = base[~resuelta]
+    if cliente_tarifas and not pendientes.empty:
+        ct = pd.DataFrame(cliente_tarifas, columns=["clienteid", "tarifaid", "fecha_desde", "fecha_hasta"])
+        ct = ct.assign(
+            _orden=np.arange(len(ct)),
+            clienteid=_ids(ct["clienteid"]),
+            fd=_fechas(ct["fecha_desde"], _FECHA_MIN),
+            fh=_fechas(ct["fecha_hasta"], _FECHA_MAX),
+        )
+        m = pendientes[["_pos", "clienteid", "fecha"]].merge(ct, on="clienteid", how="inner")
+        m = m[(m["fd"] <= m["fecha"]) & (m["fh"] >= m["fecha"])]
+        m = m.sort_values(["_pos", "_orden"], kind="mergesort").drop_duplicates("_pos")
+        for tid, grupo in m.groupby("tarifaid", sort=False):
+            t = tarifas.get(tid)
+            if not t or not t.get("habilitada"):
+                continue
+            pos = grupo["_pos"].to_numpy()
+            nivel[pos] = "cliente_tarifa"
+            tarifaid[pos] = t["tarifaid"]
+            tarifa_aplicada[pos] = t["nombre"]
+            descuento[pos] = float(t.get("descuento_pct") or 0.0)
+            regla_id[pos] = None
+
+    # Sin ninguna regla vigente en la fecha, el motor va directo al fallback
+    sin_reglas = ~_hay_reglas_vigentes(reglas, base["fecha"].to_numpy())
+    nivel[sin_reglas] = fb["nivel_tarifa"]
+    tarifaid[sin_reglas] = fb["tarifaid"]
+    tarifa_aplicada[sin_reglas] = fb["tarifa_aplicada"]
+    descuento[sin_reglas] = fb["descuento_pct"]
+    regla_id[sin_reglas] = None
+
+    return pd.DataFrame(
+        {
+            "nivel_tarifa": nivel,
+            "tarifaid": tarifaid,
+            "tarifa_aplicada": tarifa_aplicada,
+            "descuento_pct": descuento,
+            "regla_id": regla_id,
+        },
+        index=lineas.index,
+    )
+
+
+# -----------------------------
+# Impuestos e importes
+# -----------------------------
+def resolver_impuestos(resolver: ImpuestoResolver, lineas: pd.DataFrame) -> pd.DataFrame:
+    """
+    lineas: columnas producto_tipoid, ambito y fecha_iso.
+    Resuelve cada combinacion distinta una sola vez y la reparte a las lineas.
+    """
+    claves = ["producto_tipoid", "ambito", "fecha_iso"]
+    k = lineas[claves].astype(object).where(lineas[claves].notna(), None)
+    unicas = k.drop_duplicates().reset_index(drop=True)
+    res = pd.DataFrame(
+        [
+            resolver.resolver(producto_tipoid=u.producto_tipoid, ambito=u.ambito, fecha_iso=u.fecha_iso)
+            for u in unicas.itertuples(index=False)
+        ],
+        columns=["iva_pct", "iva_nombre", "iva_origen"],
+    )
+    unicas = pd.concat([unicas, res], axis=1)
+    out = k.merge(unicas, on=claves, how="left")
+    out.index = lineas.index
+    return out[["iva_pct", "iva_nombre", "iva_origen"]]
+
+
+def calcular_importes(
+    unit_bruto: np.ndarray,
+    cantidad: np.ndarray,
+    descuento_pct: np.ndarray,
+    iva_pct: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """Mismas formulas y redondeos que _componer_precio, sobre arrays."""
+    unit_bruto = np.asarray(unit_bruto, dtype="float64")
+    unit_neto = _round2(unit_bruto * (1 - np.asarray(descuento_pct, dtype="float64") / 100.0))
+    subtotal = _round2(unit_neto * np.asarray(cantidad, dtype="float64"))
+    iva_importe = _round2(subtotal * np.asarray(iva_pct, dtype="float64") / 100.0)
+    return {
+        "unit_bruto": _round2(unit_bruto),
+        "unit_neto_sin_iva": unit_neto,
+        "subtotal_sin_iva": subtotal,
+        "iva_importe": iva_importe,
+        "total_con_iva": _round2(subtotal + iva_importe),
+    }
+
+
+# -----------------------------
+# Lista de precios de un cliente
+# -----------------------------
+def _fetch_catalogo(supabase) -> pd.DataFrame:
+    rows = _fetch_all(
+        supabase,
+        "producto",
+        "catalogo_productoid, idproducto, titulo_automatico, producto_familiaid, producto_tipoid, pvp",
+        order="catalogo_productoid",
+    )
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "catalogo_productoid", "idproducto", "titulo_automatico",
+            "producto_familiaid", "producto_tipoid", "pvp",
+        ],
+    )
+
+
+def lista_precios_cliente(supabase, clienteid: int, fecha: Optional[date] = None) -> pd.DataFrame:
+    """
+    Precio neto y con IVA de todo el catalogo para un cliente en una fecha.
+    Carga reglas, impuestos y productos una vez y calcula en una pasada.
+    """
+    fecha_iso = _today_iso(fecha)
+    cli = _fetch_clientes_ctx(supabase, [clienteid]).get(clienteid) or {}
+    ambito = cli.get("ambito") or "ES"
+
+    cat = _fetch_catalogo(supabase)
+    idx = get_tarifa_index(supabase)
+
+    lineas = pd.DataFrame(
+        {
+            "clienteid": clienteid,
+            "grupoid": cli.get("grupoid", 0),
+            "productoid": cat["catalogo_productoid"],
+            "familiaid": cat["producto_familiaid"],
+            "fecha": fecha_iso,
+        }
+    )
+    tar = resolver_tarifas(
+        lineas,
+        list(idx.reglas.values()),
+        idx.tarifas,
+        idx._cliente_tarifas_planas(),
+    )
+    ivx = resolver_impuestos(
+        get_impuesto_resolver(supabase),
+        pd.DataFrame({"producto_tipoid": cat["producto_tipoid"], "ambito": ambito, "fecha_iso": fecha_iso}),
+    )
+    imp = calcular_importes(
+        pd.to_numeric(cat["pvp"], errors="coerce").fillna(0.0).to_numpy(),
+        np.ones(len(cat)),
+        tar["descuento_pct"].to_numpy(),
+        ivx["iva_pct"].to_numpy(dtype="float64"),
+    )
+
+    return pd.DataFrame(
+        {
+            "productoid": cat["catalogo_productoid"],
+            "referencia": cat["idproducto"],
+            "producto": cat["titulo_automatico"],
+            "familiaid": cat["producto_familiaid"],
+            "unit_bruto": imp["unit_bruto"],
+            "descuento_pct": _round2(tar["descuento_pct"].to_numpy()),
+            "unit_neto_sin_iva": imp["unit_neto_sin_iva"],
+            "iva_pct": ivx["iva_pct"].to_numpy(),
+            "iva_importe": imp["iva_importe"],
+            "total_con_iva": imp["total_con_iva"],
+            "tarifa_aplicada": tar["tarifa_aplicada"].to_numpy(),
+            "nivel_tarifa": tar["nivel_tarifa"].to_numpy(),
+            "regla_id": tar["regla_id"].to_numpy(),
+            "region": ambito,
+            "fecha": fecha_iso,
+        }
+    )
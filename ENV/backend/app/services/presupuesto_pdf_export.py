@@ -0,0 +1,148 @@
+# backend/app/services/presupuesto_pdf_export.py
+"""
+Exportacion masiva de presupuestos a PDF dentro de un ZIP que se envia al
+cliente segun se va generando.
+
+- Contextos: build_data_reals() lee en bloque (una consulta IN por tabla)
+  cada tanda de _BLOQUE presupuestos.
+- Render: build_pdf_bytes() en un ProcessPoolExecutor con un proceso por
+  nucleo; reportlab es Python puro y con hilos no pasaria de un nucleo.
+- Salida: zipfile sobre un fichero no posicionable (descriptores de datos),
+  cada PDF se escribe en cuanto esta listo y sus bytes salen por el
+  StreamingResponse. Nunca hay mas de _EN_VUELO PDFs en memoria.
+
+El pool se crea al primer uso con contexto "spawn" en todas las
+plataformas: hacer fork de un worker de uvicorn con hilos vivos puede
+heredar locks tomados. La funcion de trabajo (_render) es de nivel de
+modulo para poder serializarla. cerrar_pool() lo para al apagar la app
+(lifespan de backend/app/main.py).
+"""
+import os
+import re
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Iterator, List, Optional, Set
+
+from comun.presupuesto_pdf import build_data_reals, build_pdf_bytes
+
+_BLOQUE = 100
+_WORKERS = max(1, os.cpu_count() or 1)
+_EN_VUELO = 2 * _WORKERS
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=_WORKERS, mp_context=get_context("spawn"))
+        return _POOL
+
+
+def cerrar_pool():
+    """Para los procesos de render (apagado de la app)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=True, cancel_futures=True)
+        _POOL = None
+
+
+def _descartar_pool():
+    # Un proceso muerto deja el pool roto: el siguiente export crea otro
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+
+def _render(data_real: dict) -> bytes:
+    pdf_bytes, _ = build_pdf_bytes(data_real)
+    return pdf_bytes
+
+
+class _Salida:
+    """Fichero de solo escritura para zipfile; vaciar() entrega lo escrito desde la ultima vez."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._partes.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        data = b"".join(self._partes)
+        self._partes = []
+        return data
+
+
+def _nombre_pdf(data_real: dict, presupuestoid: int, usados: Set[str]) -> str:
+    numero = (data_real.get("presupuesto") or {}).get("numero") or f"id{presupuestoid}"
+    nombre = f"presupuesto_{re.sub(r'[^0-9A-Za-z._-]+', '_', str(numero))}.pdf"
+    if nombre in usados:
+        nombre = nombre[:-4] + f"_{presupuestoid}.pdf"
+    usados.add(nombre)
+    return nombre
+
+
+def exportar_zip(supabase, presupuesto_ids: List[int]) -> Iterator[bytes]:
+    """
+    Genera los trozos del ZIP. Los PDFs se escriben en el orden de
+    presupuesto_ids; los que no existen o fallan se listan en ERRORES.txt.
+    """
+    pool = _pool()
+    salida = _Salida()
+    en_vuelo: deque = deque()
+    usados: Set[str] = set()
+    errores: List[str] = []
+
+    def escribir(zf: zipfile.ZipFile, presupuestoid: int, nombre: str, futuro) -> bytes:
+        try:
+            zf.writestr(nombre, futuro.result())
+        except BrokenProcessPool:
+            _descartar_pool()
+            raise
+        except Exception as e:
+            errores.append(f"{presupuestoid}: error generando el PDF ({e})")
+        return salida.vaciar()
+
+    try:
+        # Los PDF ya van comprimidos: ZIP_STORED no gasta CPU en el hilo que envia
+        with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as zf:
+            for i in range(0, len(presupuesto_ids), _BLOQUE):
+                bloque = presupuesto_ids[i : i + _BLOQUE]
+                data_reals = build_data_reals(supabase, bloque)
+                for pid in bloque:
+                    data_real = data_reals.pop(pid, None)
+                    if data_real is None:
+                        errores.append(f"{pid}: presupuesto no encontrado")
+                        continue
+                    en_vuelo.append((pid, _nombre_pdf(data_real, pid, usados), pool.submit(_render, data_real)))
+                    while len(en_vuelo) >= _EN_VUELO:
+                        trozo = escribir(zf, *en_vuelo.popleft())
+                        if trozo:
+                            yield trozo
+
+            while en_vuelo:
+                trozo = escribir(zf, *en_vuelo.popleft())
+                if trozo:
+                    yield trozo
+
+            if errores:
+                zf.writestr("ERRORES.txt", "\n".join(errores) + "\n")
+        yield salida.vaciar()
+    finally:
+        # Cliente desconectado o error: no seguir renderizando para nadie
+        for _, _, futuro in en_vuelo:
+            futuro.cancel()
@@ -3,7 +3,7 @@ import math
 from datetime import date, datetime
 from typing import Dict, List, Optional
 
-from backend.app.services.precio_engine import calcular_precio_linea
+from backend.app.services.precio_engine import calcular_precio_linea, calcular_precios_lineas
 
 from backend.app.schemas.presupuesto import (
     PresupuestoCreateIn,
@@ -12,6 +12,10 @@ from backend.app.schemas.presupuesto import (
     PresupuestoOut,
     PresupuestoLineaIn,
     PresupuestoLineaOut,
+    PresupuestoLineaUpdateIn,
+    PresupuestoLineasBatchOut,
+    PresupuestoPdfZipIn,
+    PresupuestoReconciliacionOut,
     PresupuestoRecalcResponse,
 )
 from backend.app.repositories.presupuestos_repo import PresupuestosRepository
@@ -33,51 +37,54 @@ class PresupuestosService:
         page: int,
         page_size: int,
         ordenar_por: str,
+        cursor: Optional[str] = None,
+        count: str = "exact",
     ) -> PresupuestoListResponse:
-        rows, total = self.repo.listar(q, estadoid, clienteid, ambito_impuesto, page, page_size, ordenar_por)
+        rows, total, next_cursor = self.repo.listar(
+            q, estadoid, clienteid, ambito_impuesto, page, page_size, ordenar_por, cursor=cursor, count=count
+        )
 
         ids = [
             r.get("presupuestoid") or r.get("presupuesto_id")
             for r in rows
             if (r.get("presupuestoid") or r.get("presupuesto_id")) is not None
         ]
-        totales_map = self.repo.obtener_totales([int(i) for i in ids]) if ids else {}
-        num_lineas_map = {int(pid): self.repo.contar_lineas(int(pid)) for pid in ids}
-
-        items: List[PresupuestoListItem] = [
-            PresupuestoListItem(
-                presupuestoid=r.get("presupuestoid") or r.get("presupuesto_id"),
-                numero=r.get("numero"),
-                clienteid=r.get("clienteid"),
-                cliente=(r.get("cliente") or {}).get("razonsocial")
-                or (r.get("cliente") or {}).get("nombre"),
-                estado_presupuestoid=r.get("estado_presupuestoid") or r.get("presupuesto_estadoid"),
-                estado=(r.get("estado") or {}).get("estado") or (r.get("estado") or {}).get("nombre"),
-                bloquea_edicion=(r.get("estado") or {}).get("bloquea_edicion"),
-                fecha_presupuesto=r.get("fecha_presupuesto"),
-                fecha_validez=r.get("fecha_validez"),
-                ambito_impuesto=r.get("ambito_impuesto"),
-                num_lineas=r.get("num_lineas")
-                or num_lineas_map.get(int(r.get("presupuestoid") or r.get("presupuesto_id") or 0)),
-                base_imponible=r.get("base_imponible")
-                or (totales_map.get(int(r.get("presupuestoid") or r.get("presupuesto_id") or 0)) or {}).get("base_imponible"),
-                iva_total=r.get("iva_total")
-                or (totales_map.get(int(r.get("presupuestoid") or r.get("presupuesto_id") or 0)) or {}).get("iva_total"),
-                total_documento=r.get("total_documento")
-                or (totales_map.get(int(r.get("presupuestoid") or r.get("presupuesto_id") or 0)) or {}).get("total_documento"),
-                total_estimada=r.get("total_estimada"),
-                trabajadorid=r.get("trabajadorid"),
+        # num_lineas + totales de toda la pagina en una sola consulta
+        resumen_map = self.repo.resumen_listado([int(i) for i in ids]) if ids else {}
+
+        items: List[PresupuestoListItem] = []
+        for r in rows:
+            resumen = resumen_map.get(int(r.get("presupuestoid") or r.get("presupuesto_id") or 0)) or {}
+            items.append(
+                PresupuestoListItem(
+                    presupuestoid=r.get("presupuestoid") or r.get("presupuesto_id"),
+                    numero=r.get("numero"),
+                    clienteid=r.get("clienteid"),
+                    cliente=(r.get("cliente") or {}).get("razonsocial")
+                    or (r.get("cliente") or {}).get("nombre"),
+                    estado_presupuestoid=r.get("estado_presupuestoid") or r.get("presupuesto_estadoid"),
+                    estado=(r.get("estado") or {}).get("estado") or (r.get("estado") or {}).get("nombre"),
+                    bloquea_edicion=(r.get("estado") or {}).get("bloquea_edicion"),
+                    fecha_presupuesto=r.get("fecha_presupuesto"),
+                    fecha_validez=r.get("fecha_validez"),
+                    ambito_impuesto=r.get("ambito_impuesto"),
+                    num_lineas=r.get("num_lineas") or resumen.get("num_lineas"),
+                    base_imponible=r.get("base_imponible") or resumen.get("base_imponible"),
+                    iva_total=r.get("iva_total") or resumen.get("iva_total"),
+                    total_documento=r.get("total_documento") or resumen.get("total_documento"),
+                    total_estimada=r.get("total_estimada"),
+                    trabajadorid=r.get("trabajadorid"),
+                )
             )
-            for r in rows
-        ]
 
-        total_pages = max(1, math.ceil((total or 0) / page_size))
+        total_pages = max(1, math.ceil(total / page_size)) if total is not None else None
         return PresupuestoListResponse(
             data=items,
             total=total,
             total_pages=total_pages,
             page=page,
             page_size=page_size,
+            next_cursor=next_cursor,
         )
 
     def obtener(self, presupuestoid: int) -> PresupuestoOut:
@@ -94,6 +101,13 @@ class PresupuestosService:
         pres["bloquea_edicion"] = (pres.get("estado") or {}).get("bloquea_edicion")
         return PresupuestoOut(**pres)
 
+    def ids_exportacion(self, data: PresupuestoPdfZipIn) -> List[int]:
+        if data.presupuesto_ids:
+            return list(dict.fromkeys(data.presupuesto_ids))
+        return self.repo.ids_filtrados(
+            data.q, data.estadoid, data.clienteid, data.ambito_impuesto, data.fecha_desde, data.fecha_hasta
+        )
+
     # -----------------------------
     # Crear / actualizar / borrar
     # -----------------------------
@@ -103,13 +117,7 @@ class PresupuestosService:
         # Número automático si no viene (PRES-YYYY-####)
         if not payload.get("numero"):
             prefijo = f"PRES-{data.fecha_presupuesto.year}-"
-            existentes = self.repo.ultimo_numero_prefijo(prefijo)
-            usados = [
-                int(x.split("-")[-1])
-                for x in existentes
-                if x.split("-")[-1].isdigit()
-            ]
-            siguiente = max(usados) + 1 if usados else 1
+            siguiente = self.repo.siguiente_numero(prefijo)
             payload["numero"] = f"{prefijo}{siguiente:04d}"
 
         # Region (prioridad: direccion_envio -> cliente envio/fiscal)
@@ -193,56 +201,89 @@ class PresupuestosService:
         return out
 
     def agregar_linea(self, presupuestoid: int, linea: PresupuestoLineaIn) -> int:
-        pres = self.repo.obtener(presupuestoid)
-        if not pres:
-            raise ValueError("Presupuesto no encontrado")
-        if pres.get("editable") is False:
-            raise ValueError("Presupuesto bloqueado")
-
-        clienteid = pres.get("clienteid")
-        fecha_validez = pres.get("fecha_validez")
-        fecha_calc = (
-            date.fromisoformat(fecha_validez) if isinstance(fecha_validez, str) else fecha_validez
-        ) or datetime.now().date()
+        pres = self._presupuesto_editable(presupuestoid)
 
         pricing = calcular_precio_linea(
             supabase=self.repo.supabase,
-            clienteid=clienteid,
+            clienteid=pres.get("clienteid"),
             productoid=linea.productoid,
             cantidad=linea.cantidad,
-            fecha=fecha_calc,
+            fecha=self._fecha_calculo(pres),
         )
 
-        unit_bruto = float(pricing.get("unit_bruto") or 0.0)
-        dto_motor = float(pricing.get("descuento_pct") or 0.0)
-        iva_pct = float(pricing.get("iva_pct") or 0.0)
-        dto_final = float(linea.descuento_pct) if linea.descuento_pct is not None else dto_motor
+        row = self._fila_linea(presupuestoid, linea, pricing)
+        detalleid = self.repo.insertar_linea(row)
+        self._aplicar_delta(presupuestoid, antes=[], despues=[row])
+        return detalleid
 
-        base = float(pricing.get("subtotal_sin_iva") or 0.0)
-        total = float(pricing.get("total_con_iva") or 0.0)
+    def agregar_lineas(self, presupuestoid: int, lineas: List[PresupuestoLineaIn]) -> PresupuestoLineasBatchOut:
+        """
+        Alta masiva: una lectura de cabecera, precios por lotes, un unico
+        insert en presupuesto_linea y un solo recalculo de totales.
+        """
+        if not lineas:
+            raise ValueError("No hay líneas que añadir")
+        pres = self._presupuesto_editable(presupuestoid)
 
-        # Si hay dto manual, recalculamos base/total respetando IVA
-        if linea.descuento_pct is not None:
-            base = round(float(linea.cantidad) * unit_bruto * (1 - dto_final / 100.0), 2)
-            total = round(base * (1 + iva_pct / 100.0), 2)
+        clienteid = pres.get("clienteid")
+        fecha_calc = self._fecha_calculo(pres)
+        pricings = calcular_precios_lineas(
+            self.repo.supabase,
+            [
+                {"clienteid": clienteid, "productoid": ln.productoid, "cantidad": ln.cantidad, "fecha": fecha_calc}
+                for ln in lineas
+            ],
+        )
 
-        row = {
-            "presupuesto_id": presupuestoid,
-            "producto_id": linea.productoid,
-            "descripcion": linea.descripcion,
-            "cantidad": float(linea.cantidad),
-            "precio_unitario": unit_bruto,
-            "descuento_pct": dto_final,
-            "iva_pct": iva_pct,
-            "base_linea": base,
-            "iva_importe": round(base * iva_pct / 100.0, 2),
-            "total_linea": total,
-            "tarifa_aplicada": pricing.get("tarifa_aplicada"),
-            "nivel_tarifa": pricing.get("nivel_tarifa"),
-        }
-        detalleid = self.repo.insertar_linea(row)
-        self._recalcular_total_estimada(presupuestoid)
-        return detalleid
+        rows = [self._fila_linea(presupuestoid, ln, pr) for ln, pr in zip(lineas, pricings)]
+        ids = self.repo.insertar_lineas(rows)
+        total = self._aplicar_delta(presupuestoid, antes=[], despues=rows)
+        return PresupuestoLineasBatchOut(presupuesto_detalleids=ids, insertadas=len(ids), total_estimada=total)
+
+    def actualizar_linea(self, presupuestoid: int, detalleid: int, data: PresupuestoLineaUpdateIn) -> float:
+        pres = self._presupuesto_editable(presupuestoid)
+        anterior = self.repo.obtener_linea(presupuestoid, detalleid)
+        if not anterior:
+            raise ValueError("Línea no encontrada")
+
+        productoid = data.productoid or anterior.get("producto_id")
+        cambia_producto = productoid != anterior.get("producto_id")
+
+        # El descuento guardado solo se conserva si se puso a mano y el producto
+        # es el mismo; si lo calculo el motor, la linea se vuelve a tarificar
+        descuento_pct = data.descuento_pct
+        if descuento_pct is None and anterior.get("descuento_manual") and not cambia_producto:
+            descuento_pct = anterior.get("descuento_pct")
+
+        descripcion = data.descripcion
+        if descripcion is None:
+            descripcion = (
+                self.repo.nombre_producto(productoid) if cambia_producto else anterior.get("descripcion")
+            )
+
+        linea = PresupuestoLineaIn(
+            productoid=productoid,
+            cantidad=data.cantidad if data.cantidad is not None else (anterior.get("cantidad") or 1.0),
+            descuento_pct=descuento_pct,
+            descripcion=descripcion,
+        )
+        pricing = calcular_precio_linea(
+            supabase=self.repo.supabase,
+            clienteid=pres.get("clienteid"),
+            productoid=linea.productoid,
+            cantidad=linea.cantidad,
+            fecha=self._fecha_calculo(pres),
+        )
+        row = self._fila_linea(presupuestoid, linea, pricing)
+        self.repo.actualizar_linea(detalleid, row)
+        return self._aplicar_delta(presupuestoid, antes=[anterior], despues=[row])
+
+    def borrar_linea(self, presupuestoid: int, detalleid: int) -> float:
+        self._presupuesto_editable(presupuestoid)
+        borrada = self.repo.borrar_linea(presupuestoid, detalleid)
+        if not borrada:
+            raise ValueError("Línea no encontrada")
+        return self._aplicar_delta(presupuestoid, antes=[borrada], despues=[])
 
     def recalcular_lineas(self, presupuestoid: int, fecha_calculo: Optional[date] = None) -> PresupuestoRecalcResponse:
         pres = self.repo.obtener(presupuestoid)
@@ -261,62 +302,109 @@ class PresupuestosService:
             except Exception:
                 fecha_base = datetime.now().date()
 
-        total_base = total_iva = total_total = 0.0
-
-        for ln in lineas:
-            pricing = calcular_precio_linea(
-                supabase=self.repo.supabase,
-                clienteid=clienteid,
-                productoid=ln.productoid,
-                cantidad=ln.cantidad or 1,
-                fecha=fecha_base,
-            )
-
-            base = float(pricing["subtotal_sin_iva"])
-            iva = float(pricing["iva_importe"])
-            total = float(pricing["total_con_iva"])
-
-            self.repo.actualizar_linea(
-                ln.presupuesto_detalleid,
+        pricings = calcular_precios_lineas(
+            self.repo.supabase,
+            [
                 {
+                    "clienteid": clienteid,
+                    "productoid": ln.get("producto_id"),
+                    "cantidad": ln.get("cantidad") or 1,
+                    "fecha": fecha_base,
+                }
+                for ln in lineas
+            ],
+        )
+
+        total_base = total_iva = total_total = 0.0
+        filas = []
+        for ln, pricing in zip(lineas, pricings):
+            if ln.get("descuento_manual"):
+                # Los descuentos puestos a mano se respetan: mismo calculo que al editar la linea
+                linea = PresupuestoLineaIn(
+                    productoid=ln["producto_id"],
+                    cantidad=ln.get("cantidad") or 1,
+                    descuento_pct=ln.get("descuento_pct"),
+                    descripcion=ln.get("descripcion"),
+                )
+                fila = {"presupuesto_linea_id": ln["presupuesto_linea_id"], **self._fila_linea(presupuestoid, linea, pricing)}
+            else:
+                # Mismas columnas que agregar_linea (presupuesto_linea); la clave y
+                # los campos no recalculados viajan para que el upsert sea valido
+                fila = {
+                    "presupuesto_linea_id": ln["presupuesto_linea_id"],
+                    "presupuesto_id": presupuestoid,
+                    "producto_id": ln.get("producto_id"),
+                    "descripcion": ln.get("descripcion"),
+                    "cantidad": ln.get("cantidad"),
                     "precio_unitario": pricing["unit_bruto"],
                     "descuento_pct": pricing["descuento_pct"],
+                    "descuento_manual": False,
                     "iva_pct": pricing["iva_pct"],
-                    "importe_base": base,
-                    "importe_total_linea": total,
+                    "base_linea": float(pricing["subtotal_sin_iva"]),
+                    "iva_importe": float(pricing["iva_importe"]),
+                    "total_linea": float(pricing["total_con_iva"]),
                     "tarifa_aplicada": pricing.get("tarifa_aplicada"),
                     "nivel_tarifa": pricing.get("nivel_tarifa"),
-                    "iva_origen": pricing.get("iva_origen"),
-                },
-            )
+                }
+            filas.append(fila)
 
-            total_base += base
-            total_iva += iva
-            total_total += total
+            total_base += fila["base_linea"]
+            total_iva += fila["iva_importe"]
+            total_total += fila["total_linea"]
 
         recalc_row = {
-            "presupuestoid": presupuestoid,
+            "presupuesto_id": presupuestoid,
             "base_imponible": round(total_base, 2),
             "iva_total": round(total_iva, 2),
-            "total_presupuesto": round(total_total, 2),
+            "total_documento": round(total_total, 2),
             "fecha_recalculo": datetime.now().isoformat(),
         }
-        self.repo.upsert_totales(recalc_row)
-        self.repo.actualizar(presupuestoid, {"total_estimada": round(total_total, 2)})
+        self.repo.guardar_recalculo(presupuestoid, filas, recalc_row)
 
-        return PresupuestoRecalcResponse(**recalc_row)
+        return PresupuestoRecalcResponse(
+            base_imponible=recalc_row["base_imponible"],
+            iva_total=recalc_row["iva_total"],
+            total_presupuesto=recalc_row["total_documento"],
+            fecha_recalculo=recalc_row["fecha_recalculo"],
+        )
+
+    def reconciliar_totales(self, presupuestoid: Optional[int] = None) -> PresupuestoReconciliacionOut:
+        """Recalculo completo desde las lineas; red de seguridad de los deltas."""
+        descuadres = self.repo.reconciliar_totales(presupuestoid)
+        return PresupuestoReconciliacionOut(corregidos=len(descuadres), detalle=descuadres)
 
     # -----------------------------
     # Conversión a pedido
     # -----------------------------
     def convertir_a_pedido(self, presupuestoid: int) -> Dict[str, object]:
+        # Camino normal: todo en la base de datos, una llamada y una transaccion
+        res = self.repo.convertir_a_pedido(presupuestoid)
+        if res is not None:
+            return res
+        return self._convertir_a_pedido_sin_rpc(presupuestoid)
+
+    def _convertir_a_pedido_sin_rpc(self, presupuestoid: int) -> Dict[str, object]:
+        """
+        Sin la funcion SQL: mismas escrituras en bloque (cabecera, un insert
+        de lineas, totales) y, si algo falla a mitad, se borra el pedido
+        creado para no dejarlo a medias.
+        """
         pres = self.repo.obtener(presupuestoid)
         if not pres:
             raise ValueError("Presupuesto no encontrado")
 
         existing = self.repo.pedido_por_presupuesto(presupuestoid)
         if existing:
-            return {"pedidoid": existing["pedidoid"], "numero": existing["numero"], "ya_existia": True}
+            return {"pedidoid": existing["pedidoid"], "numero": existing["numero"], "ya_existia": True, "lineas": 0}
+
+        lineas = self.repo.listar_lineas(presupuestoid)
+        totales = self.repo.obtener_totales([presupuestoid]).get(presupuestoid)
+        if not totales:
+            totales = {
+                "base_imponible": round(sum(float(ln.get("base_linea") or 0) for ln in lineas), 2),
+                "iva_total": round(sum(float(ln.get("iva_importe") or 0) for ln in lineas), 2),
+                "total_documento": round(sum(float(ln.get("total_linea") or 0) for ln in lineas), 2),
+            }
 
         hoy = datetime.now().date()
         numero_pedido = f"PED-{hoy.year}-{9000 + presupuestoid:04d}"
@@ -335,39 +423,118 @@ class PresupuestosService:
         if not pedido:
             raise RuntimeError("No se pudo crear el pedido")
 
-        lineas = self.repo.listar_lineas(presupuestoid)
-        for ln in lineas:
-            self.repo.insertar_linea_pedido(
+        try:
+            self.repo.insertar_lineas_pedido(
+                [
+                    {
+                        "pedidoid": pedido["pedidoid"],
+                        "productoid": ln.get("producto_id"),
+                        "nombre_producto": ln.get("descripcion"),
+                        "cantidad": ln.get("cantidad"),
+                        "precio_unitario": ln.get("precio_unitario"),
+                        "descuento_pct": ln.get("descuento_pct") or 0,
+                        "iva_pct": ln.get("iva_pct") or 21,
+                        "importe_base": ln.get("base_linea") or 0,
+                        "importe_total_linea": ln.get("total_linea") or 0,
+                    }
+                    for ln in lineas
+                ]
+            )
+            self.repo.crear_totales_pedido(
                 {
                     "pedidoid": pedido["pedidoid"],
-                    "productoid": ln.productoid,
-                    "nombre_producto": ln.descripcion,
-                    "cantidad": ln.cantidad,
-                    "precio_unitario": ln.precio_unitario,
-                    "descuento_pct": ln.descuento_pct or 0,
-                    "iva_pct": ln.iva_pct or 21,
-                    "importe_base": ln.importe_base or 0,
-                    "importe_total_linea": ln.importe_total_linea or 0,
+                    "base_imponible": totales.get("base_imponible") or 0.0,
+                    "iva_importe": totales.get("iva_total") or 0.0,
+                    "total_importe": totales.get("total_documento") or 0.0,
+                    "gastos_envio": 0.0,
+                    "envio_sin_cargo": False,
+                    "fecha_recalculo": datetime.now().isoformat(),
                 }
             )
 
-        estado_convertido = self.repo.estado_por_nombre("Convertido") or self.repo.estado_por_nombre("Aceptado") or pres.get("estado_presupuestoid")
-        if estado_convertido:
-            self.repo.marcar_presupuesto_estado(presupuestoid, estado_convertido, editable=False)
+            estado_convertido = (
+                self.repo.estado_por_nombre("Convertido")
+                or self.repo.estado_por_nombre("Aceptado")
+                or pres.get("presupuesto_estadoid")
+            )
+            if estado_convertido:
+                self.repo.marcar_presupuesto_estado(presupuestoid, estado_convertido, editable=False)
+        except Exception:
+            self.repo.borrar_pedido(pedido["pedidoid"])
+            raise
 
         return {
             "pedidoid": pedido["pedidoid"],
             "numero": pedido["numero"],
             "ya_existia": False,
+            "lineas": len(lineas),
         }
 
     # -----------------------------
     # Internos
     # -----------------------------
-    def _recalcular_total_estimada(self, presupuestoid: int):
-        lineas = self.repo.listar_lineas(presupuestoid)
-        total = sum(float(l.importe_total_linea or 0) for l in lineas)
-        self.repo.actualizar(presupuestoid, {"total_estimada": round(total, 2)})
+    def _presupuesto_editable(self, presupuestoid: int) -> dict:
+        pres = self.repo.obtener(presupuestoid)
+        if not pres:
+            raise ValueError("Presupuesto no encontrado")
+        if pres.get("editable") is False:
+            raise ValueError("Presupuesto bloqueado")
+        return pres
+
+    @staticmethod
+    def _fecha_calculo(pres: dict) -> date:
+        fecha_validez = pres.get("fecha_validez")
+        return (
+            date.fromisoformat(fecha_validez) if isinstance(fecha_validez, str) else fecha_validez
+        ) or datetime.now().date()
+
+    @staticmethod
+    def _fila_linea(presupuestoid: int, linea: PresupuestoLineaIn, pricing: dict) -> dict:
+        unit_bruto = float(pricing.get("unit_bruto") or 0.0)
+        dto_motor = float(pricing.get("descuento_pct") or 0.0)
+        iva_pct = float(pricing.get("iva_pct") or 0.0)
+        dto_final = float(linea.descuento_pct) if linea.descuento_pct is not None else dto_motor
+
+        base = float(pricing.get("subtotal_sin_iva") or 0.0)
+        total = float(pricing.get("total_con_iva") or 0.0)
+
+        # Si hay dto manual, recalculamos base/total respetando IVA
+        if linea.descuento_pct is not None:
+            base = round(float(linea.cantidad) * unit_bruto * (1 - dto_final / 100.0), 2)
+            total = round(base * (1 + iva_pct / 100.0), 2)
+
+        return {
+            "presupuesto_id": presupuestoid,
+            "producto_id": linea.productoid,
+            "descripcion": linea.descripcion,
+            "cantidad": float(linea.cantidad),
+            "precio_unitario": unit_bruto,
+            "descuento_pct": dto_final,
+            "descuento_manual": linea.descuento_pct is not None,
+            "iva_pct": iva_pct,
+            "base_linea": base,
+            "iva_importe": round(base * iva_pct / 100.0, 2),
+            "total_linea": total,
+            "tarifa_aplicada": pricing.get("tarifa_aplicada"),
+            "nivel_tarifa": pricing.get("nivel_tarifa"),
+        }
+
+    @staticmethod
+    def _sumas(filas: List[dict]):
+        return (
+            sum(float(f.get("base_linea") or 0) for f in filas),
+            sum(float(f.get("iva_importe") or 0) for f in filas),
+            sum(float(f.get("total_linea") or 0) for f in filas),
+        )
+
+    def _aplicar_delta(self, presupuestoid: int, antes: List[dict], despues: List[dict]) -> float:
+        # O(1) en BD: solo se suma la diferencia de las lineas tocadas
+        b0, i0, t0 = self._sumas(antes)
+        b1, i1, t1 = self._sumas(despues)
+        total = self.repo.aplicar_delta_totales(
+            presupuestoid, round(b1 - b0, 2), round(i1 - i0, 2), round(t1 - t0, 2)
+        )
+        return float(total or 0.0)
 
     # Expuesto para UI (datos básicos de cliente)
     def cliente_basico(self, clienteid: int) -> Optional[dict]:
@@ -0,0 +1,453 @@
+# backend/app/services/tarifa_index.py
+"""
+Indice en memoria de reglas de tarifa (tarifa_regla + tarifa + cliente_tarifa).
+
+Se construye una vez por proceso y resuelve la jerarquia de _resolve_tarifa
+con busquedas por hash en lugar de recorrer todas las reglas:
+  1) producto+cliente  -> (clienteid, productoid)
+  2) familia+cliente   -> (clienteid, familiaid)
+  3) producto+grupo    -> (grupoid, productoid)
+  4) familia+grupo     -> (grupoid, familiaid)
+  5) cliente_tarifa    -> clienteid
+Cada clave guarda sus reglas ordenadas por fecha_inicio para cortar por fecha
+con bisect. Las tarifas se unen al construir, asi que no hay round-trips.
+
+TarifasService parchea el indice al crear/editar/borrar reglas. Los cambios
+hechos por otra via suben tarifa_version (backend/sql/tarifa_version.sql):
+cada _VERSION_SEGUNDOS un hilo de fondo lo consulta y recarga si cambia.
+Ademas se reconstruye por TTL. Las recargas y los parches leen la base sin
+bloquear a las consultas: construyen un indice nuevo y lo intercambian.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_TTL_SEGUNDOS = 300
+_VERSION_SEGUNDOS = 10
+_PAGE = 1000
+# Tabla tarifa_version inexistente (migracion sin aplicar)
+_ERRORES_VERSION = {"PGRST205", "42P01"}
+
+log = logging.getLogger(__name__)
+
+NIVELES = ("producto+cliente", "familia+cliente", "producto+grupo", "familia+grupo")
+
+
+def _codigo_error(e: Exception) -> Optional[str]:
+    code = getattr(e, "code", None)
+    if not code and getattr(e, "args", None) and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
+
+
+def _is_active_window(row: Dict[str, Any], fecha_iso: str) -> bool:
+    fi = row.get("fecha_inicio")
+    ff = row.get("fecha_fin")
+    if fi and fi > fecha_iso:
+        return False
+    if ff and ff < fecha_iso:
+        return False
+    return True
+
+
+def tarifa_fallback() -> Dict[str, Any]:
+    return {
+        "nivel_tarifa": "fallback_general",
+        "tarifaid": 5,
+        "tarifa_aplicada": "Tarifa General",
+        "descuento_pct": 5.0,
+        "regla_id": None,
+    }
+
+
+def _productos_regla(r: Dict[str, Any]) -> set:
+    # Mismo criterio que _regla_producto: cualquiera de los tres campos
+    return {r.get("catalogo_productoid"), r.get("catalogo_productoid_viejo"), r.get("productoid")}
+
+
+def _claves_regla(r: Dict[str, Any]) -> Iterable[Tuple[str, Tuple[Any, Any]]]:
+    for pid in _productos_regla(r):
+        yield "producto+cliente", (r.get("clienteid"), pid)
+        yield "producto+grupo", (r.get("idgrupo"), pid)
+    yield "familia+cliente", (r.get("clienteid"), r.get("familia_productoid"))
+    yield "familia+grupo", (r.get("idgrupo"), r.get("familia_productoid"))
+
+
+def _fecha_txt(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    return v.isoformat() if hasattr(v, "isoformat") else str(v)
+
+
+class _Intervalos:
+    """Reglas de una clave ordenadas por fecha_inicio (None = desde siempre)."""
+
+    __slots__ = ("inicios", "entradas")
+
+    def __init__(self, entradas: List[Dict[str, Any]]):
+        self.entradas = sorted(entradas, key=lambda e: e["fecha_inicio"] or "")
+        self.inicios = [e["fecha_inicio"] or "" for e in self.entradas]
+
+    def vigentes(self, fecha_iso: str) -> List[Dict[str, Any]]:
+        hasta = bisect_right(self.inicios, fecha_iso)
+        return [
+            e for e in self.entradas[:hasta]
+            if not e["fecha_fin"] or e["fecha_fin"] >= fecha_iso
+        ]
+
+
+class TarifaReglaIndex:
+    def __init__(
+        self,
+        reglas: List[Dict[str, Any]],
+        tarifas: Dict[int, Dict[str, Any]],
+        cliente_tarifas: List[Dict[str, Any]],
+    ):
+        self.reglas: Dict[int, Dict[str, Any]] = {
+            r["tarifa_reglaid"]: r for r in reglas if r.get("habilitada") and r.get("tarifa_reglaid") is not None
+        }
+        self.tarifas = dict(tarifas)
+        self.cliente_tarifas: Dict[Any, List[Dict[str, Any]]] = {}
+        for c in cliente_tarifas:
+            self.cliente_tarifas.setdefault(c.get("clienteid"), []).append(c)
+        self.creado_en = time.monotonic()
+        self.version: Optional[int] = None
+        self._compilar()
+
+    # -----------------------------
+    # Construccion
+    # -----------------------------
+    def _compilar(self):
+        por_nivel: Dict[str, Dict[Tuple[Any, Any], List[Dict[str, Any]]]] = {n: {} for n in NIVELES}
+        inicios_fin: List[Tuple[str, str]] = []
+
+        for r in self.reglas.values():
+            fi = _fecha_txt(r.get("fecha_inicio"))
+            ff = _fecha_txt(r.get("fecha_fin"))
+            inicios_fin.append((fi or "", ff or "9999-12-31"))
+
+            t = self.tarifas.get(r.get("tarifaid"))
+            if not t or not t.get("habilitada"):
+                # La regla cuenta como vigente, pero nunca gana (igual que el motor)
+                continue
+            entrada = {
+                "tarifaid": t["tarifaid"],
+                "tarifa_aplicada": t["nombre"],
+                "descuento_pct": float(t.get("descuento_pct") or 0.0),
+                "regla_id": r["tarifa_reglaid"],
+                "fecha_inicio": fi,
+                "fecha_fin": ff,
+                "prioridad": r.get("prioridad") or 999,
+            }
+            for nivel, clave in _claves_regla(r):
+                por_nivel[nivel].setdefault(clave, []).append(entrada)
+
+        self._niveles = {
+            nivel: {clave: _Intervalos(entradas) for clave, entradas in claves.items()}
+            for nivel, claves in por_nivel.items()
+        }
+
+        # Para saber en O(log n) si hay alguna regla vigente en una fecha
+        inicios_fin.sort()
+        self._inicios = [fi for fi, _ in inicios_fin]
+        self._max_fin = []
+        acumulado = ""
+        for _, ff in inicios_fin:
+            acumulado = max(acumulado, ff)
+            self._max_fin.append(acumulado)
+
+    def hay_reglas_vigentes(self, fecha_iso: str) -> bool:
+        hasta = bisect_right(self._inicios, fecha_iso)
+        return hasta > 0 and self._max_fin[hasta - 1] >= fecha_iso
+
+    # -----------------------------
+    # Consultas
+    # -----------------------------
+    def candidatas(self, nivel: str, clave: Tuple[Any, Any], fecha_iso: str) -> List[Dict[str, Any]]:
+        intervalos = self._niveles[nivel].get(clave)
+        return intervalos.vigentes(fecha_iso) if intervalos else []
+
+    @staticmethod
+    def mejor(candidatas: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not candidatas:
+            return None
+        return min(candidatas, key=lambda x: (-x["descuento_pct"], x["fecha_inicio"] or "", x["prioridad"]))
+
+    def tarifa_cliente(self, clienteid: Optional[int], fecha_iso: str) -> Optional[Dict[str, Any]]:
+        cts = [
+            c for c in self.cliente_tarifas.get(clienteid, [])
+            if _is_active_window(
+                {"fecha_inicio": _fecha_txt(c.get("fecha_desde")), "fecha_fin": _fecha_txt(c.get("fecha_hasta"))},
+                fecha_iso,
+            )
+        ]
+        if not cts:
+            return None
+        t = self.tarifas.get(cts[0].get("tarifaid"))
+        if not t or not t.get("habilitada"):
+            return None
+        return {
+            "nivel_tarifa": "cliente_tarifa",
+            "tarifaid": t["tarifaid"],
+            "tarifa_aplicada": t["nombre"],
+            "descuento_pct": float(t.get("descuento_pct") or 0.0),
+            "regla_id": None,
+        }
+
+    def resolver(
+        self,
+        fecha_iso: str,
+        *,
+        clienteid: Optional[int],
+        grupoid: Optional[int],
+        productoid: Optional[int],
+        familiaid: Optional[int],
+    ) -> Dict[str, Any]:
+        if not self.hay_reglas_vigentes(fecha_iso):
+            return tarifa_fallback()
+
+        claves = {
+            "producto+cliente": (clienteid, productoid),
+            "familia+cliente": (clienteid, familiaid),
+            "producto+grupo": (grupoid, productoid),
+            "familia+grupo": (grupoid, familiaid),
+        }
+        for nivel in NIVELES:
+            best = self.mejor(self.candidatas(nivel, claves[nivel], fecha_iso))
+            if best:
+                return {"nivel_tarifa": nivel, **best}
+
+        return self.tarifa_cliente(clienteid, fecha_iso) or tarifa_fallback()
+
+    # -----------------------------
+    # Parches (sin round-trips salvo tarifa desconocida)
+    # -----------------------------
+    def _tarifas_con(self, tarifa: Optional[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        if not tarifa:
+            return self.tarifas
+        return {**self.tarifas, tarifa["tarifaid"]: tarifa}
+
+    def con_regla(self, regla: Dict[str, Any], tarifa: Optional[Dict[str, Any]] = None) -> "TarifaReglaIndex":
+        reglas = dict(self.reglas)
+        reglas.pop(regla.get("tarifa_reglaid"), None)
+        if regla.get("habilitada"):
+            reglas[regla["tarifa_reglaid"]] = regla
+        return TarifaReglaIndex(list(reglas.values()), self._tarifas_con(tarifa), self._cliente_tarifas_planas())
+
+    def sin_regla(self, reglaid: int) -> "TarifaReglaIndex":
+        reglas = {k: v for k, v in self.reglas.items() if k != reglaid}
+        return TarifaReglaIndex(list(reglas.values()), self.tarifas, self._cliente_tarifas_planas())
+
+    def con_cliente_tarifa(self, fila: Dict[str, Any], tarifa: Optional[Dict[str, Any]] = None) -> "TarifaReglaIndex":
+        return TarifaReglaIndex(
+            list(self.reglas.values()), self._tarifas_con(tarifa), self._cliente_tarifas_planas() + [fila]
+        )
+
+    def _cliente_tarifas_planas(self) -> List[Dict[str, Any]]:
+        return [c for cts in self.cliente_tarifas.values() for c in cts]
+
+
+# -----------------------------
+# Carga y cache de proceso
+# -----------------------------
+def _fetch_all(supabase, table: str, columns: str, *, filtro: Optional[Tuple[str, Any]] = None, order: str) -> List[dict]:
+    rows: List[dict] = []
+    start = 0
+    while True:
+        q = supabase.table(table).select(columns)
+        if filtro:
+            q = q.eq(*filtro)
+        chunk = q.order(order).range(start, start + _PAGE - 1).execute().data or []
+        rows.extend(chunk)
+        if len(chunk) < _PAGE:
+            return rows
+        start += _PAGE
+
+
+def _leer_version(supabase) -> Optional[int]:
+    global _CON_VERSION
+    if not _CON_VERSION:
+        return None
+    try:
+        fila = (
+            supabase.table("tarifa_version")
+            .select("version")
+            .eq("id", 1)
+            .maybe_single()
+            .execute()
+        )
+    except Exception as e:
+        if _codigo_error(e) in _ERRORES_VERSION:
+            # Sin la migracion: solo recargas por TTL
+            _CON_VERSION = False
+        return None
+    data = getattr(fila, "data", None) or {}
+    return data.get("version")
+
+
+def cargar_tarifa_index(supabase) -> TarifaReglaIndex:
+    # La version se lee antes que los datos: un cambio durante la carga provoca otra
+    version = _leer_version(supabase)
+    try:
+        reglas = _fetch_all(supabase, "tarifa_regla", "*", filtro=("habilitada", True), order="tarifa_reglaid")
+    except Exception:
+        reglas = []
+    try:
+        tarifas = {
+            t["tarifaid"]: t
+            for t in _fetch_all(supabase, "tarifa", "tarifaid, nombre, descuento_pct, habilitada", order="tarifaid")
+        }
+    except Exception:
+        tarifas = {}
+    try:
+        cts = _fetch_all(
+            supabase,
+            "cliente_tarifa",
+            "clienteid, tarifaid, fecha_desde, fecha_hasta",
+            order="clienteid",
+        )
+    except Exception:
+        cts = []
+    idx = TarifaReglaIndex(reglas, tarifas, cts)
+    idx.version = version
+    return idx
+
+
+_INDEX: Optional[TarifaReglaIndex] = None
+# _LOCK solo protege el intercambio de _INDEX (nunca se tiene durante I/O);
+# _CARGA serializa las cargas completas
+_LOCK = threading.Lock()
+_CARGA = threading.Lock()
+_CON_VERSION = True
+_COMPROBADO_EN = 0.0
+_REFRESCANDO = False
+
+
+def get_tarifa_index(supabase) -> TarifaReglaIndex:
+    """
+    Indice vigente. Solo la primera carga es sincrona; despues, si vence el
+    TTL o toca mirar la version, se refresca en segundo plano y mientras
+    tanto se sigue sirviendo el indice actual.
+    """
+    global _INDEX
+    idx = _INDEX
+    if idx is None:
+        with _CARGA:
+            idx = _INDEX
+            if idx is None:
+                idx = cargar_tarifa_index(supabase)
+                with _LOCK:
+                    _INDEX = idx
+        return idx
+    ahora = time.monotonic()
+    if ahora - idx.creado_en >= _TTL_SEGUNDOS or (_CON_VERSION and ahora - _COMPROBADO_EN >= _VERSION_SEGUNDOS):
+        _lanzar_refresco(supabase)
+    return idx
+
+
+def _lanzar_refresco(supabase):
+    global _REFRESCANDO, _COMPROBADO_EN
+    with _LOCK:
+        if _REFRESCANDO:
+            return
+        _REFRESCANDO = True
+        _COMPROBADO_EN = time.monotonic()
+    threading.Thread(target=_refrescar, args=(supabase,), name="tarifa_index", daemon=True).start()
+
+
+def _refrescar(supabase):
+    global _INDEX, _REFRESCANDO, _COMPROBADO_EN
+    try:
+        with _CARGA:
+            idx = _INDEX
+            if idx is None:
+                return
+            vencido = time.monotonic() - idx.creado_en >= _TTL_SEGUNDOS
+            version = _leer_version(supabase)
+            if not vencido and (version is None or version == idx.version):
+                return
+            nuevo = cargar_tarifa_index(supabase)
+            with _LOCK:
+                _INDEX = nuevo
+    except Exception:
+        log.exception("No se pudo refrescar el indice de tarifas")
+    finally:
+        _COMPROBADO_EN = time.monotonic()
+        _REFRESCANDO = False
+
+
+def recargar_tarifa_index(supabase) -> TarifaReglaIndex:
+    """Recarga sincrona (POST /api/tarifas/indice/recargar): para escritores fuera de la API."""
+    global _INDEX
+    with _CARGA:
+        idx = cargar_tarifa_index(supabase)
+        with _LOCK:
+            _INDEX = idx
+    return idx
+
+
+def invalidar_tarifa_index():
+    """Descarta el indice: la siguiente consulta lo reconstruye entero."""
+    global _INDEX
+    with _LOCK:
+        _INDEX = None
+
+
+def _leer_tarifa(supabase, tarifaid: Optional[int]) -> Optional[Dict[str, Any]]:
+    idx = _INDEX
+    if tarifaid is None or idx is None or tarifaid in idx.tarifas:
+        return None
+    try:
+        return (
+            supabase.table("tarifa")
+            .select("tarifaid, nombre, descuento_pct, habilitada")
+            .eq("tarifaid", tarifaid)
+            .maybe_single()
+            .execute()
+            .data
+        )
+    except Exception:
+        return None
+
+
+def _parchear(fn):
+    """
+    Aplica fn (solo CPU) sobre el indice vigente fuera del lock y lo
+    intercambia si nadie lo ha cambiado entretanto; si no, reintenta sobre
+    el nuevo.
+    """
+    global _INDEX
+    while True:
+        base = _INDEX
+        if base is None:
+            # Nada cargado aun: la siguiente consulta construira el indice completo
+            return
+        nuevo = fn(base)
+        nuevo.creado_en = base.creado_en
+        nuevo.version = base.version
+        with _LOCK:
+            if _INDEX is base:
+                _INDEX = nuevo
+                return
+
+
+def aplicar_regla(supabase, regla: Optional[Dict[str, Any]]):
+    if not regla or regla.get("tarifa_reglaid") is None:
+        invalidar_tarifa_index()
+        return
+    tarifa = _leer_tarifa(supabase, regla.get("tarifaid"))
+    _parchear(lambda idx: idx.con_regla(regla, tarifa))
+
+
+def quitar_regla(reglaid: int):
+    _parchear(lambda idx: idx.sin_regla(reglaid))
+
+
+def aplicar_cliente_tarifa(supabase, fila: Optional[Dict[str, Any]]):
+    if not fila:
+        invalidar_tarifa_index()
+        return
+    tarifa = _leer_tarifa(supabase, fila.get("tarifaid"))
+    _parchear(lambda idx: idx.con_cliente_tarifa(fila, tarifa))
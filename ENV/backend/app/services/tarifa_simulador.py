@@ -0,0 +1,192 @@
+# backend/app/services/tarifa_simulador.py
+"""
+Simulador what-if de tarifas sobre lineas historicas de albaran.
+
+Re-precia albaran_linea con las reglas actuales y con las reglas propuestas
+(en memoria, sin tocar la BD) y agrega los importes sin IVA por cliente,
+grupo y familia. La jerarquia se resuelve por lotes con precio_vectorizado.
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.app.schemas.tarifa import SimulacionCambio
+from backend.app.services.precio_engine import _fetch_clientes_ctx, _fetch_productos_ctx
+from backend.app.services.precio_vectorizado import calcular_importes, resolver_tarifas
+from backend.app.services.tarifa_index import get_tarifa_index
+
+_PAGE = 1000
+
+_COLUMNAS = ["linea_id", "producto_id", "cantidad", "precio", "subtotal", "clienteid", "fecha"]
+
+
+# -----------------------------
+# Carga de lineas historicas
+# -----------------------------
+def _fetch_lineas_albaran(
+    supabase, desde: date, hasta: date, clienteid: Optional[int] = None
+) -> pd.DataFrame:
+    rows: List[dict] = []
+    start = 0
+    while True:
+        q = (
+            supabase.table("albaran_linea")
+            .select("linea_id, producto_id, cantidad, precio, subtotal, albaran!inner(clienteid, fecha_albaran)")
+            .gte("albaran.fecha_albaran", desde.isoformat())
+            .lt("albaran.fecha_albaran", (hasta + timedelta(days=1)).isoformat())
+        )
+        if clienteid:
+            q = q.eq("albaran.clienteid", clienteid)
+        chunk = q.order("linea_id").range(start, start + _PAGE - 1).execute().data or []
+        for r in chunk:
+            alb = r.pop("albaran", None) or {}
+            r["clienteid"] = alb.get("clienteid")
+            r["fecha"] = (alb.get("fecha_albaran") or "")[:10] or None
+        rows.extend(chunk)
+        if len(chunk) < _PAGE:
+            break
+        start += _PAGE
+    return pd.DataFrame(rows, columns=_COLUMNAS)
+
+
+# -----------------------------
+# Reglas propuestas
+# -----------------------------
+def _iso(v: Any) -> Any:
+    return v.isoformat() if hasattr(v, "isoformat") else v
+
+
+def aplicar_cambios(reglas: List[Dict[str, Any]], cambios: List[SimulacionCambio]) -> List[Dict[str, Any]]:
+    """Devuelve una copia de las reglas con los cambios aplicados (ids negativos para las nuevas)."""
+    out = {r["tarifa_reglaid"]: dict(r) for r in reglas if r.get("tarifa_reglaid") is not None}
+    nuevo_id = -1
+    for c in cambios:
+        if c.accion == "borrar":
+            out.pop(c.tarifa_reglaid, None)
+        elif c.accion == "actualizar":
+            regla = out.get(c.tarifa_reglaid)
+            if regla is None:
+                raise ValueError(f"Regla {c.tarifa_reglaid} no encontrada")
+            if c.cambios:
+                regla.update({k: _iso(v) for k, v in c.cambios.dict(exclude_unset=True).items()})
+        else:
+            regla = {k: _iso(v) for k, v in c.nueva.dict(exclude_none=True).items()}
+            # Mismo mapeo que TarifasService.crear_regla
+            if regla.get("grupoid") and not regla.get("idgrupo"):
+                regla["idgrupo"] = regla.get("grupoid")
+            if regla.get("productoid") and not regla.get("catalogo_productoid"):
+                regla["catalogo_productoid"] = regla.get("productoid")
+            regla["tarifa_reglaid"] = nuevo_id
+            out[nuevo_id] = regla
+            nuevo_id -= 1
+    return list(out.values())
+
+
+# -----------------------------
+# Simulacion
+# -----------------------------
+def _agregar(df: pd.DataFrame, clave: Optional[str]) -> List[Dict[str, Any]]:
+    g = (
+        df.groupby(clave, dropna=False) if clave else df.groupby(np.zeros(len(df), dtype=int))
+    ).agg(
+        lineas=("actual", "size"),
+        total_historico=("historico", "sum"),
+        total_actual=("actual", "sum"),
+        total_simulado=("simulado", "sum"),
+    )
+    g["diferencia"] = g["total_simulado"] - g["total_actual"]
+    g = g.reindex(g["diferencia"].abs().sort_values(ascending=False, kind="mergesort").index)
+
+    out = []
+    for k, r in g.iterrows():
+        actual = round(float(r["total_actual"]), 2)
+        diferencia = round(float(r["diferencia"]), 2)
+        out.append(
+            {
+                "clave": None if not clave or pd.isna(k) else int(k),
+                "lineas": int(r["lineas"]),
+                "total_historico": round(float(r["total_historico"]), 2),
+                "total_actual": actual,
+                "total_simulado": round(float(r["total_simulado"]), 2),
+                "diferencia": diferencia,
+                "diferencia_pct": round(diferencia / actual * 100.0, 2) if actual else None,
+            }
+        )
+    return out
+
+
+def simular_tarifas(
+    supabase,
+    reglas_actuales: List[Dict[str, Any]],
+    cambios: List[SimulacionCambio],
+    *,
+    desde: date,
+    hasta: date,
+    clienteid: Optional[int] = None,
+) -> Dict[str, Any]:
+    if desde > hasta:
+        raise ValueError("fecha_desde no puede ser posterior a fecha_hasta")
+
+    reglas_nuevas = aplicar_cambios(reglas_actuales, cambios)
+    idx = get_tarifa_index(supabase)
+    cliente_tarifas = idx._cliente_tarifas_planas()
+
+    df = _fetch_lineas_albaran(supabase, desde, hasta, clienteid)
+
+    clientes = _fetch_clientes_ctx(supabase, df["clienteid"].dropna().unique())
+    productos = _fetch_productos_ctx(supabase, df["producto_id"].dropna().unique())
+    grupo_de = pd.Series({k: v["grupoid"] for k, v in clientes.items()}, dtype="float64")
+    familia_de = pd.Series({k: v["familia_productoid"] for k, v in productos.items()}, dtype="float64")
+    pvp_de = pd.Series({k: v["precio_generico"] for k, v in productos.items()}, dtype="float64")
+
+    lineas = pd.DataFrame(
+        {
+            "clienteid": df["clienteid"],
+            "grupoid": df["clienteid"].map(grupo_de).fillna(0),
+            "productoid": df["producto_id"],
+            "familiaid": df["producto_id"].map(familia_de),
+            "fecha": df["fecha"],
+        }
+    )
+
+    precio = pd.to_numeric(df["precio"], errors="coerce")
+    unit_bruto = precio.where(precio.fillna(0) != 0, df["producto_id"].map(pvp_de)).fillna(0.0).to_numpy()
+    cantidad = pd.to_numeric(df["cantidad"], errors="coerce").fillna(1.0).to_numpy()
+    sin_iva = np.zeros(len(df))
+
+    actual = resolver_tarifas(lineas, reglas_actuales, idx.tarifas, cliente_tarifas)
+    simulada = resolver_tarifas(lineas, reglas_nuevas, idx.tarifas, cliente_tarifas)
+
+    res = pd.DataFrame(
+        {
+            "clienteid": lineas["clienteid"],
+            "grupoid": lineas["grupoid"],
+            "familiaid": lineas["familiaid"],
+            "historico": pd.to_numeric(df["subtotal"], errors="coerce").fillna(0.0),
+            "actual": calcular_importes(unit_bruto, cantidad, actual["descuento_pct"], sin_iva)["subtotal_sin_iva"],
+            "simulado": calcular_importes(unit_bruto, cantidad, simulada["descuento_pct"], sin_iva)[
+                "subtotal_sin_iva"
+            ],
+        }
+    )
+
+    if res.empty:
+        vacio = {
+            "clave": None,
+            "lineas": 0,
+            "total_historico": 0.0,
+            "total_actual": 0.0,
+            "total_simulado": 0.0,
+            "diferencia": 0.0,
+            "diferencia_pct": None,
+        }
+        return {"resumen": vacio, "por_cliente": [], "por_grupo": [], "por_familia": []}
+
+    return {
+        "resumen": _agregar(res, None)[0],
+        "por_cliente": _agregar(res, "clienteid"),
+        "por_grupo": _agregar(res, "grupoid"),
+        "por_familia": _agregar(res, "familiaid"),
+    }
@@ -6,15 +6,28 @@ from backend.app.repositories.tarifas_repo import TarifasRepository
 from backend.app.schemas.tarifa import (
     CatalogoItem,
     ClienteTarifaCreate,
+    PrecioBatchRequest,
+    PrecioBatchResponse,
     PrecioRequest,
     PrecioResponse,
+    SimulacionRequest,
+    SimulacionResponse,
     TarifaCatalogos,
     TarifaReglaCreate,
     TarifaReglaListResponse,
     TarifaReglaOut,
     TarifaReglaUpdate,
 )
-from backend.app.services.precio_engine import calcular_precio_linea
+from backend.app.services.impuesto_resolver import recargar_impuestos
+from backend.app.services.precio_engine import calcular_precio_linea, calcular_precios_lineas
+from backend.app.services.precio_vectorizado import lista_precios_cliente
+from backend.app.services.tarifa_simulador import simular_tarifas
+from backend.app.services.tarifa_index import (
+    aplicar_cliente_tarifa,
+    aplicar_regla,
+    quitar_regla,
+    recargar_tarifa_index,
+)
 
 
 class TarifasService:
@@ -163,6 +176,7 @@ class TarifasService:
                     payload["tarifa_regla_tipoid"] = tipo_id
 
         created = self.repo.insert_regla(payload)
+        aplicar_regla(self.repo.supabase, created)
         return TarifaReglaOut(**created)
 
     def actualizar_regla(self, reglaid: int, data: TarifaReglaUpdate) -> TarifaReglaOut:
@@ -170,17 +184,32 @@ class TarifasService:
         updated = self.repo.update_regla(reglaid, payload)
         if not updated:
             raise ValueError("Regla no encontrada")
+        aplicar_regla(self.repo.supabase, updated)
         return TarifaReglaOut(**updated)
 
     def borrar_regla(self, reglaid: int):
         self.repo.delete_regla(reglaid)
+        quitar_regla(reglaid)
 
     # -----------------------------
     # cliente_tarifa (general)
     # -----------------------------
     def asignar_cliente_tarifa(self, data: ClienteTarifaCreate) -> dict:
         payload = data.dict(exclude_none=True)
-        return self.repo.insert_cliente_tarifa(payload)
+        row = self.repo.insert_cliente_tarifa(payload)
+        aplicar_cliente_tarifa(self.repo.supabase, row)
+        return row
+
+    # -----------------------------
+    # Impuestos (resolver en cache)
+    # -----------------------------
+    def recargar_impuestos(self) -> dict:
+        resolver = recargar_impuestos(self.repo.supabase)
+        return {"ok": True, "impuestos": len(resolver.filas)}
+
+    def recargar_tarifas(self) -> dict:
+        idx = recargar_tarifa_index(self.repo.supabase)
+        return {"ok": True, "reglas": len(idx.reglas)}
 
     # -----------------------------
     # Calculo de precio (motor centralizado)
@@ -193,5 +222,36 @@ class TarifasService:
             precio_base_unit=req.precio_base_unit,
             cantidad=req.cantidad,
             fecha=req.fecha,
+            concurrente=True,
         )
         return PrecioResponse(**res)
+
+    def calcular_precios(self, req: PrecioBatchRequest) -> PrecioBatchResponse:
+        res = calcular_precios_lineas(
+            self.repo.supabase,
+            [ln.dict() for ln in req.lineas],
+        )
+        data = [PrecioResponse(**r) for r in res]
+        return PrecioBatchResponse(data=data, total=len(data))
+
+    # -----------------------------
+    # Lista de precios (catalogo completo, vectorizado)
+    # -----------------------------
+    def lista_precios(self, clienteid: int, fecha: Optional[date] = None):
+        if not self.repo.cliente_existe(clienteid):
+            raise ValueError("Cliente no encontrado")
+        return lista_precios_cliente(self.repo.supabase, clienteid, fecha)
+
+    # -----------------------------
+    # Simulador what-if sobre albaranes
+    # -----------------------------
+    def simular(self, req: SimulacionRequest) -> SimulacionResponse:
+        res = simular_tarifas(
+            self.repo.supabase,
+            self.repo.list_reglas(),
+            req.cambios,
+            desde=req.fecha_desde,
+            hasta=req.fecha_hasta,
+            clienteid=req.clienteid,
+        )
+        return SimulacionResponse(**res)
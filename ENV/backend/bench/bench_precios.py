@@ -0,0 +1,259 @@
+# backend/bench/bench_precios.py
+"""
+Benchmark del camino de precios contra un Supabase falso en memoria.
+
+Mide lineas/segundo y consultas/linea de:
+  - calcular_precio_linea (una llamada por linea, secuencial y concurrente)
+  - PresupuestosService.recalcular_lineas
+  - PedidosService.recalcular_totales
+con 1, 50 y 500 lineas, y falla (exit 1) si se superan los umbrales.
+
+Uso (desde ENV):
+  python -m backend.bench.bench_precios
+  python -m backend.bench.bench_precios --latencia-ms 5 --tamanos 1,50,500,2000
+  python -m backend.bench.bench_precios --json informe.json --sin-umbrales
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import date
+from typing import Callable, Dict, List
+
+from backend.app.repositories.pedidos_repo import PedidosRepository
+from backend.app.repositories.presupuestos_repo import PresupuestosRepository
+from backend.app.services.impuesto_resolver import get_impuesto_resolver, invalidar_impuestos
+from backend.app.services.pedidos_service import PedidosService
+from backend.app.services.precio_engine import calcular_precio_linea
+from backend.app.services.presupuestos_service import PresupuestosService
+from backend.app.services.tarifa_index import get_tarifa_index, invalidar_tarifa_index
+from backend.bench.fake_supabase import FakeSupabase
+
+# Umbrales por escenario; se comprueban a partir de UMBRAL_DESDE lineas
+# (con 1 linea dominan las consultas fijas de cabecera)
+UMBRAL_DESDE = 50
+UMBRALES: Dict[str, Dict[str, float]] = {
+    "calcular_precio_linea": {"max_consultas_linea": 4.5, "min_lineas_s": 40.0},
+    "calcular_precio_linea[concurrente]": {"max_consultas_linea": 4.5, "min_lineas_s": 80.0},
+    "presupuestos.recalcular_lineas": {"max_consultas_linea": 0.25, "min_lineas_s": 500.0},
+    "pedidos.recalcular_totales": {"max_consultas_linea": 0.25, "min_lineas_s": 500.0},
+}
+
+CLAVES = {
+    "presupuesto": "presupuesto_id",
+    "presupuesto_linea": "presupuesto_linea_id",
+    "presupuesto_totales": "presupuesto_id",
+    "pedido": "pedidoid",
+    "pedido_detalle": "pedido_detalleid",
+    "pedido_totales": "pedidoid",
+}
+
+N_PRODUCTOS = 600
+N_CLIENTES = 40
+FECHA = date(2025, 6, 1)
+
+
+# -----------------------------
+# Datos sinteticos
+# -----------------------------
+def dataset() -> Dict[str, List[dict]]:
+    tablas: Dict[str, List[dict]] = {
+        "cliente": [{"clienteid": c, "idgrupo": c % 4 or None} for c in range(1, N_CLIENTES + 1)],
+        "clientes_direccion": [
+            {"clientes_direccionid": c, "idtercero": c, "idpais": "ES" if c % 5 else "PT"}
+            for c in range(1, N_CLIENTES + 1)
+        ],
+        "producto_tipo": [{"producto_tipoid": t, "nombre": f"Tipo {t}"} for t in (1, 2, 3)],
+        "producto": [
+            {
+                "catalogo_productoid": p,
+                "producto_familiaid": 100 + p % 12,
+                "pvp": round(5 + (p % 37) * 1.25, 2),
+                "producto_tipoid": p % 3 + 1,
+            }
+            for p in range(1, N_PRODUCTOS + 1)
+        ],
+        "impuesto": [
+            {"impuestoid": 1, "impuesto_nombre": "IVA general", "tasa_pct": 21, "ambito": "ES",
+             "producto_tipoid": None, "habilitado": True, "fecha_inicio": "2012-09-01", "fecha_fin": None},
+            {"impuestoid": 2, "impuesto_nombre": "IVA superreducido", "tasa_pct": 4, "ambito": "ES",
+             "producto_tipoid": 1, "habilitado": True, "fecha_inicio": "2012-09-01", "fecha_fin": None},
+            {"impuestoid": 3, "impuesto_nombre": "IVA PT", "tasa_pct": 23, "ambito": "PT",
+             "producto_tipoid": None, "habilitado": True, "fecha_inicio": None, "fecha_fin": None},
+        ],
+        "tarifa": [
+            {"tarifaid": t, "nombre": f"Tarifa {t}", "descuento_pct": 5.0 * t, "habilitada": True}
+            for t in range(1, 6)
+        ],
+        "cliente_tarifa": [
+            {"clienteid": c, "tarifaid": 2, "fecha_desde": "2020-01-01", "fecha_hasta": None}
+            for c in range(1, N_CLIENTES + 1, 3)
+        ],
+    }
+    reglas = []
+    for i in range(1, 301):
+        reglas.append(
+            {
+                "tarifa_reglaid": i,
+                "tarifaid": i % 5 + 1,
+                "clienteid": (i % N_CLIENTES) + 1 if i % 2 else None,
+                "idgrupo": None if i % 2 else i % 4,
+                "catalogo_productoid": (i * 7) % N_PRODUCTOS + 1 if i % 3 else None,
+                "familia_productoid": None if i % 3 else 100 + i % 12,
+                "fecha_inicio": "2024-01-01" if i % 4 else "2025-01-01",
+                "fecha_fin": None if i % 5 else "2025-12-31",
+                "prioridad": i % 3 + 1,
+                "habilitada": True,
+            }
+        )
+    tablas["tarifa_regla"] = reglas
+    return tablas
+
+
+def _lineas(n: int) -> List[tuple]:
+    return [((i % N_CLIENTES) + 1, (i * 13) % N_PRODUCTOS + 1, i % 4 + 1) for i in range(n)]
+
+
+# -----------------------------
+# Escenarios
+# -----------------------------
+def _esc_calcular_precio_linea(db: FakeSupabase, n: int) -> Callable[[], None]:
+    lineas = _lineas(n)
+
+    def run():
+        for clienteid, productoid, cantidad in lineas:
+            calcular_precio_linea(db, clienteid=clienteid, productoid=productoid, cantidad=cantidad, fecha=FECHA)
+
+    return run
+
+
+def _esc_calcular_precio_linea_concurrente(db: FakeSupabase, n: int) -> Callable[[], None]:
+    lineas = _lineas(n)
+
+    def run():
+        for clienteid, productoid, cantidad in lineas:
+            calcular_precio_linea(
+                db, clienteid=clienteid, productoid=productoid, cantidad=cantidad, fecha=FECHA, concurrente=True
+            )
+
+    return run
+
+
+def _esc_recalcular_presupuesto(db: FakeSupabase, n: int) -> Callable[[], None]:
+    db.tablas["presupuesto"] = [
+        {"presupuesto_id": 1, "numero": "PRES-BENCH-0001", "clienteid": 7, "fecha_presupuesto": FECHA.isoformat(),
+         "fecha_validez": FECHA.isoformat(), "editable": True, "total_estimada": 0.0}
+    ]
+    db.tablas["presupuesto_linea"] = [
+        {"presupuesto_linea_id": i + 1, "presupuesto_id": 1, "producto_id": productoid,
+         "descripcion": f"Producto {productoid}", "cantidad": cantidad}
+        for i, (_, productoid, cantidad) in enumerate(_lineas(n))
+    ]
+    svc = PresupuestosService(PresupuestosRepository(db))
+    return lambda: svc.recalcular_lineas(1, fecha_calculo=FECHA)
+
+
+def _esc_recalcular_pedido(db: FakeSupabase, n: int) -> Callable[[], None]:
+    db.tablas["pedido"] = [{"pedidoid": 1, "numero": "PED-BENCH-0001", "clienteid": 7}]
+    db.tablas["pedido_detalle"] = [
+        {"pedido_detalleid": i + 1, "pedidoid": 1, "productoid": productoid,
+         "nombre_producto": f"Producto {productoid}", "cantidad": cantidad, "precio_unitario": None}
+        for i, (_, productoid, cantidad) in enumerate(_lineas(n))
+    ]
+    svc = PedidosService(PedidosRepository(db))
+    return lambda: svc.recalcular_totales(1)
+
+
+ESCENARIOS: Dict[str, Callable[[FakeSupabase, int], Callable[[], None]]] = {
+    "calcular_precio_linea": _esc_calcular_precio_linea,
+    "calcular_precio_linea[concurrente]": _esc_calcular_precio_linea_concurrente,
+    "presupuestos.recalcular_lineas": _esc_recalcular_presupuesto,
+    "pedidos.recalcular_totales": _esc_recalcular_pedido,
+}
+
+
+# -----------------------------
+# Ejecucion
+# -----------------------------
+def medir(nombre: str, n: int, latencia_ms: float) -> dict:
+    db = FakeSupabase(dataset(), claves=CLAVES, latencia_ms=latencia_ms)
+
+    # Caches de proceso (indice de tarifas / impuestos) calientes, como en produccion
+    invalidar_tarifa_index()
+    invalidar_impuestos()
+    get_tarifa_index(db)
+    get_impuesto_resolver(db)
+
+    run = ESCENARIOS[nombre](db, n)
+    db.reset()
+    t0 = time.perf_counter()
+    run()
+    segundos = time.perf_counter() - t0
+
+    return {
+        "escenario": nombre,
+        "lineas": n,
+        "segundos": round(segundos, 4),
+        "lineas_s": round(n / segundos, 1) if segundos else float("inf"),
+        "consultas": db.consultas,
+        "consultas_linea": round(db.consultas / n, 3),
+    }
+
+
+def comprobar(resultados: List[dict]) -> List[str]:
+    fallos = []
+    for r in resultados:
+        u = UMBRALES.get(r["escenario"])
+        if not u or r["lineas"] < UMBRAL_DESDE:
+            continue
+        if r["consultas_linea"] > u["max_consultas_linea"]:
+            fallos.append(
+                f"{r['escenario']} @ {r['lineas']}: {r['consultas_linea']} consultas/linea "
+                f"> {u['max_consultas_linea']}"
+            )
+        if r["lineas_s"] < u["min_lineas_s"]:
+            fallos.append(f"{r['escenario']} @ {r['lineas']}: {r['lineas_s']} lineas/s < {u['min_lineas_s']}")
+    return fallos
+
+
+def _imprimir(resultados: List[dict], latencia_ms: float):
+    print(f"Latencia simulada: {latencia_ms} ms/consulta")
+    print(f"{'escenario':34} {'lineas':>7} {'seg':>9} {'lineas/s':>10} {'consultas':>10} {'cons/linea':>11}")
+    for r in resultados:
+        print(
+            f"{r['escenario']:34} {r['lineas']:>7} {r['segundos']:>9.3f} {r['lineas_s']:>10.1f} "
+            f"{r['consultas']:>10} {r['consultas_linea']:>11.3f}"
+        )
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark del motor de precios (Supabase falso)")
+    ap.add_argument("--latencia-ms", type=float, default=2.0, help="latencia por consulta (ms)")
+    ap.add_argument("--tamanos", default="1,50,500", help="numero de lineas, separados por comas")
+    ap.add_argument("--escenarios", default=",".join(ESCENARIOS), help="escenarios a ejecutar")
+    ap.add_argument("--json", help="guardar el informe en este fichero")
+    ap.add_argument("--sin-umbrales", action="store_true", help="no fallar por umbrales")
+    args = ap.parse_args(argv)
+
+    tamanos = [int(x) for x in args.tamanos.split(",") if x.strip()]
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+
+    resultados = [medir(e, n, args.latencia_ms) for e in escenarios for n in tamanos]
+    fallos = [] if args.sin_umbrales else comprobar(resultados)
+
+    _imprimir(resultados, args.latencia_ms)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"latencia_ms": args.latencia_ms, "resultados": resultados, "fallos": fallos}, f, indent=2)
+
+    if fallos:
+        print("\nUMBRALES SUPERADOS:")
+        for f in fallos:
+            print(f"  - {f}")
+        return 1
+    print("\nOK: todos los escenarios dentro de umbral")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
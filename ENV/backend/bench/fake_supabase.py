@@ -0,0 +1,335 @@
+# backend/bench/fake_supabase.py
+"""
+Cliente Supabase falso en memoria para benchmarks.
+
+Imita la API encadenable de supabase-py / postgrest que usa el backend
+(table().select().eq()...execute(), insert/update/upsert/delete y rpc) sobre
+listas de dicts. Cuenta cada execute() como una consulta y puede anadir una
+latencia fija por consulta para simular el round-trip a PostgREST.
+"""
+import copy
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from postgrest.exceptions import APIError
+
+
+class FakeResponse:
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _ilike(valor: Any, patron: str) -> bool:
+    regex = "^" + ".*".join(re.escape(p) for p in str(patron).split("%")) + "$"
+    return re.match(regex, str(valor or ""), flags=re.IGNORECASE | re.DOTALL) is not None
+
+
+def _trocear(expr: str) -> List[str]:
+    """Separa por comas de primer nivel (respeta parentesis y comillas)."""
+    partes, actual, nivel, comillas, escape = [], [], 0, False, False
+    for ch in expr:
+        if escape:
+            actual.append(ch)
+            escape = False
+            continue
+        if ch == "\\" and comillas:
+            actual.append(ch)
+            escape = True
+            continue
+        if ch == '"':
+            comillas = not comillas
+        elif not comillas and ch == "(":
+            nivel += 1
+        elif not comillas and ch == ")":
+            nivel -= 1
+        elif not comillas and nivel == 0 and ch == ",":
+            partes.append("".join(actual))
+            actual = []
+            continue
+        actual.append(ch)
+    if actual:
+        partes.append("".join(actual))
+    return [p.strip() for p in partes if p.strip()]
+
+
+def _valor(raw: str) -> str:
+    if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", raw[1:-1])
+    return raw
+
+
+def _comparar(actual: Any, valor: str, op: str) -> bool:
+    if actual is None:
+        return False
+    try:
+        ref: Any = type(actual)(valor) if isinstance(actual, (int, float)) and not isinstance(actual, bool) else valor
+    except ValueError:
+        ref = valor
+    a = actual if not isinstance(ref, str) else str(actual)
+    return {"eq": a == ref, "neq": a != ref, "gt": a > ref, "gte": a >= ref, "lt": a < ref, "lte": a <= ref}[op]
+
+
+def _condicion(parte: str) -> Callable[[dict], bool]:
+    for logica in ("and", "or"):
+        if parte.startswith(f"{logica}(") and parte.endswith(")"):
+            return _logica(logica, _trocear(parte[len(logica) + 1 : -1]))
+    col, resto = parte.split(".", 1)
+    negado = resto.startswith("not.")
+    if negado:
+        resto = resto[4:]
+    op, valor = resto.split(".", 1)
+    valor = _valor(valor)
+    if op in ("ilike", "like"):
+        fn = lambda r: _ilike(r.get(col), valor.replace("*", "%"))
+    elif op == "is":
+        fn = lambda r: r.get(col) is None if valor == "null" else r.get(col) == (valor == "true")
+    else:
+        fn = lambda r: _comparar(r.get(col), valor, op)
+    return (lambda r: not fn(r)) if negado else fn
+
+
+def _logica(tipo: str, partes: List[str]) -> Callable[[dict], bool]:
+    conds = [_condicion(p) for p in partes]
+    if tipo == "and":
+        return lambda r: all(c(r) for c in conds)
+    return lambda r: any(c(r) for c in conds)
+
+
+def _sort_key(v: Any):
+    return (v is None, v if v is not None else 0)
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", tabla: str):
+        self._db = db
+        self._tabla = tabla
+        self._op = "select"
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+        self._count: Optional[str] = None
+        self._filtros: List[Callable[[dict], bool]] = []
+        self._orden: List[tuple] = []
+        self._rango: Optional[tuple] = None
+        self._limite: Optional[int] = None
+        self._uno: Optional[str] = None
+
+    # -----------------------------
+    # Operaciones
+    # -----------------------------
+    def select(self, *_columnas, count: Optional[str] = None, **_kw):
+        self._count = count
+        return self
+
+    def insert(self, data, **_kw):
+        self._op, self._payload = "insert", data
+        return self
+
+    def update(self, data, **_kw):
+        self._op, self._payload = "update", data
+        return self
+
+    def upsert(self, data, on_conflict: Optional[str] = None, **_kw):
+        self._op, self._payload, self._on_conflict = "upsert", data, on_conflict
+        return self
+
+    def delete(self, **_kw):
+        self._op = "delete"
+        return self
+
+    # -----------------------------
+    # Filtros
+    # -----------------------------
+    def _f(self, fn: Callable[[dict], bool]):
+        self._filtros.append(fn)
+        return self
+
+    def eq(self, col, v):
+        return self._f(lambda r: r.get(col) == v)
+
+    def neq(self, col, v):
+        return self._f(lambda r: r.get(col) != v)
+
+    def gt(self, col, v):
+        return self._f(lambda r: r.get(col) is not None and r.get(col) > v)
+
+    def gte(self, col, v):
+        return self._f(lambda r: r.get(col) is not None and r.get(col) >= v)
+
+    def lt(self, col, v):
+        return self._f(lambda r: r.get(col) is not None and r.get(col) < v)
+
+    def lte(self, col, v):
+        return self._f(lambda r: r.get(col) is not None and r.get(col) <= v)
+
+    def in_(self, col, valores):
+        valores = set(valores)
+        return self._f(lambda r: r.get(col) in valores)
+
+    def is_(self, col, v):
+        esperado = None if v in (None, "null") else v
+        return self._f(lambda r: r.get(col) is esperado or r.get(col) == esperado)
+
+    def ilike(self, col, patron):
+        return self._f(lambda r: _ilike(r.get(col), patron))
+
+    def like(self, col, patron):
+        return self.ilike(col, patron)
+
+    def or_(self, expr: str, **_kw):
+        cond = _logica("or", _trocear(expr))
+        return self._f(cond)
+
+    # -----------------------------
+    # Orden / paginacion
+    # -----------------------------
+    def order(self, col, desc: bool = False, **_kw):
+        self._orden.append((col, desc))
+        return self
+
+    def range(self, inicio: int, fin: int):
+        self._rango = (inicio, fin)
+        return self
+
+    def limit(self, n: int):
+        self._limite = n
+        return self
+
+    def single(self):
+        self._uno = "single"
+        return self
+
+    def maybe_single(self):
+        self._uno = "maybe"
+        return self
+
+    # -----------------------------
+    # Ejecucion
+    # -----------------------------
+    def execute(self) -> FakeResponse:
+        self._db._contar(self._tabla, self._op)
+        with self._db._lock:
+            return self._ejecutar()
+
+    def _filas(self) -> List[dict]:
+        return [r for r in self._db.tablas.setdefault(self._tabla, []) if all(f(r) for f in self._filtros)]
+
+    def _ejecutar(self) -> FakeResponse:
+        if self._op == "insert":
+            filas = self._payload if isinstance(self._payload, list) else [self._payload]
+            return FakeResponse([self._db._insertar(self._tabla, f) for f in filas])
+
+        if self._op == "upsert":
+            filas = self._payload if isinstance(self._payload, list) else [self._payload]
+            return FakeResponse([self._db._upsert(self._tabla, f, self._on_conflict) for f in filas])
+
+        if self._op == "update":
+            filas = self._filas()
+            for r in filas:
+                r.update(copy.deepcopy(self._payload))
+            return FakeResponse(copy.deepcopy(filas))
+
+        if self._op == "delete":
+            borrar = self._filas()
+            ids = {id(r) for r in borrar}
+            self._db.tablas[self._tabla] = [r for r in self._db.tablas[self._tabla] if id(r) not in ids]
+            return FakeResponse(copy.deepcopy(borrar))
+
+        filas = self._filas()
+        total = len(filas)
+        for col, desc in reversed(self._orden):
+            filas.sort(key=lambda r: _sort_key(r.get(col)), reverse=desc)
+        if self._rango:
+            filas = filas[self._rango[0] : self._rango[1] + 1]
+        if self._limite is not None:
+            filas = filas[: self._limite]
+        filas = copy.deepcopy(filas)
+        count = total if self._count else None
+
+        if self._uno == "single":
+            if len(filas) != 1:
+                raise Exception(f"single(): {len(filas)} filas en {self._tabla}")
+            return FakeResponse(filas[0], count)
+        if self._uno == "maybe":
+            return FakeResponse(filas[0] if filas else None, count)
+        return FakeResponse(filas, count)
+
+
+class _FakeRpc:
+    def __init__(self, db: "FakeSupabase", nombre: str, params: dict):
+        self._db, self._nombre, self._params = db, nombre, params or {}
+
+    def execute(self) -> FakeResponse:
+        self._db._contar(f"rpc:{self._nombre}", "rpc")
+        fn = self._db.rpcs.get(self._nombre)
+        if fn is None:
+            raise APIError({"code": "PGRST202", "message": f"function {self._nombre} not found"})
+        with self._db._lock:
+            return FakeResponse(fn(self._db, **self._params))
+
+
+class FakeSupabase:
+    """
+    tablas:      {"tabla": [fila, ...]}
+    claves:      {"tabla": "columna_pk"} para autonumerar inserts y resolver upserts
+    latencia_ms: espera por consulta (simula el round-trip)
+    rpcs:        {"nombre": fn(db, **params)} para funciones de base de datos
+    """
+
+    def __init__(
+        self,
+        tablas: Optional[Dict[str, List[dict]]] = None,
+        *,
+        claves: Optional[Dict[str, str]] = None,
+        latencia_ms: float = 0.0,
+        rpcs: Optional[Dict[str, Callable]] = None,
+    ):
+        self.tablas: Dict[str, List[dict]] = copy.deepcopy(tablas or {})
+        self.claves = dict(claves or {})
+        self.latencia_ms = latencia_ms
+        self.rpcs = dict(rpcs or {})
+        self.consultas = 0
+        self.log: List[tuple] = []
+        self._lock = threading.RLock()
+        self._lock_log = threading.Lock()
+
+    def table(self, nombre: str) -> FakeQuery:
+        return FakeQuery(self, nombre)
+
+    def rpc(self, nombre: str, params: Optional[dict] = None) -> _FakeRpc:
+        return _FakeRpc(self, nombre, params or {})
+
+    def reset(self):
+        with self._lock_log:
+            self.consultas = 0
+            self.log = []
+
+    # -----------------------------
+    # Internos
+    # -----------------------------
+    def _contar(self, tabla: str, op: str):
+        with self._lock_log:
+            self.consultas += 1
+            self.log.append((tabla, op))
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000.0)
+
+    def _insertar(self, tabla: str, fila: dict) -> dict:
+        fila = copy.deepcopy(fila)
+        pk = self.claves.get(tabla)
+        filas = self.tablas.setdefault(tabla, [])
+        if pk and fila.get(pk) is None:
+            fila[pk] = max((r.get(pk) or 0 for r in filas), default=0) + 1
+        filas.append(fila)
+        return copy.deepcopy(fila)
+
+    def _upsert(self, tabla: str, fila: dict, on_conflict: Optional[str]) -> dict:
+        cols = [c.strip() for c in (on_conflict or self.claves.get(tabla) or "").split(",") if c.strip()]
+        if cols and all(fila.get(c) is not None for c in cols):
+            for r in self.tablas.setdefault(tabla, []):
+                if all(r.get(c) == fila.get(c) for c in cols):
+                    r.update(copy.deepcopy(fila))
+                    return copy.deepcopy(r)
+        return self._insertar(tabla, fila)
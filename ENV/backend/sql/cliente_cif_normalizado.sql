@@ -0,0 +1,30 @@
+-- backend/sql/cliente_cif_normalizado.sql
+-- Escritura en bloque de cliente.cif_normalizado para el job de duplicados.
+--
+-- cliente_guardar_cif_normalizado(p_filas) recibe un array JSON
+-- [{"clienteid": 1, "cif_normalizado": "B12345678"}, ...] y lo aplica con un
+-- solo UPDATE ... FROM jsonb_to_recordset (solo las filas que cambian).
+-- backend/app/services/cliente_duplicados.py lo llama por bloques; sin la
+-- funcion actualiza fila a fila.
+-- El indice acelera la busqueda de clientes por CIF normalizado.
+
+create or replace function public.cliente_guardar_cif_normalizado(p_filas jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+    v_filas integer;
+begin
+    update public.cliente c
+       set cif_normalizado = x.cif_normalizado
+      from jsonb_to_recordset(p_filas) as x(clienteid bigint, cif_normalizado text)
+     where c.clienteid = x.clienteid
+       and c.cif_normalizado is distinct from x.cif_normalizado;
+    get diagnostics v_filas = row_count;
+    return v_filas;
+end;
+$$;
+
+create index if not exists cliente_cif_normalizado_idx
+    on public.cliente (cif_normalizado)
+ where cif_normalizado is not null;
@@ -0,0 +1,90 @@
+-- backend/sql/cliente_updated_at.sql
+-- Version de la ficha de cliente para GET /api/clientes/{id} condicional.
+--
+-- cliente.updated_at cambia con cualquier modificacion de la ficha: de la
+-- propia fila (trigger BEFORE UPDATE) y de sus direcciones y contactos
+-- (triggers que "tocan" al cliente padre). La API lo usa como ETag y
+-- Last-Modified y contesta 304 si el cliente ya tiene esa version.
+--
+-- Las claves foraneas permiten a PostgREST embeber clientes_direccion y
+-- cliente_contacto en la select del cliente (una consulta en vez de tres).
+-- Se crean NOT VALID para no fallar por filas antiguas huerfanas; se pueden
+-- validar despues con ALTER TABLE ... VALIDATE CONSTRAINT.
+
+alter table public.cliente
+    add column if not exists updated_at timestamptz not null default now();
+
+create or replace function public.cliente_marcar_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+-- Solo si cambia algo de la ficha: updates sin cambios y los que solo tocan
+-- cif_normalizado (columna derivada de cifdni que rellena el job de
+-- duplicados, backend/sql/cliente_cif_normalizado.sql) no cambian la
+-- version; si no, la primera deteccion invalidaria los ETag y el indice de
+-- sugerencias de toda la tabla.
+drop trigger if exists cliente_updated_at on public.cliente;
+create trigger cliente_updated_at
+    before update on public.cliente
+    for each row
+    when ((to_jsonb(old) - 'updated_at' - 'cif_normalizado') is distinct from (to_jsonb(new) - 'updated_at' - 'cif_normalizado'))
+    execute function public.cliente_marcar_updated_at();
+
+-- Direcciones y contactos: la ficha cambia aunque la fila cliente no
+create or replace function public.cliente_tocar_desde_hijo()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_clienteid bigint;
+begin
+    if tg_table_name = 'clientes_direccion' then
+        v_clienteid := coalesce(
+            case when tg_op <> 'DELETE' then new.idtercero end,
+            case when tg_op <> 'INSERT' then old.idtercero end
+        );
+    else
+        v_clienteid := coalesce(
+            case when tg_op <> 'DELETE' then new.clienteid end,
+            case when tg_op <> 'INSERT' then old.clienteid end
+        );
+    end if;
+    if v_clienteid is not null then
+        update public.cliente set updated_at = now() where clienteid = v_clienteid;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists clientes_direccion_toca_cliente on public.clientes_direccion;
+create trigger clientes_direccion_toca_cliente
+    after insert or update or delete on public.clientes_direccion
+    for each row execute function public.cliente_tocar_desde_hijo();
+
+drop trigger if exists cliente_contacto_toca_cliente on public.cliente_contacto;
+create trigger cliente_contacto_toca_cliente
+    after insert or update or delete on public.cliente_contacto
+    for each row execute function public.cliente_tocar_desde_hijo();
+
+do $$
+begin
+    if not exists (select 1 from pg_constraint where conname = 'clientes_direccion_idtercero_fkey') then
+        alter table public.clientes_direccion
+            add constraint clientes_direccion_idtercero_fkey
+            foreign key (idtercero) references public.cliente (clienteid) not valid;
+    end if;
+    if not exists (select 1 from pg_constraint where conname = 'cliente_contacto_clienteid_fkey') then
+        alter table public.cliente_contacto
+            add constraint cliente_contacto_clienteid_fkey
+            foreign key (clienteid) references public.cliente (clienteid) not valid;
+    end if;
+end;
+$$;
+
+notify pgrst, 'reload schema';
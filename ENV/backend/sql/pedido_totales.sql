@@ -0,0 +1,70 @@
+-- backend/sql/pedido_totales.sql
+-- Una fila de totales por pedido.
+--
+-- PedidosService.recalcular_totales_lote guarda los totales de muchos
+-- pedidos con un solo upsert (on_conflict=pedidoid), que necesita este
+-- indice unico. GET /api/pedidos/totales lee la tabla con pedidoid IN (...).
+--
+-- use_iva guarda si los totales se calcularon con IVA (casilla "Aplicar
+-- IVA" de la ficha del pedido) para que los recalculos en bloque lo
+-- respeten, igual que gastos_envio y envio_sin_cargo.
+
+create unique index if not exists pedido_totales_pedidoid_uk
+    on public.pedido_totales (pedidoid);
+
+alter table public.pedido_totales
+    add column if not exists use_iva boolean not null default true;
+
+-- Totales pendientes de recalcular, guardado en la base y no en la memoria
+-- de un proceso (con varios workers cada uno veria una cola distinta).
+-- Cualquier cambio en pedido_detalle sube lineas_version de la fila de
+-- totales; el recalculo guarda en version_calculada la lineas_version que
+-- leyo antes de leer las lineas. La fila esta pendiente si no tiene
+-- fecha_recalculo o si lineas_version > version_calculada; un cambio hecho
+-- durante el recalculo deja la fila pendiente.
+
+alter table public.pedido_totales
+    add column if not exists lineas_version bigint not null default 0,
+    add column if not exists version_calculada bigint not null default 0;
+
+create or replace function public.pedido_totales_marcar_pendiente()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        update public.pedido_totales t
+           set lineas_version = t.lineas_version + 1
+         where t.pedidoid in (select distinct pedidoid from nuevas);
+    elsif tg_op = 'DELETE' then
+        update public.pedido_totales t
+           set lineas_version = t.lineas_version + 1
+         where t.pedidoid in (select distinct pedidoid from viejas);
+    else
+        update public.pedido_totales t
+           set lineas_version = t.lineas_version + 1
+         where t.pedidoid in (select pedidoid from nuevas union select pedidoid from viejas);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists pedido_detalle_totales_ins on public.pedido_detalle;
+create trigger pedido_detalle_totales_ins
+    after insert on public.pedido_detalle
+    referencing new table as nuevas
+    for each statement execute function public.pedido_totales_marcar_pendiente();
+
+drop trigger if exists pedido_detalle_totales_upd on public.pedido_detalle;
+create trigger pedido_detalle_totales_upd
+    after update on public.pedido_detalle
+    referencing old table as viejas new table as nuevas
+    for each statement execute function public.pedido_totales_marcar_pendiente();
+
+drop trigger if exists pedido_detalle_totales_del on public.pedido_detalle;
+create trigger pedido_detalle_totales_del
+    after delete on public.pedido_detalle
+    referencing old table as viejas
+    for each statement execute function public.pedido_totales_marcar_pendiente();
+
+notify pgrst, 'reload schema';
@@ -0,0 +1,35 @@
+-- backend/sql/presupuesto_contador.sql
+-- Numeracion atomica de presupuestos (PRES-YYYY-####) por prefijo.
+--
+-- presupuesto_siguiente_numero reserva el siguiente numero con un
+-- INSERT ... ON CONFLICT DO UPDATE ... RETURNING: una fila por prefijo,
+-- tiempo constante y sin duplicados entre usuarios concurrentes (el
+-- bloqueo de fila serializa las reservas del mismo prefijo).
+
+create table if not exists public.presupuesto_contador (
+    prefijo text primary key,
+    ultimo integer not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+-- Arranque: continuar desde los numeros ya emitidos
+insert into public.presupuesto_contador (prefijo, ultimo)
+select substring(numero from '^(.*-)[0-9]+$') as prefijo,
+       max(substring(numero from '([0-9]+)$')::integer) as ultimo
+  from public.presupuesto
+ where numero ~ '^.*-[0-9]+$'
+ group by 1
+on conflict (prefijo) do update
+    set ultimo = greatest(public.presupuesto_contador.ultimo, excluded.ultimo);
+
+create or replace function public.presupuesto_siguiente_numero(p_prefijo text)
+returns integer
+language sql
+as $$
+    insert into public.presupuesto_contador as c (prefijo, ultimo)
+    values (p_prefijo, 1)
+    on conflict (prefijo) do update
+        set ultimo = c.ultimo + 1,
+            updated_at = now()
+    returning ultimo;
+$$;
@@ -0,0 +1,96 @@
+-- backend/sql/presupuesto_contexto.sql
+-- Contexto del PDF de presupuesto en una sola llamada.
+--
+-- presupuesto_contexto(p_ids) devuelve un array JSON con un objeto por
+-- presupuesto existente: cabecera, cliente, comercial, forma de pago,
+-- direcciones del cliente, direccion de envio elegida y lineas. Sustituye
+-- las ~8 consultas de comun/presupuesto_context.build_presupuesto_context
+-- (y las 7 por bloque de build_presupuesto_contexts) por un round-trip.
+-- Las columnas que pueden no existir (formapagoid/forma_pagoid,
+-- direccion_envioid) se leen via to_jsonb para no romper la funcion.
+-- El cliente se une por cliente.clienteid, la misma clave que usan los
+-- repositorios, el camino Python y la FK de cliente_updated_at.sql.
+
+create or replace function public.presupuesto_contexto(p_ids bigint[])
+returns jsonb
+language sql
+stable
+security invoker
+as $$
+    select coalesce(jsonb_agg(
+        jsonb_build_object(
+            'presupuesto', to_jsonb(p),
+            'cliente', to_jsonb(c),
+            'trabajador', (
+                select jsonb_build_object(
+                    'trabajadorid', t.trabajadorid,
+                    'nombre', t.nombre,
+                    'apellidos', t.apellidos,
+                    'telefono', t.telefono,
+                    'email', t.email
+                )
+                  from public.trabajador t
+                 where t.trabajadorid = p.trabajadorid
+            ),
+            'forma_pago', (
+                select to_jsonb(f)
+                  from public.forma_pago f
+                 where f.formapagoid = coalesce(to_jsonb(c) ->> 'formapagoid', to_jsonb(c) ->> 'forma_pagoid')::bigint
+            ),
+            'direcciones', (
+                select jsonb_agg(
+                           jsonb_build_object(
+                               'clientes_direccionid', d.clientes_direccionid,
+                               'idtercero', d.idtercero,
+                               'direccionfiscal', d.direccionfiscal,
+                               'direccion', d.direccion,
+                               'codigopostal', d.codigopostal,
+                               'municipio', d.municipio,
+                               'idprovincia', d.idprovincia,
+                               'idpais', d.idpais
+                           )
+                           order by d.clientes_direccionid
+                       )
+                  from public.clientes_direccion d
+                 where d.idtercero = p.clienteid
+            ),
+            'direccion_envio', (
+                select jsonb_build_object(
+                           'clientes_direccionid', d.clientes_direccionid,
+                           'idtercero', d.idtercero,
+                           'direccionfiscal', d.direccionfiscal,
+                           'direccion', d.direccion,
+                           'codigopostal', d.codigopostal,
+                           'municipio', d.municipio,
+                           'idprovincia', d.idprovincia,
+                           'idpais', d.idpais
+                       )
+                  from public.clientes_direccion d
+                 where d.clientes_direccionid = (to_jsonb(p) ->> 'direccion_envioid')::bigint
+            ),
+            'lineas', coalesce((
+                select jsonb_agg(
+                           jsonb_build_object(
+                               'presupuesto_id', l.presupuesto_id,
+                               'presupuesto_linea_id', l.presupuesto_linea_id,
+                               'descripcion', l.descripcion,
+                               'cantidad', l.cantidad,
+                               'precio_unitario', l.precio_unitario,
+                               'descuento_pct', l.descuento_pct,
+                               'iva_pct', l.iva_pct,
+                               'base_linea', l.base_linea,
+                               'iva_importe', l.iva_importe,
+                               'total_linea', l.total_linea
+                           )
+                           order by l.presupuesto_linea_id
+                       )
+                  from public.presupuesto_linea l
+                 where l.presupuesto_id = p.presupuesto_id
+            ), '[]'::jsonb)
+        )
+        order by p.presupuesto_id
+    ), '[]'::jsonb)
+      from public.presupuesto p
+      left join public.cliente c on c.clienteid = p.clienteid
+     where p.presupuesto_id = any(p_ids);
+$$;
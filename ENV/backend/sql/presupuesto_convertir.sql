@@ -0,0 +1,101 @@
+-- backend/sql/presupuesto_convertir.sql
+-- Conversion de presupuesto a pedido en el servidor, en una transaccion.
+--
+-- presupuesto_convertir_a_pedido(p_presupuesto_id):
+--   1) bloquea el presupuesto (FOR UPDATE): dos conversiones simultaneas
+--      del mismo presupuesto no crean dos pedidos;
+--   2) si ya hay pedido con ese presupuesto_origenid lo devuelve;
+--   3) crea la cabecera del pedido, copia todas las lineas con un solo
+--      INSERT ... SELECT desde presupuesto_linea y copia los totales
+--      (presupuesto_totales o, si no hay fila, la suma de las lineas);
+--   4) marca el presupuesto como Convertido (o Aceptado) y no editable.
+-- Cualquier error deshace todo: no quedan pedidos a medio convertir.
+
+create or replace function public.presupuesto_convertir_a_pedido(p_presupuesto_id bigint)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_pres public.presupuesto%rowtype;
+    v_pedidoid bigint;
+    v_numero text;
+    v_estado bigint;
+    v_lineas integer;
+begin
+    select * into v_pres
+      from public.presupuesto
+     where presupuesto_id = p_presupuesto_id
+       for update;
+    if not found then
+        raise exception 'Presupuesto % no encontrado', p_presupuesto_id using errcode = 'P0002';
+    end if;
+
+    select pedidoid, numero into v_pedidoid, v_numero
+      from public.pedido
+     where presupuesto_origenid = p_presupuesto_id
+     limit 1;
+    if found then
+        return jsonb_build_object('pedidoid', v_pedidoid, 'numero', v_numero, 'ya_existia', true, 'lineas', 0);
+    end if;
+
+    insert into public.pedido (
+        numero, clienteid, trabajadorid, fecha_pedido, estado_pedidoid,
+        presupuesto_origenid, tipo_pedidoid, procedencia_pedidoid
+    )
+    values (
+        'PED-' || extract(year from current_date)::int || '-' || lpad((9000 + p_presupuesto_id)::text, 4, '0'),
+        v_pres.clienteid, v_pres.trabajadorid, current_date, 1,  -- Borrador
+        p_presupuesto_id, 1, 2
+    )
+    returning pedidoid, numero into v_pedidoid, v_numero;
+
+    insert into public.pedido_detalle (
+        pedidoid, productoid, nombre_producto, cantidad, precio_unitario,
+        descuento_pct, iva_pct, importe_base, importe_total_linea
+    )
+    select v_pedidoid, l.producto_id, l.descripcion, l.cantidad, l.precio_unitario,
+           coalesce(l.descuento_pct, 0), coalesce(l.iva_pct, 21),
+           coalesce(l.base_linea, 0), coalesce(l.total_linea, 0)
+      from public.presupuesto_linea l
+     where l.presupuesto_id = p_presupuesto_id
+     order by l.presupuesto_linea_id;
+    get diagnostics v_lineas = row_count;
+
+    insert into public.pedido_totales (
+        pedidoid, base_imponible, iva_importe, total_importe,
+        gastos_envio, envio_sin_cargo, fecha_recalculo
+    )
+    select v_pedidoid,
+           coalesce(t.base_imponible, s.base_imponible),
+           coalesce(t.iva_total, s.iva_total),
+           coalesce(t.total_documento, s.total_documento),
+           0, false, now()
+      from (
+            select round(coalesce(sum(coalesce(l.base_linea, 0)), 0)::numeric, 2) as base_imponible,
+                   round(coalesce(sum(coalesce(l.iva_importe, 0)), 0)::numeric, 2) as iva_total,
+                   round(coalesce(sum(coalesce(l.total_linea, 0)), 0)::numeric, 2) as total_documento
+              from public.presupuesto_linea l
+             where l.presupuesto_id = p_presupuesto_id
+           ) s
+      left join public.presupuesto_totales t on t.presupuesto_id = p_presupuesto_id;
+
+    select presupuesto_estadoid into v_estado
+      from public.presupuesto_estado
+     where estado ilike 'Convertido'
+     limit 1;
+    if v_estado is null then
+        select presupuesto_estadoid into v_estado
+          from public.presupuesto_estado
+         where estado ilike 'Aceptado'
+         limit 1;
+    end if;
+    if v_estado is not null then
+        update public.presupuesto
+           set presupuesto_estadoid = v_estado,
+               editable = false
+         where presupuesto_id = p_presupuesto_id;
+    end if;
+
+    return jsonb_build_object('pedidoid', v_pedidoid, 'numero', v_numero, 'ya_existia', false, 'lineas', v_lineas);
+end;
+$$;
@@ -0,0 +1,15 @@
+-- backend/sql/presupuesto_linea_descuento_manual.sql
+-- Marca de descuento manual en las lineas de presupuesto.
+--
+-- descuento_pct guarda tanto el descuento que pone el motor de tarifas como
+-- el que escribe el usuario. descuento_manual distingue ambos: al editar una
+-- linea (PATCH /api/presupuestos/{id}/lineas/{detalleid}) solo se conserva
+-- el descuento guardado si se puso a mano y el producto no cambia; si no, la
+-- linea se vuelve a tarificar. El recalculo completo respeta igualmente los
+-- descuentos manuales. Sin esta columna todas las lineas se tratan como
+-- tarificadas por el motor.
+
+alter table public.presupuesto_linea
+    add column if not exists descuento_manual boolean not null default false;
+
+notify pgrst, 'reload schema';
@@ -0,0 +1,24 @@
+-- backend/sql/presupuesto_resumen.sql
+-- Resumen por presupuesto para el listado: numero de lineas + totales.
+-- Lo consulta PresupuestosRepository.resumen_listado con un unico
+-- "presupuesto_id in (...)" por pagina (sin un count por fila).
+
+create or replace view public.presupuesto_resumen
+with (security_invoker = on) as
+select
+    p.presupuesto_id,
+    (
+        select count(*)
+        from public.presupuesto_linea pl
+        where pl.presupuesto_id = p.presupuesto_id
+    )::int as num_lineas,
+    t.base_imponible,
+    t.iva_total,
+    t.total_documento
+from public.presupuesto p
+left join public.presupuesto_totales t on t.presupuesto_id = p.presupuesto_id;
+
+create index if not exists presupuesto_linea_presupuesto_id_idx
+    on public.presupuesto_linea (presupuesto_id);
+
+grant select on public.presupuesto_resumen to anon, authenticated, service_role;
@@ -0,0 +1,104 @@
+-- backend/sql/presupuesto_totales_delta.sql
+-- Mantenimiento incremental de totales de presupuesto.
+--
+-- presupuesto_aplicar_delta: suma (o resta) el delta de una o varias lineas
+-- a presupuesto_totales y presupuesto.total_estimada en una sola llamada,
+-- con incrementos atomicos (sin leer-modificar-escribir desde el cliente).
+--
+-- presupuesto_reconciliar_totales: recalculo completo desde las lineas como
+-- red de seguridad. Sin argumento recorre todos los presupuestos y devuelve
+-- solo los que estaban descuadrados.
+
+create unique index if not exists presupuesto_totales_presupuesto_id_uidx
+    on public.presupuesto_totales (presupuesto_id);
+
+create or replace function public.presupuesto_aplicar_delta(
+    p_presupuesto_id bigint,
+    p_base numeric,
+    p_iva numeric,
+    p_total numeric
+)
+returns numeric
+language plpgsql
+as $$
+declare
+    v_total numeric;
+begin
+    insert into public.presupuesto_totales as t
+        (presupuesto_id, base_imponible, iva_total, total_documento, fecha_recalculo)
+    values
+        (p_presupuesto_id, round(p_base, 2), round(p_iva, 2), round(p_total, 2), now())
+    on conflict (presupuesto_id) do update
+        set base_imponible  = round((coalesce(t.base_imponible, 0) + excluded.base_imponible)::numeric, 2),
+            iva_total       = round((coalesce(t.iva_total, 0) + excluded.iva_total)::numeric, 2),
+            total_documento = round((coalesce(t.total_documento, 0) + excluded.total_documento)::numeric, 2),
+            fecha_recalculo = now();
+
+    update public.presupuesto
+       set total_estimada = round((coalesce(total_estimada, 0) + p_total)::numeric, 2)
+     where presupuesto_id = p_presupuesto_id
+    returning total_estimada::numeric into v_total;
+
+    return v_total;
+end;
+$$;
+
+create or replace function public.presupuesto_reconciliar_totales(p_presupuesto_id bigint default null)
+returns table (
+    presupuesto_id bigint,
+    base_imponible numeric,
+    iva_total numeric,
+    total_documento numeric,
+    total_estimada_anterior numeric
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    return query
+    with calc as (
+        select p.presupuesto_id::bigint as presupuesto_id,
+               round(coalesce(sum(l.base_linea), 0)::numeric, 2) as base_imponible,
+               round(coalesce(sum(l.iva_importe), 0)::numeric, 2) as iva_total,
+               round(coalesce(sum(l.total_linea), 0)::numeric, 2) as total_documento,
+               p.total_estimada::numeric as total_estimada
+          from public.presupuesto p
+          left join public.presupuesto_linea l on l.presupuesto_id = p.presupuesto_id
+         where p_presupuesto_id is null or p.presupuesto_id = p_presupuesto_id
+         group by p.presupuesto_id, p.total_estimada
+    ),
+    descuadre as (
+        select c.*
+          from calc c
+          left join public.presupuesto_totales t on t.presupuesto_id = c.presupuesto_id
+         where t.presupuesto_id is null
+            or t.base_imponible::numeric is distinct from c.base_imponible
+            or t.iva_total::numeric is distinct from c.iva_total
+            or t.total_documento::numeric is distinct from c.total_documento
+            or c.total_estimada is distinct from c.total_documento
+    ),
+    upd_tot as (
+        insert into public.presupuesto_totales as t
+            (presupuesto_id, base_imponible, iva_total, total_documento, fecha_recalculo)
+        select d.presupuesto_id, d.base_imponible, d.iva_total, d.total_documento, now()
+          from descuadre d
+        on conflict (presupuesto_id) do update
+            set base_imponible  = excluded.base_imponible,
+                iva_total       = excluded.iva_total,
+                total_documento = excluded.total_documento,
+                fecha_recalculo = excluded.fecha_recalculo
+    ),
+    upd_pres as (
+        update public.presupuesto p
+           set total_estimada = d.total_documento
+          from descuadre d
+         where p.presupuesto_id = d.presupuesto_id
+    )
+    select d.presupuesto_id, d.base_imponible, d.iva_total, d.total_documento, d.total_estimada
+      from descuadre d;
+end;
+$$;
+
+-- Reconciliacion nocturna (si pg_cron esta habilitado en el proyecto):
+-- select cron.schedule('presupuesto_reconciliar_totales', '30 3 * * *',
+--                      $$select count(*) from public.presupuesto_reconciliar_totales()$$);
@@ -0,0 +1,47 @@
+-- backend/sql/tarifa_version.sql
+-- Contador de version de las tablas de tarifas para el indice en memoria.
+--
+-- backend/app/services/tarifa_index.py guarda las reglas en memoria y las
+-- parchea cuando se editan desde la API. Los cambios hechos por otra via
+-- (SQL directo, otro proceso, la consola de Supabase) suben este contador
+-- con un trigger por sentencia; el indice lo consulta cada pocos segundos
+-- y se recarga en segundo plano si ha cambiado. Sin esta tabla el indice
+-- solo se recarga por TTL.
+
+create table if not exists public.tarifa_version (
+    id smallint primary key default 1 check (id = 1),
+    version bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+insert into public.tarifa_version (id) values (1) on conflict (id) do nothing;
+
+create or replace function public.tarifa_subir_version()
+returns trigger
+language plpgsql
+as $$
+begin
+    update public.tarifa_version
+       set version = version + 1,
+           updated_at = now()
+     where id = 1;
+    return null;
+end;
+$$;
+
+drop trigger if exists tarifa_regla_version on public.tarifa_regla;
+create trigger tarifa_regla_version
+    after insert or update or delete or truncate on public.tarifa_regla
+    for each statement execute function public.tarifa_subir_version();
+
+drop trigger if exists cliente_tarifa_version on public.cliente_tarifa;
+create trigger cliente_tarifa_version
+    after insert or update or delete or truncate on public.cliente_tarifa
+    for each statement execute function public.tarifa_subir_version();
+
+drop trigger if exists tarifa_version on public.tarifa;
+create trigger tarifa_version
+    after insert or update or delete or truncate on public.tarifa
+    for each statement execute function public.tarifa_subir_version();
+
+notify pgrst, 'reload schema';
@@ -0,0 +1,4 @@
+"""
+Codigo compartido por el backend (backend/) y la interfaz Streamlit
+(modules/). No debe importar de ninguno de los dos.
+"""
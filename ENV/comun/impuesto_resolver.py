@@ -0,0 +1,155 @@
+# comun/impuesto_resolver.py
+"""
+Resolucion de impuestos precalculada.
+
+Agrupa las filas habilitadas de `impuesto` por (ambito, producto_tipo) en
+intervalos ordenados por fecha_inicio y responde con bisect, en lugar de
+descargar y ordenar la tabla entera por cada linea.
+
+El mismo resolver lo usan el motor del backend (columnas ambito /
+producto_tipoid / tasa_pct) y el motor de Streamlit (pais / tipo_producto /
+porcentaje) indicando los nombres de columna. Cada uno monta su cache de
+proceso con ImpuestoResolverCache y su propia funcion de carga.
+"""
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_TTL_SEGUNDOS = 300
+
+IMPUESTO_DESCONOCIDO = {"iva_pct": 0.0, "iva_nombre": None, "iva_origen": "desconocido"}
+
+
+def _fecha_txt(v: Any) -> str:
+    if not v:
+        return ""
+    return v.isoformat() if hasattr(v, "isoformat") else str(v)
+
+
+def _ambito_key(v: Any) -> str:
+    return (v or "").upper()
+
+
+class _Intervalos:
+    """Filas de un grupo ordenadas por fecha_inicio (la mas reciente gana)."""
+
+    __slots__ = ("inicios", "filas")
+
+    def __init__(self, filas: List[Tuple[int, Dict[str, Any]]]):
+        # A igual fecha_inicio gana la fila que llego antes (orden estable de antes)
+        filas = sorted(filas, key=lambda p: (_fecha_txt(p[1].get("fecha_inicio")), -p[0]))
+        self.filas = [f for _, f in filas]
+        self.inicios = [_fecha_txt(f.get("fecha_inicio")) for f in self.filas]
+
+    def vigente(self, fecha_iso: str) -> Optional[Dict[str, Any]]:
+        i = bisect_right(self.inicios, fecha_iso)
+        while i > 0:
+            i -= 1
+            ff = _fecha_txt(self.filas[i].get("fecha_fin"))
+            if not ff or ff >= fecha_iso:
+                return self.filas[i]
+        return None
+
+
+class ImpuestoResolver:
+    def __init__(
+        self,
+        filas: List[Dict[str, Any]],
+        *,
+        ambito_field: str = "ambito",
+        tipo_field: str = "producto_tipoid",
+        pct_field: str = "tasa_pct",
+        nombre_field: str = "impuesto_nombre",
+        tipo_key: Callable[[Any], Any] = lambda v: v,
+    ):
+        self.filas = [f for f in filas if f.get("habilitado", True)]
+        self.pct_field = pct_field
+        self.nombre_field = nombre_field
+        self.tipo_key = tipo_key
+        self.creado_en = time.monotonic()
+
+        grupos: Dict[Tuple[Optional[str], Any], List[Tuple[int, Dict[str, Any]]]] = {}
+        for i, f in enumerate(self.filas):
+            tipo = tipo_key(f.get(tipo_field)) or None
+            # Grupo por ambito y grupo comodin (None) para consultas sin ambito
+            for amb in (_ambito_key(f.get(ambito_field)), None):
+                grupos.setdefault((amb, tipo), []).append((i, f))
+        self._grupos = {k: _Intervalos(v) for k, v in grupos.items()}
+        self._por_id = {f.get("impuestoid"): f for f in self.filas if f.get("impuestoid") is not None}
+
+    def _salida(self, fila: Dict[str, Any], origen: str) -> Dict[str, Any]:
+        return {
+            "iva_pct": float(fila.get(self.pct_field) or 0.0),
+            "iva_nombre": fila.get(self.nombre_field),
+            "iva_origen": origen,
+        }
+
+    def vigente(self, ambito: Optional[str], tipo: Any, fecha_iso: str) -> Optional[Dict[str, Any]]:
+        grupo = self._grupos.get((_ambito_key(ambito) if ambito else None, self.tipo_key(tipo) or None))
+        return grupo.vigente(fecha_iso) if grupo else None
+
+    def por_id(self, impuestoid: Optional[int], fecha_iso: str) -> Optional[Dict[str, Any]]:
+        fila = self._por_id.get(impuestoid) if impuestoid else None
+        if not fila:
+            return None
+        fi = _fecha_txt(fila.get("fecha_inicio"))
+        ff = _fecha_txt(fila.get("fecha_fin"))
+        if (fi and fi > fecha_iso) or (ff and ff < fecha_iso):
+            return None
+        return fila
+
+    def resolver(
+        self,
+        *,
+        producto_tipoid: Any,
+        ambito: Optional[str],
+        fecha_iso: str,
+        origen_tipo: str = "producto_tipo",
+        origen_general: str = "ambito_general",
+    ) -> Dict[str, Any]:
+        if self.tipo_key(producto_tipoid):
+            fila = self.vigente(ambito, producto_tipoid, fecha_iso)
+            if fila:
+                return self._salida(fila, origen_tipo)
+
+        fila = self.vigente(ambito, None, fecha_iso)
+        if fila:
+            return self._salida(fila, origen_general)
+
+        return dict(IMPUESTO_DESCONOCIDO)
+
+
+# -----------------------------
+# Cache de proceso
+# -----------------------------
+class ImpuestoResolverCache:
+    """Resolver compartido por proceso; se reconstruye por TTL o con recargar()."""
+
+    def __init__(self, cargar: Callable[[Any], ImpuestoResolver], ttl: float = _TTL_SEGUNDOS):
+        self._cargar = cargar
+        self._ttl = ttl
+        self._resolver: Optional[ImpuestoResolver] = None
+        self._lock = threading.Lock()
+
+    def _caducado(self, r: Optional[ImpuestoResolver]) -> bool:
+        return r is None or time.monotonic() - r.creado_en >= self._ttl
+
+    def get(self, supabase) -> ImpuestoResolver:
+        r = self._resolver
+        if not self._caducado(r):
+            return r
+        with self._lock:
+            if self._caducado(self._resolver):
+                self._resolver = self._cargar(supabase)
+            return self._resolver
+
+    def invalidar(self):
+        with self._lock:
+            self._resolver = None
+
+    def recargar(self, supabase) -> ImpuestoResolver:
+        r = self._cargar(supabase)
+        with self._lock:
+            self._resolver = r
+        return r
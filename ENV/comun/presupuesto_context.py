@@ -0,0 +1,492 @@
+# comun/presupuesto_context.py
+"""
+Contexto unificado de presupuesto para el motor de PDF.
+
+Este módulo NO pinta nada, solo:
+- Lee presupuesto, cliente, direcciones, comercial y líneas en un solo
+  round-trip (RPC presupuesto_contexto, backend/sql/presupuesto_contexto.sql)
+  o, si la función no existe, con una consulta IN por tabla.
+- Calcula totales y desglose de IVA.
+- Devuelve un dict 'ctx' coherente para presupuesto_pdf.build_pdf_bytes().
+"""
+
+import copy
+import threading
+import time
+from datetime import datetime, date
+
+
+# ---------------------------
+# Helpers internos
+# ---------------------------
+def _safe(val, default="-"):
+    return val if val not in (None, "", "null") else default
+
+
+def _fmt_fecha_iso_to_ddmmyyyy(fecha):
+    """
+    Recibe:
+      - '2025-11-19'
+      - '2025-11-19 10:01:44'
+      - datetime / date
+    y devuelve '19/11/2025'.
+    Si no puede parsear, devuelve tal cual en str.
+    """
+    if not fecha:
+        return "-"
+
+    # Si ya es date/datetime
+    if isinstance(fecha, (datetime, date)):
+        return fecha.strftime("%d/%m/%Y")
+
+    # Si es string
+    s = str(fecha)
+    # Intentar parsear como ISO con datetime.fromisoformat
+    try:
+        d = datetime.fromisoformat(s)
+        return d.strftime("%d/%m/%Y")
+    except Exception:
+        # Último intento: sólo la parte de fecha (YYYY-MM-DD)
+        try:
+            base = s.split(" ")[0]
+            d = datetime.fromisoformat(base)
+            return d.strftime("%d/%m/%Y")
+        except Exception:
+            return s
+
+
+
+# ---------------------------
+# Líneas y totales
+# ---------------------------
+def _lineas_y_totales(lineas_raw: list):
+    """Convierte las filas de presupuesto_linea en (lineas_pdf, totales)."""
+    lineas_pdf = []
+    desglose = {}  # {iva_pct: {"base": x, "iva": y}}
+    base_total = 0.0
+    iva_total = 0.0
+    total_total = 0.0
+
+    for ln in lineas_raw:
+        try:
+            cant = float(ln.get("cantidad") or 0)
+        except Exception:
+            cant = 0.0
+        try:
+            precio_unit = float(ln.get("precio_unitario") or 0)
+        except Exception:
+            precio_unit = 0.0
+        try:
+            dto_pct = float(ln.get("descuento_pct") or 0)
+        except Exception:
+            dto_pct = 0.0
+        try:
+            iva_pct = float(ln.get("iva_pct") or 0)
+        except Exception:
+            iva_pct = 0.0
+        try:
+            base = float(ln.get("base_linea") or 0)
+        except Exception:
+            base = cant * precio_unit * (1 - dto_pct / 100.0) if cant and precio_unit else 0.0
+        try:
+            total_linea = float(ln.get("total_linea") or 0)
+        except Exception:
+            total_linea = base * (1 + iva_pct / 100.0)
+
+        iva_importe = base * iva_pct / 100.0
+
+        base_total += base
+        iva_total += iva_importe
+        total_total += total_linea
+
+        key = int(iva_pct)
+        if key not in desglose:
+            desglose[key] = {"base": 0.0, "iva": 0.0}
+        desglose[key]["base"] += base
+        desglose[key]["iva"] += iva_importe
+
+        lineas_pdf.append(
+            {
+                "concepto": ln.get("descripcion") or "-",
+                "unidades": cant,
+                "precio": precio_unit,
+                "dto": dto_pct,
+                "iva": iva_pct,
+                "base": base,
+                "total": total_linea,
+            }
+        )
+
+    if total_total <= 0:
+        total_total = base_total + iva_total
+
+    totales = {
+        "base": base_total,
+        "iva": iva_total,
+        "total": total_total,
+        "desglose": desglose,
+    }
+
+    return lineas_pdf, totales
+
+
+# ---------------------------
+# Empresa (simple por ahora)
+# ---------------------------
+def _load_empresa() -> dict:
+    """
+    De momento, dejamos datos fijos.
+    Si en el futuro tienes tabla 'empresa', aquí se puede leer.
+    """
+    return {
+        "nombre": "ORBE · Editorial / Formación",
+        "cif": "B-00000000",
+        "direccion": "C/ Ejemplo 123, Madrid",
+        "telefono": "+34 900 000 000",
+        "email": "info@orbe.com",
+        "web": "www.orbe.com",
+        "logo_path": "./logo_orbe.png",
+        "texto_legal": (
+            "Este presupuesto es válido durante 30 días desde la fecha de emisión. "
+            "Los precios no incluyen otros impuestos o tasas que pudieran ser de aplicación. "
+            "El tratamiento de datos personales se realiza conforme al RGPD y la LOPDGDD."
+        ),
+    }
+
+
+
+
+# ---------------------------
+# Caché corta de contextos
+# ---------------------------
+_CTX_TTL_SEGUNDOS = 30
+_CTX_MAX = 256
+_CTX_CACHE = {}  # {presupuestoid: (expira, ctx)}
+_CTX_LOCK = threading.Lock()
+
+
+def invalidar_contexto(presupuestoid: int = None):
+    """Descarta el contexto cacheado de un presupuesto (o todos). Llamar tras editarlo."""
+    with _CTX_LOCK:
+        if presupuestoid is None:
+            _CTX_CACHE.clear()
+        else:
+            _CTX_CACHE.pop(int(presupuestoid), None)
+
+
+def _ctx_cacheado(presupuestoid: int):
+    with _CTX_LOCK:
+        item = _CTX_CACHE.get(presupuestoid)
+        if item and item[0] > time.monotonic():
+            return copy.deepcopy(item[1])
+        _CTX_CACHE.pop(presupuestoid, None)
+    return None
+
+
+def _cachear_ctx(presupuestoid: int, ctx: dict):
+    with _CTX_LOCK:
+        if len(_CTX_CACHE) >= _CTX_MAX:
+            ahora = time.monotonic()
+            for k in [k for k, (exp, _) in _CTX_CACHE.items() if exp <= ahora] or list(_CTX_CACHE)[: _CTX_MAX // 4]:
+                _CTX_CACHE.pop(k, None)
+        _CTX_CACHE[presupuestoid] = (time.monotonic() + _CTX_TTL_SEGUNDOS, copy.deepcopy(ctx))
+
+
+# ---------------------------
+# FUNCIÓN PRINCIPAL
+# ---------------------------
+def build_presupuesto_context(supabase, presupuestoid: int, usar_cache: bool = True) -> dict:
+    """
+    Devuelve un dict con:
+      - empresa
+      - cliente
+      - presupuesto
+      - lineas
+      - totales
+      - direccion_fiscal
+      - direccion_envio
+    que es justo lo que espera presupuesto_pdf.build_pdf_bytes().
+    Se guarda _CTX_TTL_SEGUNDOS en caché; las ediciones la invalidan
+    con invalidar_contexto().
+    """
+    presupuestoid = int(presupuestoid)
+    if usar_cache:
+        ctx = _ctx_cacheado(presupuestoid)
+        if ctx is not None:
+            return ctx
+
+    ctx = build_presupuesto_contexts(supabase, [presupuestoid]).get(presupuestoid)
+    if not ctx:
+        raise ValueError(f"Presupuesto {presupuestoid} no encontrado")
+
+    if usar_cache:
+        _cachear_ctx(presupuestoid, ctx)
+    return ctx
+
+
+def _armar_contexto(
+    pres: dict,
+    cliente_raw: dict,
+    trabajador: dict,
+    forma_pago: dict,
+    direccion_fiscal: dict,
+    direccion_envio: dict,
+    lineas_ctx: list,
+    totales_ctx: dict,
+) -> dict:
+    """Monta el ctx del PDF a partir de las filas ya leídas (sin consultas)."""
+    # Empresa
+    empresa = _load_empresa()
+
+    # Cliente (normalizado para el PDF)
+    cliente_ctx = {
+        "razon_social": _safe(
+            cliente_raw.get("razon_social")
+            or cliente_raw.get("nombre_comercial")
+            or "",
+            "-"
+        ),
+        "cif": _safe(
+            cliente_raw.get("cif_nif") or cliente_raw.get("cif"),
+            "-"
+        ),
+        # Contacto / ATT — primero lo que haya en el presupuesto, luego fallback al cliente
+        "contacto_att": pres.get("contacto_att")
+        or cliente_raw.get("contacto_att")
+        or None,
+        "telefono_contacto": pres.get("telefono_contacto")
+        or cliente_raw.get("telefono_contacto")
+        or cliente_raw.get("telefono")
+        or None,
+        "email_contacto": pres.get("email_contacto")
+        or cliente_raw.get("email_contacto")
+        or cliente_raw.get("email")
+        or None,
+    }
+
+    # Comercial / trabajador
+    if trabajador:
+        comercial_nombre = (
+            (trabajador.get("nombre") or "") + " " + (trabajador.get("apellidos") or "")
+        ).strip()
+    else:
+        comercial_nombre = ""
+
+    # Forma de pago (nombre)
+    forma_pago_nombre = forma_pago.get("nombre") if forma_pago else None
+
+    # Fechas (las dejamos ya formateadas dd/mm/yyyy)
+    fecha_pres_fmt = _fmt_fecha_iso_to_ddmmyyyy(pres.get("fecha_presupuesto"))
+    fecha_validez_fmt = _fmt_fecha_iso_to_ddmmyyyy(pres.get("fecha_validez"))
+
+    # Presupuesto (cabecera documento)
+    presupuesto_ctx = {
+        "numero": pres.get("numero"),
+        "fecha": fecha_pres_fmt,
+        "validez": fecha_validez_fmt,
+        "forma_pago": _safe(forma_pago_nombre, "-"),
+        "comercial": _safe(comercial_nombre, "-"),
+        "observaciones": pres.get("observaciones") or "",
+    }
+
+    # Direcciones
+    if not direccion_envio:
+        # último fallback: fiscal
+        direccion_envio = direccion_fiscal or {}
+
+    # Normalizar formato de direcciones para el PDF
+    def _norm_dir(d: dict) -> dict:
+        if not d:
+            return {}
+        return {
+            "direccion": d.get("direccion"),
+            "cp": d.get("cp"),
+            "ciudad": d.get("ciudad"),
+            "provincia": d.get("provincia"),
+            "pais": d.get("pais") or "ESPAÑA",
+        }
+
+    dir_fiscal_ctx = _norm_dir(direccion_fiscal)
+    dir_envio_ctx = _norm_dir(direccion_envio)
+
+    ctx = {
+        "empresa": empresa,
+        "cliente": cliente_ctx,
+        "presupuesto": presupuesto_ctx,
+        "lineas": lineas_ctx,
+        "totales": totales_ctx,
+        "direccion_fiscal": dir_fiscal_ctx,
+        "direccion_envio": dir_envio_ctx,
+    }
+
+    return ctx
+
+
+
+
+# ---------------------------
+# Lectura: RPC (un round-trip) o consultas IN
+# ---------------------------
+_COLS_DIRECCION = (
+    "clientes_direccionid, idtercero, direccionfiscal, direccion, codigopostal, municipio, idprovincia, idpais"
+)
+_IN_CHUNK = 200
+_PAGE = 1000
+_RPC_BLOQUE = 100
+
+# None = sin comprobar; False = la función no existe en esta base de datos
+_RPC_DISPONIBLE = None
+
+
+def _codigo_error(e: Exception):
+    code = getattr(e, "code", None)
+    if not code and getattr(e, "args", None) and isinstance(e.args[0], dict):
+        code = e.args[0].get("code")
+    return code
+
+
+def _trozos(ids: list, n: int = _IN_CHUNK):
+    for i in range(0, len(ids), n):
+        yield ids[i : i + n]
+
+
+def _load_crudos_rpc(supabase, presupuesto_ids: list):
+    """
+    Filas crudas vía RPC presupuesto_contexto: una llamada por bloque.
+    Devuelve None si la función no está instalada.
+    """
+    global _RPC_DISPONIBLE
+    if _RPC_DISPONIBLE is False:
+        return None
+    crudos = []
+    for trozo in _trozos(presupuesto_ids, _RPC_BLOQUE):
+        try:
+            res = supabase.rpc("presupuesto_contexto", {"p_ids": trozo}).execute()
+        except Exception as e:
+            if _codigo_error(e) == "PGRST202":
+                _RPC_DISPONIBLE = False
+                return None
+            raise
+        crudos.extend(res.data or [])
+    _RPC_DISPONIBLE = True
+    return crudos
+
+
+def _load_in(supabase, table: str, columns: str, col: str, ids, order: str = None) -> list:
+    """SELECT ... WHERE col IN (ids), troceado por URL y paginado por PostgREST."""
+    ids = sorted({i for i in ids if i})
+    rows = []
+    for trozo in _trozos(ids):
+        start = 0
+        while True:
+            q = supabase.table(table).select(columns).in_(col, trozo)
+            if order:
+                q = q.order(col).order(order)
+            chunk = q.range(start, start + _PAGE - 1).execute().data or []
+            rows.extend(chunk)
+            if len(chunk) < _PAGE:
+                break
+            start += _PAGE
+    return rows
+
+
+def _load_crudos_in(supabase, presupuesto_ids: list) -> list:
+    """Mismas filas crudas que la RPC con una consulta IN por tabla."""
+    presupuestos = _load_in(supabase, "presupuesto", "*", "presupuesto_id", presupuesto_ids)
+    if not presupuestos:
+        return []
+
+    cliente_ids = {p.get("clienteid") for p in presupuestos}
+    clientes = {c["clienteid"]: c for c in _load_in(supabase, "cliente", "*", "clienteid", cliente_ids)}
+    trabajadores = {
+        t["trabajadorid"]: t
+        for t in _load_in(
+            supabase,
+            "trabajador",
+            "trabajadorid, nombre, apellidos, telefono, email",
+            "trabajadorid",
+            {p.get("trabajadorid") for p in presupuestos},
+        )
+    }
+    formas_pago = {
+        f["formapagoid"]: f
+        for f in _load_in(
+            supabase,
+            "forma_pago",
+            "*",
+            "formapagoid",
+            {c.get("formapagoid") or c.get("forma_pagoid") for c in clientes.values()},
+        )
+    }
+
+    direcciones_cliente = {}
+    direcciones = {}
+    for d in _load_in(supabase, "clientes_direccion", _COLS_DIRECCION, "idtercero", cliente_ids, "clientes_direccionid"):
+        direcciones_cliente.setdefault(d.get("idtercero"), []).append(d)
+        direcciones[d["clientes_direccionid"]] = d
+    sueltas = {p.get("direccion_envioid") for p in presupuestos} - set(direcciones)
+    for d in _load_in(supabase, "clientes_direccion", _COLS_DIRECCION, "clientes_direccionid", sueltas):
+        direcciones[d["clientes_direccionid"]] = d
+
+    lineas = {}
+    for ln in _load_in(
+        supabase,
+        "presupuesto_linea",
+        "presupuesto_id, presupuesto_linea_id, descripcion, cantidad, precio_unitario, "
+        "descuento_pct, iva_pct, base_linea, iva_importe, total_linea",
+        "presupuesto_id",
+        [p["presupuesto_id"] for p in presupuestos],
+        "presupuesto_linea_id",
+    ):
+        lineas.setdefault(ln["presupuesto_id"], []).append(ln)
+
+    crudos = []
+    for pres in presupuestos:
+        cliente_raw = clientes.get(pres.get("clienteid")) or {}
+        crudos.append(
+            {
+                "presupuesto": pres,
+                "cliente": cliente_raw,
+                "trabajador": trabajadores.get(pres.get("trabajadorid")),
+                "forma_pago": formas_pago.get(cliente_raw.get("formapagoid") or cliente_raw.get("forma_pagoid")),
+                "direcciones": direcciones_cliente.get(pres.get("clienteid")),
+                "direccion_envio": direcciones.get(pres.get("direccion_envioid")),
+                "lineas": lineas.get(pres["presupuesto_id"]),
+            }
+        )
+    return crudos
+
+
+def _contexto_desde_crudo(crudo: dict) -> dict:
+    pres = crudo.get("presupuesto") or {}
+    dirs = crudo.get("direcciones") or []
+    # Fiscal: la marcada como fiscal (o la única que tenga el cliente)
+    direccion_fiscal = next((d for d in dirs if d.get("direccionfiscal")), dirs[0] if len(dirs) == 1 else {})
+    # Envío: la del presupuesto; si no, la primera del cliente
+    direccion_envio = crudo.get("direccion_envio") or (dirs[0] if dirs else {})
+    lineas_ctx, totales_ctx = _lineas_y_totales(crudo.get("lineas") or [])
+    return _armar_contexto(
+        pres,
+        crudo.get("cliente") or {},
+        crudo.get("trabajador") or {},
+        crudo.get("forma_pago") or {},
+        direccion_fiscal,
+        direccion_envio,
+        lineas_ctx,
+        totales_ctx,
+    )
+
+
+def build_presupuesto_contexts(supabase, presupuesto_ids: list) -> dict:
+    """
+    Contextos de muchos presupuestos a la vez (exportación masiva y
+    build_presupuesto_context). Devuelve {presupuesto_id: ctx}; los que no
+    existen no aparecen. No usa la caché.
+    """
+    ids = list(dict.fromkeys(int(i) for i in presupuesto_ids if i))
+    if not ids:
+        return {}
+    crudos = _load_crudos_rpc(supabase, ids)
+    if crudos is None:
+        crudos = _load_crudos_in(supabase, ids)
+    return {c["presupuesto"]["presupuesto_id"]: _contexto_desde_crudo(c) for c in crudos if c.get("presupuesto")}
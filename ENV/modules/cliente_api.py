@@ -0,0 +1,38 @@
+"""
+Cliente HTTP para los endpoints de clientes que usan varios modulos.
+"""
+from typing import List
+
+import requests
+import streamlit as st
+
+
+def _base_url() -> str:
+    try:
+        return st.secrets["ORBE_API_URL"]  # type: ignore[attr-defined]
+    except Exception:
+        return st.session_state.get("ORBE_API_URL") or "http://127.0.0.1:8000"
+
+
+@st.cache_data(ttl=15, show_spinner=False)
+def _sugerencias(base_url: str, q: str, limit: int) -> List[dict]:
+    r = requests.get(f"{base_url}/api/clientes/suggest", params={"q": q, "limit": limit}, timeout=5)
+    r.raise_for_status()
+    return r.json().get("data") or []
+
+
+def sugerir_clientes(q: str, limit: int = 20) -> List[dict]:
+    """Autocompletado via GET /api/clientes/suggest; lista vacia si la API no responde."""
+    q = (q or "").strip()
+    if not q:
+        return []
+    try:
+        return _sugerencias(_base_url(), q, limit)
+    except Exception:
+        return []
+
+
+def etiqueta_cliente(c: dict, con_cif: bool = True) -> str:
+    nombre = c.get("razonsocial") or c.get("nombre") or f"Cliente {c.get('clienteid')}"
+    cif = c.get("cifdni") if con_cif else None
+    return f"{nombre} ({cif})" if cif else str(nombre)
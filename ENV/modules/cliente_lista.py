@@ -34,6 +34,7 @@ from modules.cliente_observacion import render_observaciones_form
 from modules.cliente_albaran_form import render_albaran_form
 from modules.cliente_crm import render_crm_form
 from modules.historial import render_historial
+from modules.ui.paginacion import hay_siguiente, params_pagina, registrar_pagina
 
 
 
@@ -388,6 +389,12 @@ def render_cliente_lista(API_URL: str):
     grupo_filtro = st.session_state.get("cli_grupo_filtro", "Todos")
     if grupo_filtro != "Todos":
         params["idgrupo"] = grupos.get(grupo_filtro)
+    # Solo las columnas que se pintan (las tarjetas usan la proyeccion por defecto)
+    if st.session_state["cli_view"] == "Tabla":
+        cols_sel = st.session_state.get("cli_table_cols") or defaults["cli_table_cols"]
+        params["fields"] = ",".join(cols_sel)
+    params.pop("page")
+    params.update(params_pagina("cli", page, params))
 
 
 
@@ -397,10 +404,10 @@ def render_cliente_lista(API_URL: str):
     clientes: List[Dict[str, Any]] = payload.get("data", [])
 
 
-    total = payload.get("total", 0)
+    total = registrar_pagina("cli", page, payload) or 0
 
 
-    total_pages = payload.get("total_pages", 1)
+    total_pages = max(1, math.ceil(total / page_size)) if total else page
 
 
     st.session_state["cli_result_count"] = len(clientes)
@@ -499,13 +506,13 @@ def render_cliente_lista(API_URL: str):
     with p2:
 
 
-        st.write(f"Pagina {page} / {max(1, total_pages)} - Total: {total}")
+        st.write(f"Pagina {page} / {max(1, total_pages)} - Total aprox.: {total}")
 
 
     with p3:
 
 
-        if st.button("Siguiente", disabled=page >= total_pages):
+        if st.button("Siguiente", disabled=not hay_siguiente("cli", page)):
 
 
             st.session_state["cli_page"] = page + 1
@@ -553,6 +560,29 @@ def _render_card(c: Dict[str, Any]):
     st.caption(f"ID {cid}")
 
 
+_FICHAS_MAX = 50
+
+
+def _get_ficha(clienteid: int) -> dict:
+    """
+    GET /api/clientes/{id} revalidando con If-None-Match: la ficha se guarda
+    en sesion con su ETag y, si no ha cambiado, la API contesta 304 sin cuerpo.
+    """
+    cache = st.session_state.setdefault("cli_fichas", {})
+    previa = cache.get(clienteid)
+    headers = {"If-None-Match": previa["etag"]} if previa and previa.get("etag") else {}
+    res = requests.get(f"{_api_base()}/api/clientes/{clienteid}", headers=headers, timeout=15)
+    if res.status_code == 304 and previa:
+        return previa["data"]
+    res.raise_for_status()
+    data = res.json()
+    cache.pop(clienteid, None)
+    if len(cache) >= _FICHAS_MAX:
+        cache.pop(next(iter(cache)))
+    cache[clienteid] = {"etag": res.headers.get("ETag"), "data": data}
+    return data
+
+
 def _render_ficha_panel(clienteid: int):
     with st.container(border=True):
         c1, c2 = st.columns([4, 1])
@@ -563,11 +593,8 @@ def _render_ficha_panel(clienteid: int):
                 st.session_state["cliente_detalle_id"] = None
                 st.rerun()
 
-        base = _api_base()
         try:
-            res = requests.get(f"{base}/api/clientes/{clienteid}", timeout=15)
-            res.raise_for_status()
-            data = res.json()
+            data = _get_ficha(clienteid)
         except Exception as e:
             st.error(f"Error cargando ficha: {e}")
             if st.button("Cerrar", key=f"cerrar_cli_err_{clienteid}"):
@@ -415,6 +415,10 @@ def render_cliente_potencial_lista():
 
 
 
+    _render_conversion_masiva(potenciales, q, total)
+
+
+
     # Paginacion
 
     st.markdown("---")
@@ -455,6 +459,82 @@ def render_cliente_potencial_lista():
 
 
 
+# =========================================================
+
+# Conversion masiva
+
+# =========================================================
+
+# Tope de clientes por conversion masiva (mismo que el backend)
+_MAX_LOTE = 5000
+
+
+def _render_conversion_masiva(potenciales: List[Dict[str, Any]], q: Optional[str], total: int):
+    with st.expander("Conversion masiva"):
+        opciones = {
+            c["clienteid"]: f"{_safe(c.get('razonsocial') or c.get('nombre'))} ({_safe(c.get('cifdni'))})"
+            for c in potenciales
+            if c.get("clienteid") is not None
+        }
+        seleccion = st.multiselect(
+            "Clientes de esta pagina",
+            options=list(opciones),
+            format_func=lambda cid: opciones.get(cid, str(cid)),
+            key="pot_lote_sel",
+        )
+
+        b1, b2 = st.columns(2)
+        res = None
+        with b1:
+            if st.button("Convertir seleccionados", disabled=not seleccion, use_container_width=True):
+                with st.spinner("Convirtiendo..."):
+                    res = _api_post("/api/clientes/convertir:lote", json={"clienteids": seleccion})
+        with b2:
+            if st.button(f"Convertir todos los del filtro ({total})", disabled=not total, use_container_width=True):
+                # Segundo paso: se confirma con el filtro y el total que se ven ahora
+                st.session_state["pot_lote_confirmar"] = {"q": q or None, "total": total}
+
+        pendiente = st.session_state.get("pot_lote_confirmar")
+        if pendiente:
+            n = min(pendiente["total"], _MAX_LOTE)
+            filtro = f" que coinciden con «{pendiente['q']}»" if pendiente["q"] else ""
+            st.warning(
+                f"Se van a convertir a cliente {n} potenciales{filtro}"
+                + (f" (como mucho {_MAX_LOTE} por vez)" if pendiente["total"] > _MAX_LOTE else "")
+                + ". Esta accion no se puede deshacer desde aqui."
+            )
+            c1, c2 = st.columns(2)
+            with c1:
+                if st.button("Confirmar conversion", type="primary", key="pot_lote_ok", use_container_width=True):
+                    st.session_state.pop("pot_lote_confirmar", None)
+                    with st.spinner("Convirtiendo..."):
+                        res = _api_post("/api/clientes/convertir:lote", json={"q": pendiente["q"]})
+            with c2:
+                if st.button("Cancelar", key="pot_lote_cancelar", use_container_width=True):
+                    st.session_state.pop("pot_lote_confirmar", None)
+                    st.rerun()
+
+        if res:
+            st.session_state["pot_lote_resultado"] = res
+            st.session_state.pop("pot_lote_sel", None)
+            st.rerun()
+
+        ultimo = st.session_state.get("pot_lote_resultado")
+        if ultimo:
+            convertidos = ultimo.get("convertidos") or []
+            fallidos = ultimo.get("fallidos") or []
+            if convertidos:
+                st.success(f"{len(convertidos)} clientes convertidos.")
+            if fallidos:
+                st.warning(f"{len(fallidos)} clientes no se han podido convertir.")
+                st.dataframe(pd.DataFrame(fallidos), use_container_width=True, hide_index=True)
+            if not convertidos and not fallidos:
+                st.info("No habia clientes potenciales que convertir.")
+
+
+
+
+
 # =========================================================
 
 # Cards y modal
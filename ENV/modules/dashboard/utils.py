@@ -3,6 +3,8 @@
 import streamlit as st
 from datetime import datetime, date
 
+from modules.cliente_api import etiqueta_cliente, sugerir_clientes
+
 
 # ==========================================================
 # 🔧 Utilidades de fecha y hora
@@ -35,7 +37,7 @@ def cliente_autocomplete(
     clienteid_inicial=None,
 ):
     """
-    Autocomplete con Supabase. Si no hay Supabase, se ofrece un campo numérico sencillo.
+    Autocomplete con GET /api/clientes/suggest. Si no hay Supabase, se ofrece un campo numérico sencillo.
     """
     if supabase is None:
         val = st.number_input(
@@ -59,25 +61,8 @@ def cliente_autocomplete(
     opciones = {"(Sin cliente)": None}
 
     if search and len(search.strip()) >= 2:
-        txt = search.strip()
-        rows = (
-            supabase.table("cliente")
-            .select("clienteid, razonsocial, nombre, cifdni")
-            .or_(
-                f"razonsocial.ilike.%{txt}%,"
-                f"nombre.ilike.%{txt}%,"
-                f"cifdni.ilike.%{txt}%"
-            )
-            .limit(20)
-            .execute()
-            .data or []
-        )
-
-        for c in rows:
-            nombre = c.get("razonsocial") or c.get("nombre") or f"Cliente {c['clienteid']}"
-            cif = c.get("cifdni") or ""
-            etiqueta = f"{nombre} ({cif})" if cif else nombre
-            opciones[etiqueta] = c["clienteid"]
+        for c in sugerir_clientes(search, limit=20):
+            opciones[etiqueta_cliente(c)] = c["clienteid"]
 
     # Valor por defecto
     default = "(Sin cliente)"
@@ -6,6 +6,8 @@ from typing import Any, Dict, List, Optional
 
 import streamlit as st
 
+from modules.cliente_api import etiqueta_cliente, sugerir_clientes
+
 
 def _table_exists(supabase, table: str) -> bool:
     if not supabase:
@@ -50,19 +52,20 @@ def render_historial(supabase):
         trabajadores = supabase.table("trabajador").select("trabajadorid,nombre,apellidos").execute().data or []
     except Exception:
         trabajadores = []
-    try:
-        clientes = supabase.table("cliente").select("clienteid,razonsocial,nombre").order("razonsocial").execute().data or []
-    except Exception:
-        clientes = []
 
     trabajadores_map = {f"{t.get('nombre','')} {t.get('apellidos','')}".strip(): t.get("trabajadorid") for t in trabajadores}
-    clientes_map = {(c.get("razonsocial") or c.get("nombre") or "-"): c.get("clienteid") for c in clientes}
+    # Clientes: busqueda en el indice de la API en vez de cargar la tabla entera
+    clientes_map: Dict[str, Any] = {"Cliente actual": clienteid} if clienteid else {}
 
     st.markdown("### Filtros")
     colf1, colf2, colf3, colf4 = st.columns([2, 2, 2, 2])
     with colf1:
         trab_sel = st.selectbox("Trabajador", ["Yo mismo"] + list(trabajadores_map.keys()))
     with colf2:
+        if not clienteid:
+            cli_busqueda = st.text_input("Buscar cliente", key="hist_cli_busqueda", placeholder="nombre o CIF...")
+            for c in sugerir_clientes(cli_busqueda, limit=30):
+                clientes_map[etiqueta_cliente(c, con_cif=False)] = c.get("clienteid")
         cli_sel = st.selectbox("Cliente", ["Todos"] + list(clientes_map.keys()))
     with colf3:
         tipo_filtro = st.selectbox("Tipo de comunicacion", ["Todos", "llamada", "reunion", "email", "whatsapp", "otro"], index=0)
@@ -4,6 +4,7 @@ from typing import List, Dict, Optional
 import pandas as pd
 import streamlit as st
 
+from modules.cliente_api import etiqueta_cliente, sugerir_clientes
 from modules.incidencia_workflow import render_incidencia_detalle as _render_inci_detalle
 
 
@@ -281,26 +282,11 @@ def _load_trabajadores(supabase) -> dict:
 
 
 def _load_clientes(supabase, search: str) -> Dict[str, int]:
-    if supabase is None or not search:
+    if not search:
         return {}
-    try:
-        rows = (
-            supabase.table("cliente")
-            .select("clienteid, razonsocial, nombre")
-            .ilike("razonsocial", f"%{search}%")
-            .order("razonsocial")
-            .limit(40)
-            .execute()
-            .data
-            or []
-        )
-    except Exception:
-        return {}
-
     out = {}
-    for r in rows:
-        label = r.get("razonsocial") or r.get("nombre") or f"Cliente {r.get('clienteid')}"
-        out[str(label)] = r.get("clienteid")
+    for r in sugerir_clientes(search, limit=40):
+        out[etiqueta_cliente(r, con_cif=False)] = r.get("clienteid")
     return out
 
 
@@ -56,6 +56,18 @@ def totales(pedidoid: int) -> dict:
     return _handle(r)
 
 
+def totales_lote(pedido_ids: list) -> dict:
+    """Totales guardados de varios pedidos en una llamada: {"data": [...], "pendientes": [...]}."""
+    if not pedido_ids:
+        return {"data": [], "pendientes": []}
+    r = requests.get(
+        f"{_base_url()}/api/pedidos/totales",
+        params={"ids": ",".join(str(i) for i in pedido_ids)},
+        timeout=15,
+    )
+    return _handle(r)
+
+
 def recalcular_totales(pedidoid: int, use_iva: bool, gastos_envio: float, envio_sin_cargo: bool) -> dict:
     params = {
         "use_iva": use_iva,
@@ -69,6 +81,11 @@ def agregar_linea(pedidoid: int, payload: dict) -> int:
     r = requests.post(f"{_base_url()}/api/pedidos/{pedidoid}/lineas", json=payload, timeout=20)
     return _handle(r)
 
+def sincronizar_lineas(pedidoid: int, lineas: list) -> dict:
+    """Guarda el conjunto completo de líneas; el backend aplica solo las diferencias."""
+    r = requests.put(f"{_base_url()}/api/pedidos/{pedidoid}/lineas", json={"lineas": lineas}, timeout=30)
+    return _handle(r)
+
 def borrar_linea(pedidoid: int, detalleid: int) -> dict:
     r = requests.delete(f"{_base_url()}/api/pedidos/{pedidoid}/lineas/{detalleid}", timeout=20)
     return _handle(r)
@@ -8,14 +8,15 @@ from modules.pedido_api import (
     detalle,
     lineas,
     totales,
+    totales_lote,
     recalcular_totales,
     observaciones,
     crear_observacion,
     catalogos,
-    agregar_linea,
-    borrar_linea,
+    sincronizar_lineas,
 )
 from modules.pedido_form import render_pedido_form
+from modules.ui.paginacion import hay_siguiente, params_pagina, registrar_pagina
 
 
 def _safe(val, default="-"):
@@ -165,18 +166,18 @@ def render_pedido_lista(_supabase=None):
             "fecha_desde": fecha_desde.isoformat() if fecha_desde else None,
             "fecha_hasta": fecha_hasta.isoformat() if fecha_hasta else None,
             "devoluciones": tipo_filtro == "Devolución",
-            "page": session.pedido_page,
             "page_size": per_page,
         }
+        params.update(params_pagina("pedido", session.pedido_page, params))
         payload = listar(params)
         pedidos = payload.get("data", [])
-        total = payload.get("total", 0)
+        total = registrar_pagina("pedido", session.pedido_page, payload) or 0
     except Exception as e:
         st.error(f"❌ Error cargando pedidos: {e}")
         return
 
     total_pages = max(1, math.ceil(max(1, total) / (page_size_cards if view == "Tarjetas" else page_size_table)))
-    st.caption(f"Página {session.pedido_page} de {total_pages} · Total aprox. página: {total}")
+    st.caption(f"Página {session.pedido_page} de {total_pages} · Total aprox.: {total}")
 
     colp1, colp2, colp3, _ = st.columns([1, 1, 1, 5])
     if colp1.button("⏮️", disabled=session.pedido_page <= 1):
@@ -185,7 +186,7 @@ def render_pedido_lista(_supabase=None):
     if colp2.button("⬅️", disabled=session.pedido_page <= 1):
         session.pedido_page -= 1
         st.rerun()
-    if colp3.button("➡️", disabled=session.pedido_page >= total_pages):
+    if colp3.button("➡️", disabled=not hay_siguiente("pedido", session.pedido_page)):
         session.pedido_page += 1
         st.rerun()
 
@@ -195,13 +196,22 @@ def render_pedido_lista(_supabase=None):
         st.info("ℹ️ No hay pedidos que coincidan con los filtros.")
         return
 
+    # Totales de toda la página en una llamada (sin recalcular líneas)
+    totales_map, pendientes = {}, set()
+    try:
+        tot = totales_lote([p["pedidoid"] for p in pedidos])
+        totales_map = {t["pedidoid"]: t for t in tot.get("data", [])}
+        pendientes = set(tot.get("pendientes", []))
+    except Exception:
+        pass
+
     if view == "Tarjetas":
         cols = st.columns(3)
         for idx, p in enumerate(pedidos):
             with cols[idx % 3]:
-                _render_pedido_card(p, estados_rev, clientes_rev)
+                _render_pedido_card(p, estados_rev, clientes_rev, totales_map.get(p["pedidoid"]), p["pedidoid"] in pendientes)
     else:
-        _render_table(pedidos, estados_rev)
+        _render_table(pedidos, estados_rev, totales_map)
 
     if session.get("show_pedido_modal"):
         _render_pedido_modal(
@@ -214,7 +224,7 @@ def render_pedido_lista(_supabase=None):
         )
 
 
-def _render_table(pedidos: list[dict], estados_rev: dict):
+def _render_table(pedidos: list[dict], estados_rev: dict, totales_map: dict):
     rows = []
     for p in pedidos:
         rows.append(
@@ -225,12 +235,13 @@ def _render_table(pedidos: list[dict], estados_rev: dict):
                 "Estado": estados_rev.get(p.get("estado_pedidoid")) or "-",
                 "Fecha": p.get("fecha_pedido"),
                 "Referencia": p.get("referencia_cliente"),
+                "Total": (totales_map.get(p.get("pedidoid")) or {}).get("total_importe"),
             }
         )
     st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
 
 
-def _render_pedido_card(p, estados_rev, clientes_rev):
+def _render_pedido_card(p, estados_rev, clientes_rev, tot=None, pendiente=False):
     cliente_nombre = clientes_rev.get(p.get("clienteid")) or "-"
     estado_nombre = estados_rev.get(p.get("estado_pedidoid"))
     color_estado = _color_estado(estado_nombre)
@@ -251,6 +262,9 @@ def _render_pedido_card(p, estados_rev, clientes_rev):
             <div style="color:#777;font-size:0.85rem;margin-top:4px;">
                 Ref. cliente: {_safe(p.get("referencia_cliente"))}
             </div>
+            <div style="margin-top:4px;font-size:0.9rem;">
+                💶 {_money(tot.get("total_importe")) if tot else "-"}{" · ⏳ recalculando" if pendiente else ""}
+            </div>
         </div>
         """,
         unsafe_allow_html=True,
@@ -343,48 +357,58 @@ def _render_pedido_modal(
         st.error(f"❌ Error cargando líneas: {e}")
         lineas_data = []
 
-    if not lineas_data:
-        st.info("ℹ️ No hay líneas registradas para este pedido.")
-    else:
-        df = pd.DataFrame(lineas_data)
-        st.dataframe(df, use_container_width=True, hide_index=True)
-
-    # Alta / baja de líneas
-    with st.expander("➕ Añadir línea", expanded=False):
-        with st.form(f"form_add_linea_{pedidoid}"):
-            productoid = st.number_input("ID producto (opcional)", min_value=0, value=0, step=1)
-            nombre_prod = st.text_input("Descripción / nombre del producto")
-            cantidad = st.number_input("Cantidad", min_value=1.0, value=1.0)
-            precio = st.number_input("Precio base unitario (sin IVA)", min_value=0.0, value=0.0, step=0.01)
-            desc_manual = st.number_input("Descuento (%)", min_value=0.0, max_value=100.0, value=0.0, step=0.5)
-            add_ok = st.form_submit_button("💾 Añadir línea", use_container_width=True)
-
-        if add_ok:
-            try:
-                payload = {
-                    "productoid": int(productoid) if productoid else None,
-                    "nombre_producto": nombre_prod.strip() or None,
-                    "cantidad": float(cantidad),
-                    "precio_unitario": float(precio),
-                    "descuento_pct": float(desc_manual),
-                }
-                agregar_linea(pedidoid, payload)
-                st.success("✅ Línea añadida.")
-                st.rerun()
-            except Exception as e:
-                st.error(f"❌ Error añadiendo línea: {e}")
-
-    if lineas_data:
-        with st.expander("🗑️ Eliminar línea", expanded=False):
-            opciones = {f"{l.get('pedido_detalleid')} · {l.get('nombre_producto')}": l.get("pedido_detalleid") for l in lineas_data}
-            sel = st.selectbox("Selecciona línea a eliminar", list(opciones.keys()))
-            if st.button("Eliminar línea seleccionada"):
-                try:
-                    borrar_linea(pedidoid, opciones[sel])
-                    st.success("🗑️ Línea eliminada.")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"❌ Error eliminando línea: {e}")
+    # Edición de líneas: se guarda el conjunto completo en una llamada (diff en el servidor)
+    columnas = ["pedido_detalleid", "productoid", "nombre_producto", "cantidad", "precio_unitario", "descuento_pct", "importe_total_linea"]
+    df = pd.DataFrame(lineas_data, columns=columnas)
+    if df.empty:
+        st.info("ℹ️ No hay líneas registradas para este pedido. Añádelas en la tabla.")
+    editado = st.data_editor(
+        df,
+        key=f"pedido_lineas_editor_{pedidoid}",
+        num_rows="dynamic",
+        use_container_width=True,
+        hide_index=True,
+        disabled=["pedido_detalleid", "importe_total_linea"],
+        column_config={
+            "pedido_detalleid": st.column_config.NumberColumn("ID", format="%d"),
+            "productoid": st.column_config.NumberColumn("ID producto", format="%d"),
+            "nombre_producto": st.column_config.TextColumn("Producto"),
+            "cantidad": st.column_config.NumberColumn("Cantidad", min_value=0.0, default=1.0),
+            "precio_unitario": st.column_config.NumberColumn("Precio (sin IVA)", min_value=0.0, default=0.0, format="%.2f"),
+            "descuento_pct": st.column_config.NumberColumn("Dto. %", min_value=0.0, max_value=100.0, default=0.0),
+            "importe_total_linea": st.column_config.NumberColumn("Importe", format="%.2f"),
+        },
+    )
+
+    # El resultado del guardado se muestra tras el st.rerun que refresca las lineas
+    msg_key = f"pedido_lineas_msg_{pedidoid}"
+    if st.session_state.get(msg_key):
+        st.success(st.session_state.pop(msg_key))
+
+    if st.button("💾 Guardar líneas", key=f"pedido_lineas_guardar_{pedidoid}", use_container_width=True):
+        def _num(v, default=None):
+            return default if v is None or pd.isna(v) else v
+
+        payload = [
+            {
+                "pedido_detalleid": int(_num(r["pedido_detalleid"])) if _num(r["pedido_detalleid"]) is not None else None,
+                "productoid": int(_num(r["productoid"])) if _num(r["productoid"]) else None,
+                "nombre_producto": (str(r["nombre_producto"]).strip() or None) if _num(r["nombre_producto"]) is not None else None,
+                "cantidad": float(_num(r["cantidad"], 1.0)),
+                "precio_unitario": float(_num(r["precio_unitario"], 0.0)),
+                "descuento_pct": float(_num(r["descuento_pct"], 0.0)),
+            }
+            for r in editado.to_dict("records")
+        ]
+        try:
+            res = sincronizar_lineas(pedidoid, payload)
+            st.session_state[msg_key] = (
+                f"✅ Líneas guardadas: {res.get('insertadas', 0)} nuevas, "
+                f"{res.get('actualizadas', 0)} modificadas, {res.get('borradas', 0)} eliminadas."
+            )
+            st.rerun()
+        except Exception as e:
+            st.error(f"❌ Error guardando líneas: {e}")
 
     st.markdown("---")
     st.subheader("💰 Totales del pedido")
@@ -406,7 +430,10 @@ def _render_pedido_modal(
     with st.expander("🔄 Recalcular totales", expanded=False):
         st.caption("Recalcula los importes con tarifas, descuentos e impuestos reales por producto.")
 
-        use_iva = st.checkbox("Aplicar IVA (según producto o tarifa)", value=True)
+        use_iva = st.checkbox(
+            "Aplicar IVA (según producto o tarifa)",
+            value=tot.get("use_iva") is not False if tot else True,
+        )
         gastos = st.number_input("Gastos de envío (€)", min_value=0.0, value=float(tot.get("gastos_envio", 0.0)) if tot else 0.0, step=0.01)
         envio_sin_cargo = st.checkbox("Envío sin cargo", value=bool(tot.get("envio_sin_cargo")) if tot else False)
 
@@ -20,14 +20,15 @@
 # - Si no, usa producto_tipo.impuestoid
 # - Si no, busca en IMPUESTO por país (según región de envío→facturación) y tipo_producto,
 #   dando preferencia a coincidencia exacta de tipo_producto; fallback a "general" (tipo null)
+# - Los impuestos se resuelven con ImpuestoResolver (cache por proceso, sin consultas por línea)
 #
 # Redondeo a 2 decimales en todos los importes.
 
 from datetime import date
-from math import prod
-from turtle import st
 from typing import Optional, Dict, Any
 
+from comun.impuesto_resolver import ImpuestoResolver, ImpuestoResolverCache
+
 
 def _today_iso(d: Optional[date] = None) -> str:
     return (d or date.today()).isoformat()
@@ -139,6 +140,7 @@ def _fetch_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
         "familia_productoid": None,
         "precio_generico": 0.0,
         "impuestoid": None,
+        "tipo_impuestoid": None,
         "producto_tipoid": None,
         "tipo_producto_nombre": None,
     }
@@ -171,6 +173,7 @@ def _fetch_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
                 )
                 if trow:
                     ctx["tipo_producto_nombre"] = trow.get("nombre")
+                    ctx["tipo_impuestoid"] = trow.get("impuestoid")
                     # si producto no trae impuestoid, heredar del tipo
                     if not ctx["impuestoid"] and trow.get("impuestoid"):
                         ctx["impuestoid"] = trow.get("impuestoid")
@@ -181,11 +184,38 @@ def _fetch_producto_ctx(supabase, productoid: Optional[int]) -> Dict[str, Any]:
 # ======================================================
 # 🧾 Resolver IVA / impuesto
 # ======================================================
+def _cargar_impuestos(supabase) -> ImpuestoResolver:
+    filas = (
+        supabase.table("impuesto")
+        .select("impuestoid, nombre, porcentaje, tipo_producto, pais, habilitado, fecha_inicio, fecha_fin")
+        .eq("habilitado", True)
+        .execute()
+        .data
+        or []
+    )
+    return ImpuestoResolver(
+        filas,
+        ambito_field="pais",
+        tipo_field="tipo_producto",
+        pct_field="porcentaje",
+        nombre_field="nombre",
+        tipo_key=lambda v: (v or "").lower(),
+    )
+
+
+# Impuestos en cache de proceso (TTL); recargar_impuestos() fuerza la recarga
+_IMPUESTOS = ImpuestoResolverCache(_cargar_impuestos)
+
+
+def recargar_impuestos(supabase):
+    _IMPUESTOS.recargar(supabase)
+
+
 def _resolve_impuesto_pct(
     supabase,
     *,
     product_impuestoid: Optional[int],
-    producto_tipoid: Optional[int],
+    tipo_impuestoid: Optional[int],
     producto_tipo_nombre: Optional[str],
     region_nombre: Optional[str],
     fecha_iso: str,
@@ -193,83 +223,37 @@ def _resolve_impuesto_pct(
     """
     Determina el IVA aplicable según producto, tipo y región.
     """
+    try:
+        resolver = _IMPUESTOS.get(supabase)
+    except Exception:
+        return {"iva_pct": 0.0, "iva_nombre": None, "iva_origen": "desconocido"}
+
     # 1️⃣ Impuesto del producto
-    if product_impuestoid:
-        try:
-            imp = (
-                supabase.table("impuesto")
-                .select("impuestoid, nombre, porcentaje, pais, habilitado, fecha_inicio, fecha_fin")
-                .eq("impuestoid", product_impuestoid)
-                .single()
-                .execute()
-                .data
-            )
-            if imp and imp.get("habilitado") and _is_active_window(imp, fecha_iso):
-                return {"iva_pct": float(imp["porcentaje"]), "iva_nombre": imp["nombre"], "iva_origen": "producto"}
-        except Exception:
-            pass
+    imp = resolver.por_id(product_impuestoid, fecha_iso)
+    if imp:
+        return {"iva_pct": float(imp["porcentaje"]), "iva_nombre": imp["nombre"], "iva_origen": "producto"}
 
     # 2️⃣ Impuesto del tipo de producto (si no tiene propio)
-    if producto_tipoid:
-        try:
-            tipo = (
-                supabase.table("producto_tipo")
-                .select("impuestoid, nombre")
-                .eq("producto_tipoid", producto_tipoid)
-                .single()
-                .execute()
-                .data
-            )
-            if tipo and tipo.get("impuestoid"):
-                imp = (
-                    supabase.table("impuesto")
-                    .select("nombre, porcentaje, pais, habilitado, fecha_inicio, fecha_fin")
-                    .eq("impuestoid", tipo["impuestoid"])
-                    .single()
-                    .execute()
-                    .data
-                )
-                if imp and imp.get("habilitado") and _is_active_window(imp, fecha_iso):
-                    return {"iva_pct": float(imp["porcentaje"]), "iva_nombre": imp["nombre"], "iva_origen": "producto_tipo"}
-        except Exception:
-            pass
+    imp = resolver.por_id(tipo_impuestoid, fecha_iso)
+    if imp:
+        return {"iva_pct": float(imp["porcentaje"]), "iva_nombre": imp["nombre"], "iva_origen": "producto_tipo"}
 
     # 3️⃣ Búsqueda contextual por tipo_producto + país/región
-    try:
-        q = supabase.table("impuesto").select("nombre, porcentaje, tipo_producto, pais, habilitado, fecha_inicio, fecha_fin")
-        q = q.eq("habilitado", True)
-        if region_nombre:
-            q = q.eq("pais", region_nombre)
-        imps = q.execute().data or []
-        imps = [i for i in imps if _is_active_window(i, fecha_iso)]
-
-        exact = [i for i in imps if (i.get("tipo_producto") or "").lower() == (producto_tipo_nombre or "").lower()]
-        if exact:
-            i0 = exact[0]
-            return {"iva_pct": float(i0["porcentaje"]), "iva_nombre": i0["nombre"], "iva_origen": "busqueda"}
-
-        general = [i for i in imps if not i.get("tipo_producto")]
-        if general:
-            i0 = general[0]
-            return {"iva_pct": float(i0["porcentaje"]), "iva_nombre": i0["nombre"], "iva_origen": "busqueda"}
-    except Exception:
-        pass
+    ivx = resolver.resolver(
+        producto_tipoid=producto_tipo_nombre,
+        ambito=region_nombre,
+        fecha_iso=fecha_iso,
+        origen_tipo="busqueda",
+        origen_general="busqueda",
+    )
+    if ivx["iva_origen"] != "desconocido":
+        return ivx
 
     # 4️⃣ Fallback genérico España 21%
-    try:
-        imp_es = (
-            supabase.table("impuesto")
-            .select("nombre, porcentaje")
-            .eq("pais", "España")
-            .eq("habilitado", True)
-            .execute()
-            .data
-        )
-        if imp_es:
-            gen = next((i for i in imp_es if "general" in i.get("nombre", "").lower()), imp_es[0])
-            return {"iva_pct": float(gen["porcentaje"]), "iva_nombre": gen["nombre"], "iva_origen": "fallback"}
-    except Exception:
-        pass
+    imp_es = [i for i in resolver.filas if i.get("pais") == "España"]
+    if imp_es:
+        gen = next((i for i in imp_es if "general" in (i.get("nombre") or "").lower()), imp_es[0])
+        return {"iva_pct": float(gen["porcentaje"]), "iva_nombre": gen["nombre"], "iva_origen": "fallback"}
 
     return {"iva_pct": 0.0, "iva_nombre": None, "iva_origen": "desconocido"}
 
@@ -441,7 +425,7 @@ def calcular_precio_linea(
     ivx = _resolve_impuesto_pct(
         supabase,
         product_impuestoid=pr_ctx.get("impuestoid"),
-        producto_tipoid=pr_ctx.get("producto_tipoid"),
+        tipo_impuestoid=pr_ctx.get("tipo_impuestoid"),
         producto_tipo_nombre=pr_ctx.get("tipo_producto_nombre"),
         region_nombre=cli_ctx.get("region_nombre") or "España",
         fecha_iso=fecha_iso,
@@ -2,12 +2,16 @@
 Cliente ligero para la API de presupuestos (FastAPI).
 Centraliza las llamadas HTTP para que los mÃ³dulos Streamlit no dependan de Supabase.
 """
+import os
+import tempfile
 from datetime import date
 from typing import Any, Dict, Optional
 
 import requests
 import streamlit as st
 
+from comun.presupuesto_context import invalidar_contexto
+
 
 def _base_url() -> str:
     try:
@@ -48,11 +52,13 @@ def crear_presupuesto(payload: dict) -> dict:
 
 def actualizar_presupuesto(presupuestoid: int, payload: dict) -> dict:
     r = requests.put(f"{_base_url()}/api/presupuestos/{presupuestoid}", json=payload, timeout=20)
+    invalidar_contexto(presupuestoid)
     return _handle_response(r)
 
 
 def borrar_presupuesto(presupuestoid: int) -> dict:
     r = requests.delete(f"{_base_url()}/api/presupuestos/{presupuestoid}", timeout=20)
+    invalidar_contexto(presupuestoid)
     return _handle_response(r)
 
 
@@ -63,6 +69,29 @@ def listar_lineas(presupuestoid: int) -> list:
 
 def agregar_linea(presupuestoid: int, payload: dict) -> int:
     r = requests.post(f"{_base_url()}/api/presupuestos/{presupuestoid}/lineas", json=payload, timeout=20)
+    invalidar_contexto(presupuestoid)
+    return _handle_response(r)
+
+
+def agregar_lineas(presupuestoid: int, lineas: list) -> dict:
+    r = requests.post(
+        f"{_base_url()}/api/presupuestos/{presupuestoid}/lineas:batch",
+        json={"lineas": lineas},
+        timeout=60,
+    )
+    invalidar_contexto(presupuestoid)
+    return _handle_response(r)
+
+
+def actualizar_linea(presupuestoid: int, detalleid: int, payload: dict) -> dict:
+    r = requests.patch(f"{_base_url()}/api/presupuestos/{presupuestoid}/lineas/{detalleid}", json=payload, timeout=20)
+    invalidar_contexto(presupuestoid)
+    return _handle_response(r)
+
+
+def borrar_linea(presupuestoid: int, detalleid: int) -> dict:
+    r = requests.delete(f"{_base_url()}/api/presupuestos/{presupuestoid}/lineas/{detalleid}", timeout=20)
+    invalidar_contexto(presupuestoid)
     return _handle_response(r)
 
 
@@ -73,6 +102,7 @@ def recalcular_lineas(presupuestoid: int, fecha_calculo: Optional[date] = None)
         params=params,
         timeout=30,
     )
+    invalidar_contexto(presupuestoid)
     return _handle_response(r)
 
 
@@ -81,6 +111,32 @@ def convertir_a_pedido(presupuestoid: int) -> dict:
     return _handle_response(r)
 
 
+def exportar_pdfs_zip(payload: dict) -> Optional[str]:
+    """
+    ZIP con los PDFs de los presupuestos (ids o filtros). El backend lo envía
+    por trozos y se vuelca a un fichero temporal sin pasar entero por memoria;
+    devuelve su ruta (quien llama lo borra) o None si no hay presupuestos.
+    """
+    with requests.post(
+        f"{_base_url()}/api/presupuestos/pdf:zip",
+        json=payload,
+        stream=True,
+        timeout=(10, 600),
+    ) as r:
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        with tempfile.NamedTemporaryFile(prefix="orbe_presupuestos_", suffix=".zip", delete=False) as f:
+            try:
+                for chunk in r.iter_content(chunk_size=1 << 16):
+                    f.write(chunk)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+            return f.name
+
+
 def cliente_basico(clienteid: int) -> dict:
     r = requests.get(f"{_base_url()}/api/presupuestos/cliente/{clienteid}/basico", timeout=15)
     return _handle_response(r)
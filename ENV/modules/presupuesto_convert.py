@@ -14,7 +14,7 @@ def convertir_presupuesto_a_pedido(presupuestoid: int):
         if resp.get("ya_existia"):
             st.info(f"ℹ️ Ya existe un pedido asociado: #{resp.get('numero')}")
         else:
-            st.success(f"✅ Presupuesto convertido a pedido {resp.get('numero')}")
+            st.success(f"✅ Presupuesto convertido a pedido {resp.get('numero')} ({resp.get('lineas', 0)} líneas)")
         return resp.get("pedidoid")
     except Exception as e:
         st.error(f"❌ Error convirtiendo presupuesto: {e}")
@@ -1,5 +1,6 @@
 import io
 import math
+import os
 from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Optional
 
@@ -17,16 +18,24 @@ from modules.presupuesto_api import (
     agregar_linea,
     borrar_presupuesto,
     cliente_basico,
+    exportar_pdfs_zip,
 )
 from modules.presupuesto_detalle import render_presupuesto_detalle
 from modules.presupuesto_form import render_presupuesto_form
 from modules.presupuesto_convert import convertir_presupuesto_a_pedido
-from modules.presupuesto_pdf import generate_pdf_for_download, build_pdf_bytes, upload_pdf_to_storage, _build_data_real
+from modules.presupuesto_pdf import (
+    generate_pdf_for_download,
+    esperar_pdf,
+    precalentar_pdf,
+    upload_pdf_to_storage,
+    _build_data_real,
+)
 from modules.presupuesto_api import _base_url
 from modules.ui.page import page
 from modules.ui.section import section
 from modules.ui.card import card
 from modules.ui.empty import empty_state
+from modules.ui.paginacion import hay_siguiente, params_pagina, registrar_pagina
 
 
 def _safe(val, default="-"):
@@ -85,7 +94,9 @@ def _render_estado_quick_filters(estados_labels):
 
 def _emitir_pdf_presupuesto(supabase, presupuestoid: int, estados_map: dict):
     data_real = _build_data_real(supabase, presupuestoid)
-    pdf_bytes, fname = build_pdf_bytes(data_real)
+    pdf_bytes, fname = esperar_pdf(data_real)
+    if pdf_bytes is None:
+        return False
     try:
         url = upload_pdf_to_storage(supabase, pdf_bytes, fname, bucket="presupuestos")
     except Exception as e:
@@ -474,24 +485,92 @@ def _render_presupuesto_modal(estados_map: dict):
             if not supa:
                 st.warning("No hay conexion a base de datos.")
             else:
+                # Se pinta en segundo plano mientras el usuario decide
+                if not st.session_state.get(f"pres_pdf_pre_{pid}"):
+                    st.session_state[f"pres_pdf_pre_{pid}"] = True
+                    precalentar_pdf(supa, pid)
+
+                # La accion pedida sigue pendiente mientras el PDF se pinta (esperar_pdf)
+                accion_key = f"pres_pdf_accion_{pid}"
                 key = f"pres_show_pdf_{pid}"
                 if st.button("Ver PDF", key=key, use_container_width=True):
-                    generate_pdf_for_download(supa, pid)
+                    st.session_state[accion_key] = "ver"
                 if st.button("Descargar PDF", key=f"pres_dl_pdf_{pid}", use_container_width=True):
-                    try:
-                        data_real = _build_data_real(supa, pid)
-                        pdf_bytes, fname = build_pdf_bytes(data_real)
-                        st.download_button("Descargar PDF generado", pdf_bytes, file_name=fname, mime="application/pdf", use_container_width=True)
-                    except Exception as err:
-                        st.error(f"Error generando PDF: {err}")
+                    st.session_state[accion_key] = "descargar"
 
                 colp1, colp2 = st.columns(2)
                 with colp1:
                     if st.button("Emitir PDF", key=f"pres_emit_pdf_{pid}", use_container_width=True):
-                        _emitir_pdf_presupuesto(supa, pid, estados_map)
+                        st.session_state[accion_key] = "emitir"
                 with colp2:
                     st.caption("Emite, guarda en storage y marca como Enviado.")
 
+                accion = st.session_state.get(accion_key)
+                if accion:
+                    listo = True
+                    try:
+                        if accion == "ver":
+                            listo = generate_pdf_for_download(supa, pid)[0] is not None
+                        elif accion == "descargar":
+                            pdf_bytes, fname = esperar_pdf(_build_data_real(supa, pid))
+                            listo = pdf_bytes is not None
+                            if listo:
+                                st.download_button("Descargar PDF generado", pdf_bytes, file_name=fname, mime="application/pdf", use_container_width=True)
+                        else:
+                            listo = _emitir_pdf_presupuesto(supa, pid, estados_map) is not False
+                    except Exception as err:
+                        st.error(f"Error generando PDF: {err}")
+                    # Mientras el PDF se pinta la accion sigue pendiente; el fragmento
+                    # de esperar_pdf relanza la pagina al terminar
+                    if listo:
+                        st.session_state.pop(accion_key, None)
+
+
+def _render_exportacion_pdf(filtros: dict):
+    """Exporta a un ZIP los PDFs de todos los presupuestos del filtro actual en un rango de fechas."""
+    with st.expander("Exportar PDFs (ZIP)", expanded=False):
+        hoy = date.today()
+        e1, e2, e3 = st.columns([1, 1, 1])
+        with e1:
+            desde = st.date_input("Desde", value=hoy.replace(day=1), key="pres_zip_desde")
+        with e2:
+            hasta = st.date_input("Hasta", value=hoy, key="pres_zip_hasta")
+        with e3:
+            st.write("")
+            generar = st.button("Generar ZIP", key="pres_zip_btn", use_container_width=True)
+        st.caption("Usa los filtros de arriba (búsqueda, estado, cliente y ámbito) y la fecha del presupuesto.")
+
+        if generar:
+            payload = {k: v for k, v in filtros.items() if v is not None}
+            payload.update({"fecha_desde": desde.isoformat(), "fecha_hasta": hasta.isoformat()})
+            # En session_state solo va la ruta del ZIP temporal; el anterior se borra
+            ruta_previa, _ = st.session_state.pop("pres_zip", None) or (None, None)
+            if ruta_previa:
+                try:
+                    os.remove(ruta_previa)
+                except OSError:
+                    pass
+            try:
+                with st.spinner("Generando PDFs..."):
+                    ruta = exportar_pdfs_zip(payload)
+                st.session_state["pres_zip"] = (ruta or "", f"presupuestos_{desde:%Y%m%d}_{hasta:%Y%m%d}.zip")
+            except Exception as e:
+                st.error(f"❌ Error exportando PDFs: {e}")
+
+        ruta, fname = st.session_state.get("pres_zip") or (None, None)
+        if ruta == "":
+            st.info("No hay presupuestos en ese rango con los filtros actuales.")
+        elif ruta and os.path.exists(ruta):
+            with open(ruta, "rb") as f:
+                st.download_button(
+                    "⬇️ Descargar ZIP",
+                    f,
+                    file_name=fname,
+                    mime="application/zip",
+                    key="pres_zip_dl",
+                    use_container_width=True,
+                )
+
 
 def render_presupuesto_lista(api_base: Optional[str] = None):
     apply_orbe_theme()
@@ -592,6 +671,17 @@ def render_presupuesto_lista(api_base: Optional[str] = None):
             ("Buscar", (q or "").strip() or None),
         ])
 
+        _render_exportacion_pdf(
+            {
+                "q": (q or "").strip() or None,
+                "estadoid": next((k for k, v in estados_map.items() if v == estado_sel), None)
+                if estado_sel != "Todos"
+                else None,
+                "clienteid": clientes_map.get(cliente_filtro) if cliente_filtro != "Todos" else None,
+                "ambito_impuesto": None if ambito_sel == "Todos" else ambito_sel,
+            }
+        )
+
         fingerprint = (
             (q or "").strip(),
             estado_sel,
@@ -616,7 +706,6 @@ def render_presupuesto_lista(api_base: Optional[str] = None):
             per_page = page_size_cards if st.session_state["pres_view"] == "Tarjetas" else page_size_table
             params = {
                 "q": q or None,
-                "page": st.session_state["pres_page"],
                 "page_size": per_page,
                 "ordenar_por": "fecha_presupuesto" if orden_sel == "Fecha de presupuesto" else "creado_en",
                 "ambito_impuesto": None if ambito_sel == "Todos" else ambito_sel,
@@ -626,9 +715,11 @@ def render_presupuesto_lista(api_base: Optional[str] = None):
             if cliente_filtro != "Todos":
                 params["clienteid"] = clientes_map.get(cliente_filtro)
 
+            params.update(params_pagina("pres", st.session_state["pres_page"], params))
+
             payload = list_presupuestos(params)
             rows = payload.get("data", [])
-            total = payload.get("total", 0)
+            total = registrar_pagina("pres", st.session_state["pres_page"], payload) or 0
             if st.session_state.get("pres_only_with_lines"):
                 rows = [r for r in rows if (r.get("num_lineas") or 0) > 0]
 
@@ -645,7 +736,7 @@ def render_presupuesto_lista(api_base: Optional[str] = None):
         per_page = page_size_cards if st.session_state["pres_view"] == "Tarjetas" else page_size_table
         total_pages = max(1, math.ceil((total or 0) / per_page))
 
-        st.caption(f"Página {st.session_state['pres_page']} / {total_pages} · Total: {total}")
+        st.caption(f"Página {st.session_state['pres_page']} / {total_pages} · Total aprox.: {total}")
 
         p1, p2, p3 = st.columns(3)
         with p1:
@@ -655,7 +746,7 @@ def render_presupuesto_lista(api_base: Optional[str] = None):
         with p2:
             st.write("")
         with p3:
-            if st.button("Siguiente ➡️", disabled=st.session_state["pres_page"] >= total_pages):
+            if st.button("Siguiente ➡️", disabled=not hay_siguiente("pres", st.session_state["pres_page"])):
                 st.session_state["pres_page"] += 1
                 st.rerun()
 
@@ -1,536 +1,193 @@
 # modules/presupuesto_pdf.py
-import io
+"""
+PDF de presupuesto en Streamlit: cache de renderizados, render en segundo
+plano, subida a storage y vista previa. El PDF en si se construye en
+comun/presupuesto_pdf.py.
+"""
 import os
 import base64
-from datetime import datetime
-
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Paragraph,
-    Spacer,
-    Table,
-    TableStyle,
-    Image,
-    HRFlowable,
-)
-from reportlab.lib.styles import getSampleStyleSheet
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
 
-from modules.presupuesto_context import build_presupuesto_context
+from comun.presupuesto_pdf import _build_data_real, _file_name, build_pdf_bytes, pdf_hash
 
 BUCKET_DEFAULT = "presupuestos"
 
 
 # =========================================================
-# Helpers
+# CACHE DE PDF RENDERIZADOS (memoria + disco, LRU)
 # =========================================================
-def _money(v):
-    try:
-        return f"{float(v):,.2f} €"
-    except Exception:
-        return "-"
+class PdfCache:
+    """
+    Dos niveles:
+      - memoria: OrderedDict con las max_items ultimas entradas
+      - disco:   un fichero <hash>.pdf por entrada; al superar max_disk_bytes
+                 se borran los de acceso mas antiguo (mtime se toca en cada hit)
+    """
 
+    def __init__(self, directorio: str, max_items: int = 32, max_disk_bytes: int = 256 * 1024 * 1024):
+        self.directorio = directorio
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.pdf")
+
+    def get(self, clave: str) -> Optional[bytes]:
+        with self._lock:
+            if clave in self._mem:
+                self._mem.move_to_end(clave)
+                return self._mem[clave]
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "rb") as f:
+                data = f.read()
+            os.utime(ruta, None)
+        except OSError:
+            return None
+        self._guardar_mem(clave, data)
+        return data
+
+    def put(self, clave: str, data: bytes):
+        self._guardar_mem(clave, data)
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            tmp = self._ruta(clave) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._ruta(clave))
+            self._purgar_disco()
+        except OSError:
+            pass  # el disco es una mejora; la memoria sigue sirviendo
+
+    def _guardar_mem(self, clave: str, data: bytes):
+        with self._lock:
+            self._mem[clave] = data
+            self._mem.move_to_end(clave)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    def _purgar_disco(self):
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".pdf"):
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    info = os.stat(ruta)
+                except OSError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, ruta))
+        total = sum(e[1] for e in entradas)
+        for _, size, ruta in sorted(entradas):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(ruta)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+
+_CACHE = PdfCache(
+    os.getenv("ORBE_PDF_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "orbe_presupuestos_pdf")
+)
 
-def _safe(v, default="-"):
-    return v if v not in (None, "", "null") else default
+# Renders en segundo plano (el hilo de Streamlit no pinta el PDF)
+_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="presupuesto_pdf")
+_EN_CURSO: Dict[str, Future] = {}
+_EN_CURSO_LOCK = threading.Lock()
+# Intervalo del fragmento que espera un PDF (ver esperar_pdf)
+_SONDEO_SEGUNDOS = 0.5
 
 
-def _bold(text: str) -> str:
-    return f"<b>{text}</b>"
+def _render_y_cachear(clave: str, data_real: dict) -> bytes:
+    try:
+        pdf_bytes, _ = build_pdf_bytes(data_real)
+        _CACHE.put(clave, pdf_bytes)
+        return pdf_bytes
+    finally:
+        with _EN_CURSO_LOCK:
+            _EN_CURSO.pop(clave, None)
 
 
-def _fmt_fecha_ddmmaaaa(fecha_val):
+def render_pdf_async(data_real: dict) -> "Future[bytes]":
     """
-    Recibe:
-      - string ISO (2025-11-11)
-      - datetime
-      - date
-      - string dd/mm/aaaa
-    y devuelve dd/mm/aaaa si puede.
+    Devuelve un Future con los bytes del PDF. Si esta en cache el Future ya
+    viene resuelto; si ya se esta pintando el mismo contenido se reutiliza.
     """
-    if not fecha_val:
-        return "-"
-    # Ya viene en formato dd/mm/aaaa
-    if isinstance(fecha_val, str) and "/" in fecha_val:
-        return fecha_val
-    try:
-        if isinstance(fecha_val, datetime):
-            d = fecha_val.date()
-        else:
-            d = datetime.fromisoformat(str(fecha_val)).date()
-        return d.strftime("%d/%m/%Y")
-    except Exception:
-        return str(fecha_val)
-
-
-def _build_data_real(supabase, presupuestoid: int) -> dict:
+    clave = pdf_hash(data_real)
+    cached = _CACHE.get(clave)
+    if cached is not None:
+        fut: Future = Future()
+        fut.set_result(cached)
+        return fut
+    with _EN_CURSO_LOCK:
+        fut = _EN_CURSO.get(clave)
+        if fut is None:
+            fut = _POOL.submit(_render_y_cachear, clave, data_real)
+            _EN_CURSO[clave] = fut
+    return fut
+
+
+def build_pdf_bytes_cached(data_real: dict) -> Tuple[Optional[bytes], str]:
     """
-    Construye el data_real FINAL a partir del contexto unificado del presupuesto.
-    Este data_real es el que consume build_pdf_bytes().
+    Como build_pdf_bytes pero servido desde cache / pool de render y sin
+    esperar: si el PDF aun se esta pintando devuelve (None, nombre). Los
+    errores del render se propagan cuando el Future ha terminado.
     """
-    ctx = build_presupuesto_context(supabase, presupuestoid)
-
-    empresa = ctx.get("empresa", {}) or {}
-    cli_ctx = ctx.get("cliente", {}) or {}
-    pres = ctx.get("presupuesto", {}) or {}
-    tot = ctx.get("totales", {}) or {}
-
-    dir_fiscal = ctx.get("direccion_fiscal") or {}
-    dir_envio = ctx.get("direccion_envio") or {}
-
-    # ---------------------------------------------
-    # USAR DIRECTAMENTE LAS LÍNEAS DEL CONTEXTO
-    # ---------------------------------------------
-    lineas_pdf = []
-    for item in ctx.get("lineas", []):
-        # item YA contiene los campos correctos
-        lineas_pdf.append(
-            {
-                "concepto": item.get("concepto"),
-                "unidades": item.get("unidades"),
-                "precio": item.get("precio"),
-                "dto": item.get("dto"),
-                "iva": item.get("iva"),
-                "base": item.get("base"),
-                "total": item.get("total"),
-            }
-        )
-
-    data_real = {
-        "empresa": empresa,
-        "cliente": cli_ctx,
-        "presupuesto": pres,
-        "lineas": lineas_pdf,
-        "totales": {
-            "base": tot.get("base") or 0.0,
-            "iva": tot.get("iva") or 0.0,
-            "total": tot.get("total") or 0.0,
-            "desglose": tot.get("desglose") or {},
-        },
-        "direccion_fiscal": dir_fiscal,
-        "direccion_envio": dir_envio,
-    }
-
-    return data_real
+    fut = render_pdf_async(data_real)
+    fname = _file_name(data_real.get("presupuesto", {}) or {})
+    if not fut.done():
+        return None, fname
+    return fut.result(), fname
 
 
-# =========================================================
-# BUILD PDF – Modelo ORBE (muy similar al ejemplo)
-# =========================================================
-def build_pdf_bytes(data_real: dict):
-    buffer = io.BytesIO()
-    styles = getSampleStyleSheet()
-
-    # Colores corporativos ORBE
-    ORBE_BLUE = colors.HexColor("#003865")
-    ORBE_LIGHT = colors.HexColor("#E8EEF3")
-    ORBE_GREY = colors.HexColor("#6B7280")
-
-    # Documento base
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=18 * mm,
-        leftMargin=18 * mm,
-        topMargin=18 * mm,
-        bottomMargin=18 * mm,
-    )
+def _sondear_pdf(fut: Future):
+    # Cuerpo del fragmento de espera: solo se relanza el, no la pagina
+    import streamlit as st
 
-    emp = data_real.get("empresa", {}) or {}
-    cli = data_real.get("cliente", {}) or {}
-    pres = data_real.get("presupuesto", {}) or {}
-    lineas = data_real.get("lineas", []) or []
-    tot = data_real.get("totales", {}) or {}
-    dfisc = data_real.get("direccion_fiscal") or {}
-    denv = data_real.get("direccion_envio") or {}
-
-    elements = []
-
-    # =====================================================
-    # 1️⃣ LOGO + CABECERA CORPORATIVA (como modelo)
-    # =====================================================
-    style_title = styles["Title"].clone("OrbeTitle")
-    style_title.fontSize = 18
-    style_title.textColor = ORBE_BLUE
-
-    # Logo: se asume logo_orbe.png en el directorio raíz del proyecto
-    logo_path = emp.get("logo_path") or "logo_orbe.png"
-    if not os.path.exists(logo_path):
-        # fallback: intenta un path relativo común en Streamlit Cloud
-        alt = os.path.join(os.path.dirname(__file__), "..", "logo_orbe.png")
-        if os.path.exists(alt):
-            logo_path = alt
-
-    if os.path.exists(logo_path):
-        logo = Image(logo_path, width=45 * mm, height=15 * mm)
-    else:
-        logo = None
-
-    cab_left = logo if logo else Paragraph(emp.get("nombre", "ORBE"), styles["Heading3"])
-    cab_right = Paragraph("PRESUPUESTO", style_title)
-
-    cabecera = Table(
-        [[cab_left, cab_right]],
-        colWidths=[70 * mm, 90 * mm],
-        hAlign="LEFT",
-    )
-    cabecera.setStyle(
-        TableStyle(
-            [
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-            ]
-        )
-    )
-    elements.append(cabecera)
-    elements.append(Spacer(1, 8))
-
-    # Línea azul bajo cabecera
-    elements.append(
-        HRFlowable(
-            width="100%",
-            thickness=2,
-            lineCap="round",
-            color=ORBE_BLUE,
-            spaceBefore=2,
-            spaceAfter=10,
-        )
-    )
+    if fut.done():
+        st.rerun(scope="app")
+    st.info("Generando PDF...")
 
-    # =====================================================
-    # 2️⃣ BLOQUE CLIENTE (como el modelo: nombre, ATT, dir, CIF)
-    # =====================================================
-    style_small = styles["Normal"].clone("small")
-    style_small.fontSize = 9
-    style_small.leading = 11
-
-    cliente_block = []
-
-    razon_social = _safe(cli.get("razon_social") or cli.get("nombre_comercial"), "")
-    if razon_social:
-        cliente_block.append(Paragraph(_bold(razon_social), styles["Heading3"]))
-
-    # ATT + teléfono
-    att = cli.get("contacto_att") or pres.get("contacto_att")
-    tel_att = cli.get("telefono_contacto") or pres.get("telefono_contacto")
-    if att:
-        if tel_att:
-            att_txt = f"{att} ({tel_att})"
-        else:
-            att_txt = att
-        cliente_block.append(Paragraph(f"ATT. {att_txt}", style_small))
-
-    # Dirección fiscal
-    if dfisc:
-        df_dir = dfisc.get("direccion", "") or ""
-        df_cp = dfisc.get("cp", "") or ""
-        df_ciudad = dfisc.get("ciudad", "") or ""
-        df_prov = dfisc.get("provincia", "") or ""
-        df_pais = dfisc.get("pais", "") or "ESPAÑA"
-        if df_dir:
-            cliente_block.append(Paragraph(df_dir, style_small))
-        loc_line = " ".join(
-            [df_cp, df_ciudad, df_prov if df_prov else "", df_pais]
-        ).strip()
-        if loc_line:
-            cliente_block.append(Paragraph(loc_line, style_small))
-
-    # CIF/NIF
-    cif = cli.get("cif") or cli.get("cif_nif") or ""
-    if cif:
-        cliente_block.append(Paragraph(cif, style_small))
-
-    t_cli = Table([[cliente_block]], colWidths=[170 * mm])
-    t_cli.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, -1), ORBE_LIGHT),
-                ("BOX", (0, 0), (-1, -1), 0.6, ORBE_BLUE),
-                ("LEFTPADDING", (0, 0), (-1, -1), 6),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 6),
-                ("TOPPADDING", (0, 0), (-1, -1), 6),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
-            ]
-        )
-    )
-    elements.append(t_cli)
-    elements.append(Spacer(1, 10))
-
-    # =====================================================
-    # 3️⃣ Fila FECHA / PROFORMA / NUMERO (igual que el modelo)
-    # =====================================================
-    fecha_str = _fmt_fecha_ddmmaaaa(pres.get("fecha"))
-    numero = _safe(pres.get("numero"), "-")
-    # PROFORMA: si quieres puedes mapear referencia_cliente aquí
-    proforma_num = pres.get("proforma") or pres.get("referencia_cliente") or ""
-
-    info_header = ["FECHA", "PROFORMA", "NUMERO"]
-    info_body = [fecha_str, proforma_num, numero]
-
-    t_info = Table(
-        [info_header, info_body],
-        colWidths=[35 * mm, 50 * mm, 60 * mm],
-        hAlign="LEFT",
-    )
-    t_info.setStyle(
-        TableStyle(
-            [
-                # Cabecera
-                ("BACKGROUND", (0, 0), (-1, 0), ORBE_BLUE),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("ALIGN", (0, 0), (-1, 0), "LEFT"),
-                ("FONTSIZE", (0, 0), (-1, 0), 9),
-                ("BOTTOMPADDING", (0, 0), (-1, 0), 4),
-                ("TOPPADDING", (0, 0), (-1, 0), 2),
-                # Cuerpo
-                ("FONTSIZE", (0, 1), (-1, 1), 9),
-                ("GRID", (0, 0), (-1, -1), 0.4, colors.grey),
-            ]
-        )
-    )
-    elements.append(t_info)
-    elements.append(Spacer(1, 8))
-
-    # =====================================================
-    # 4️⃣ TABLA DE LÍNEAS (Cant. / Producto / Precio / Dto.% / P./Dto. / Subtotal)
-    # =====================================================
-    table_lines = [["Cant.", "Producto", "Precio", "Dto. %", "P./Dto.", "Subtotal"]]
-
-    for l in lineas:
-        cant = float(l.get("unidades") or 0)
-        desc = _safe(l.get("concepto"), "-")
-        precio = float(l.get("precio") or 0)
-        dto = float(l.get("dto") or 0)
-        base = float(l.get("base") or 0)
-        precio_dto = base / cant if cant else 0.0
-
-        table_lines.append(
-            [
-                f"{cant:.0f}",
-                desc,
-                _money(precio),
-                f"{dto:.2f}%",
-                _money(precio_dto),
-                _money(base),
-            ]
-        )
-
-    t_lines = Table(
-        table_lines,
-        colWidths=[18 * mm, 75 * mm, 22 * mm, 18 * mm, 22 * mm, 25 * mm],
-        repeatRows=1,
-        hAlign="LEFT",
-    )
-    t_lines.setStyle(
-        TableStyle(
-            [
-                # Cabecera
-                ("BACKGROUND", (0, 0), (-1, 0), ORBE_LIGHT),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 9),
-                ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-                # Celdas
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-                ("FONTSIZE", (0, 1), (-1, -1), 8),
-                ("VALIGN", (0, 1), (-1, -1), "MIDDLE"),
-                ("ALIGN", (0, 1), (0, -1), "RIGHT"),  # Cant.
-                ("ALIGN", (2, 1), (-1, -1), "RIGHT"),  # Números
-            ]
-        )
-    )
-    elements.append(t_lines)
-    elements.append(Spacer(1, 10))
-
-    # =====================================================
-    # 5️⃣ DIRECCION DE ENVIO (texto en mayúsculas como modelo)
-    # =====================================================
-    elements.append(Paragraph(_bold("DIRECCION DE ENVIO"), styles["Heading4"]))
-
-    if denv:
-        e_dir = denv.get("direccion", "") or ""
-        e_cp = denv.get("cp", "") or ""
-        e_ciudad = denv.get("ciudad", "") or ""
-        e_prov = denv.get("provincia", "") or ""
-        e_pais = denv.get("pais", "") or "ESPAÑA"
-
-        t_env = "<br/>".join(
-            [
-                e_dir,
-                f"{e_cp} {e_ciudad} ({e_prov})" if (e_cp or e_ciudad or e_prov) else "",
-                e_pais,
-            ]
-        )
-        elements.append(Paragraph(t_env, style_small))
-    else:
-        elements.append(Paragraph("—", style_small))
-
-    elements.append(Spacer(1, 8))
-
-    # =====================================================
-    # 6️⃣ RESUMEN DE IVA (IMPUESTO / BASE IMPONIBLE / IMPORTE IVA)
-    # =====================================================
-    elements.append(Paragraph(_bold("IMPUESTO BASE IMPONIBLE IMPORTE IVA"), styles["Heading4"]))
-
-    desg = tot.get("desglose") or {}
-
-    if desg:
-        iva_rows = [["Impuesto", "Base imponible", "Importe IVA"]]
-        for iva_pct, vals in sorted(desg.items(), key=lambda x: float(str(x[0]).replace("%", ""))):
-            base_iva = vals.get("base", 0)
-            imp_iva = vals.get("iva", 0)
-            iva_rows.append(
-                [
-                    f"IVA {iva_pct}",
-                    _money(base_iva),
-                    _money(imp_iva),
-                ]
-            )
-
-        t_iva = Table(iva_rows, colWidths=[30 * mm, 45 * mm, 45 * mm])
-        t_iva.setStyle(
-            TableStyle(
-                [
-                    ("BACKGROUND", (0, 0), (-1, 0), ORBE_LIGHT),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-                    ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
-                    ("FONTSIZE", (0, 0), (-1, -1), 8.5),
-                ]
-            )
-        )
-        elements.append(t_iva)
-    else:
-        elements.append(Paragraph("Sin impuestos calculados.", style_small))
-
-    elements.append(Spacer(1, 10))
-
-    # =====================================================
-    # 7️⃣ OBSERVACIONES (bloque similar al ejemplo)
-    # =====================================================
-    obs = pres.get("observaciones") or "—"
-    elements.append(Paragraph(_bold("OBSERVACIONES:"), styles["Heading4"]))
-
-    obs_box = Table([[Paragraph(obs, style_small)]], colWidths=[170 * mm])
-    obs_box.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, -1), ORBE_LIGHT),
-                ("BOX", (0, 0), (-1, -1), 0.4, colors.grey),
-                ("LEFTPADDING", (0, 0), (-1, -1), 6),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 6),
-                ("TOPPADDING", (0, 0), (-1, -1), 4),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-            ]
-        )
-    )
-    elements.append(obs_box)
-    elements.append(Spacer(1, 10))
-
-    # =====================================================
-    # 8️⃣ TOTALES (BASE / GASTOS / IMPUESTOS / RECARGOS / TOTAL)
-    # =====================================================
-    base_t = tot.get("base") or 0.0
-    iva_t = tot.get("iva") or 0.0
-    gastos_envio = tot.get("gastos_envio") or 0.0
-    recargos = tot.get("total_recargos") or 0.0
-    total_factura = tot.get("total") or (base_t + iva_t + gastos_envio + recargos)
-
-    elements.append(Paragraph(_bold("TOTALES:"), styles["Heading4"]))
-
-    tot_rows = [
-        ["BASE IMPONIBLE:", _money(base_t)],
-        ["GASTOS ENVIO:", _money(gastos_envio)],
-        ["TOTAL IMPUESTOS:", _money(iva_t)],
-        ["TOTAL RECARGOS:", _money(recargos)],
-        ["TOTAL FACTURA:", _money(total_factura)],
-    ]
-
-    t_tot = Table(tot_rows, colWidths=[60 * mm, 40 * mm], hAlign="LEFT")
-    t_tot.setStyle(
-        TableStyle(
-            [
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-                ("ALIGN", (1, 0), (1, -1), "RIGHT"),
-                ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
-                ("BACKGROUND", (0, -1), (-1, -1), ORBE_LIGHT),
-                ("FONTSIZE", (0, 0), (-1, -1), 8.5),
-            ]
-        )
-    )
-    elements.append(t_tot)
-    elements.append(Spacer(1, 10))
-
-    # =====================================================
-    # 9️⃣ Pie bancario + legal + datos empresa (similar al modelo)
-    # =====================================================
-    # Texto bancario
-    banco_txt = emp.get(
-        "texto_banco",
-        "Datos Bancarios de ORBE Distribuidora Formación (IBAN): ES89 0049 6729 2623 1623 1833",
-    )
-    elements.append(Paragraph(banco_txt, style_small))
-    elements.append(Spacer(1, 4))
-
-    # Texto de validez / condiciones
-    legal_main = emp.get(
-        "texto_legal_principal",
-        (
-            "El presente documento tiene una validez de 30 días a partir de la fecha de emisión. "
-            "Transcurrido ese plazo, los términos del mismo podrían estar sujetos a revisión y ajuste "
-            "debido a posibles cambios en las condiciones del mercado y los costes de los materiales y "
-            "servicios involucrados."
-        ),
-    )
-    legal_main_p = Paragraph(f"<font size=7 color='{ORBE_GREY}'>{legal_main}</font>", styles["Normal"])
-    elements.append(legal_main_p)
-    elements.append(Spacer(1, 6))
-
-    # Texto de protección de datos
-    legal_dp = emp.get(
-        "texto_proteccion_datos",
-        (
-            "A los efectos de lo dispuesto en la normativa de protección de datos, le informamos de que sus datos "
-            "forman parte de un fichero responsabilidad de ORBE FORMACIÓN TECNOLÓGICA Y DISTRIBUCIÓN S.L. y se "
-            "utilizarán para la prestación de los servicios y el envío de información que pudiera resultar de su interés. "
-            "Puede ejercer sus derechos de acceso, rectificación, cancelación y oposición en nuestro domicilio."
-        ),
-    )
-    legal_dp_p = Paragraph(f"<font size=6 color='{ORBE_GREY}'>{legal_dp}</font>", styles["Normal"])
-    elements.append(legal_dp_p)
-    elements.append(Spacer(1, 6))
-
-    # Línea final con datos de contacto (tel / email / web / dirección)
-    tel = emp.get("telefono") or "TEL +34 951 171 028"
-    fax = emp.get("fax") or "FAX +34 916 094 479"
-    email = emp.get("email") or "pedidos@orbeformacion.com"
-    web = emp.get("web") or "www.orbeformacion.com"
-
-    dir_emp = emp.get("direccion") or "C/ Marie Curie, 20. Planta baja, Puerta D · Conjunto Possibilia Edificio B"
-    loc_emp = (
-        f"{emp.get('cp','29590')} {emp.get('ciudad','Málaga')} ({emp.get('provincia','Málaga')})"
-    )
 
-    footer_txt_1 = f"{tel}   {fax}   {email}"
-    footer_txt_2 = f"{dir_emp} · {loc_emp} · {web}"
+def esperar_pdf(data_real: dict) -> Tuple[Optional[bytes], str]:
+    """
+    Para paginas Streamlit: devuelve el PDF si ya esta listo. Si no, pinta un
+    aviso "Generando PDF..." en un fragmento que comprueba el render de fondo
+    cada _SONDEO_SEGUNDOS sin relanzar la pagina, y devuelve (None, nombre);
+    cuando el PDF termina el fragmento relanza la pagina una sola vez. Quien
+    llama guarda en session_state que lo pidio, para volver aqui entonces.
+    """
+    import streamlit as st
 
-    footer_p1 = Paragraph(f"<font size=7>{footer_txt_1}</font>", styles["Normal"])
-    footer_p2 = Paragraph(f"<font size=7>{footer_txt_2}</font>", styles["Normal"])
+    fut = render_pdf_async(data_real)
+    fname = _file_name(data_real.get("presupuesto", {}) or {})
+    if fut.done():
+        return fut.result(), fname
+    st.fragment(run_every=_SONDEO_SEGUNDOS)(_sondear_pdf)(fut)
+    return None, fname
 
-    elements.append(footer_p1)
-    elements.append(footer_p2)
 
-    # =====================================================
-    # 🔚 Construir PDF
-    # =====================================================
-    doc.build(elements)
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
+def precalentar_pdf(supabase, presupuestoid: int) -> Future:
+    """Construye contexto y PDF en segundo plano (p.ej. al abrir la pestaña)."""
 
-    file_name = f"presupuesto_{pres.get('numero','sin_numero')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    return pdf_bytes, file_name
+    def _tarea():
+        data_real = _build_data_real(supabase, presupuestoid)
+        clave = pdf_hash(data_real)
+        if _CACHE.get(clave) is None:
+            _CACHE.put(clave, build_pdf_bytes(data_real)[0])
+
+    return _POOL.submit(_tarea)
 
 
 # =========================================================
@@ -550,12 +207,19 @@ def upload_pdf_to_storage(supabase, pdf_bytes, file_name, bucket=BUCKET_DEFAULT)
 # Preview en Streamlit (por si quieres usarlo en algún panel)
 # =========================================================
 def generate_pdf_for_download(supabase, presupuestoid: int):
-    """Genera el PDF, lo muestra embebido en Streamlit y añade botón de descarga."""
+    """
+    Genera el PDF, lo muestra embebido en Streamlit y añade botón de descarga.
+    Mientras se pinta muestra el aviso de espera y devuelve (None, nombre)
+    (ver esperar_pdf).
+    """
+    import streamlit as st
+
     data_real = _build_data_real(supabase, presupuestoid)
-    pdf_bytes, fname = build_pdf_bytes(data_real)
+    pdf_bytes, fname = esperar_pdf(data_real)
+    if pdf_bytes is None:
+        return None, fname
 
     pdf_b64 = base64.b64encode(pdf_bytes).decode("utf-8")
-    import streamlit as st
 
     st.markdown(
         f'<iframe src="data:application/pdf;base64,{pdf_b64}" width="100%" height="720px"></iframe>',
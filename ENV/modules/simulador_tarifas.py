@@ -0,0 +1,199 @@
+# ======================================================
+# 📈 SIMULADOR DE TARIFAS (what-if sobre albaranes) — vía API FastAPI
+# ======================================================
+import streamlit as st
+import pandas as pd
+from datetime import date, timedelta
+
+from modules.tarifa_api import catalogos, listar_reglas, simular_tarifas
+
+_KEY = "sim_tarifas_cambios"
+
+
+def _to_map(items):
+    return {i["label"]: i["id"] for i in items or []}
+
+
+def _label(catalog: dict, val):
+    for k, v in catalog.items():
+        if v == val:
+            return k
+    return "-" if val is None else str(val)
+
+
+def _describir(c: dict, tarifas: dict) -> str:
+    if c["accion"] == "borrar":
+        return f"🗑️ Borrar regla {c['tarifa_reglaid']}"
+    if c["accion"] == "actualizar":
+        cambios = c.get("cambios") or {}
+        partes = []
+        if cambios.get("tarifaid"):
+            partes.append(f"tarifa → {_label(tarifas, cambios['tarifaid'])}")
+        if "habilitada" in cambios:
+            partes.append("habilitada" if cambios["habilitada"] else "deshabilitada")
+        if cambios.get("fecha_inicio") or cambios.get("fecha_fin"):
+            partes.append(f"{cambios.get('fecha_inicio') or '…'} → {cambios.get('fecha_fin') or '…'}")
+        return f"✏️ Regla {c['tarifa_reglaid']}: " + (", ".join(partes) or "sin cambios")
+    n = c.get("nueva") or {}
+    return f"➕ Nueva regla con {_label(tarifas, n.get('tarifaid'))}"
+
+
+def _tabla(filas: list, catalog: dict, columna: str) -> pd.DataFrame:
+    df = pd.DataFrame(filas)
+    if df.empty:
+        return df
+    df.insert(0, columna, [_label(catalog, v) for v in df.pop("clave")])
+    return df.rename(
+        columns={
+            "lineas": "Líneas",
+            "total_historico": "Histórico (€)",
+            "total_actual": "Reglas actuales (€)",
+            "total_simulado": "Simulado (€)",
+            "diferencia": "Diferencia (€)",
+            "diferencia_pct": "Diferencia (%)",
+        }
+    )
+
+
+def render_simulador_tarifas():
+    st.header("📈 Simulador de tarifas sobre albaranes")
+    st.caption(
+        "Re-precia las líneas de albarán históricas con las reglas actuales y con los cambios propuestos "
+        "(sin guardar nada) y compara los importes sin IVA por cliente, grupo y familia."
+    )
+
+    try:
+        cats = catalogos()
+        reglas = listar_reglas({"incluir_deshabilitadas": True}).get("data", [])
+    except Exception as e:
+        st.error(f"❌ No se pudieron cargar catálogos: {e}")
+        return
+
+    tarifas = _to_map(cats.get("tarifas", []))
+    clientes = _to_map(cats.get("clientes", []))
+    grupos = _to_map(cats.get("grupos", []))
+    productos = _to_map(cats.get("productos", []))
+    familias = _to_map(cats.get("familias", []))
+
+    cambios = st.session_state.setdefault(_KEY, [])
+
+    # ---------------------------
+    # Cambios propuestos
+    # ---------------------------
+    st.subheader("🧩 Cambios propuestos")
+    accion = st.radio("Acción", ["Modificar regla", "Nueva regla", "Borrar regla"], horizontal=True)
+
+    if accion in ("Modificar regla", "Borrar regla"):
+        opciones = {
+            f"#{r['tarifa_reglaid']} · {_label(tarifas, r.get('tarifaid'))} · "
+            f"cli {_label(clientes, r.get('clienteid'))} · grp {_label(grupos, r.get('grupoid'))}": r
+            for r in reglas
+        }
+        if not opciones:
+            st.info("No hay reglas.")
+        else:
+            sel = opciones[st.selectbox("Regla", list(opciones.keys()))]
+            if accion == "Borrar regla":
+                if st.button("➕ Añadir cambio", key="sim_add_borrar"):
+                    cambios.append({"accion": "borrar", "tarifa_reglaid": sel["tarifa_reglaid"]})
+                    st.rerun()
+            else:
+                c1, c2 = st.columns(2)
+                with c1:
+                    nombres = list(tarifas.keys())
+                    actual = _label(tarifas, sel.get("tarifaid"))
+                    nueva_tarifa = st.selectbox(
+                        "Nueva tarifa", nombres, index=nombres.index(actual) if actual in nombres else 0
+                    )
+                with c2:
+                    habilitada = st.toggle("Habilitada", value=bool(sel.get("habilitada", True)))
+                if st.button("➕ Añadir cambio", key="sim_add_mod"):
+                    cambios.append(
+                        {
+                            "accion": "actualizar",
+                            "tarifa_reglaid": sel["tarifa_reglaid"],
+                            "cambios": {"tarifaid": tarifas[nueva_tarifa], "habilitada": habilitada},
+                        }
+                    )
+                    st.rerun()
+    else:
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            t_sel = st.selectbox("Tarifa", list(tarifas.keys()))
+        with c2:
+            cli_sel = st.selectbox("Cliente", ["(Ninguno)"] + list(clientes.keys()))
+            grp_sel = st.selectbox("Grupo", ["(Ninguno)"] + list(grupos.keys()))
+        with c3:
+            prod_sel = st.selectbox("Producto", ["(Ninguno)"] + list(productos.keys()))
+            fam_sel = st.selectbox("Familia", ["(Ninguna)"] + list(familias.keys()))
+        nueva = {
+            "tarifaid": tarifas.get(t_sel),
+            "clienteid": clientes.get(cli_sel),
+            "grupoid": grupos.get(grp_sel),
+            "productoid": productos.get(prod_sel),
+            "familia_productoid": familias.get(fam_sel),
+            "habilitada": True,
+        }
+        nueva = {k: v for k, v in nueva.items() if v is not None}
+        valida = any(k in nueva for k in ("clienteid", "grupoid", "productoid", "familia_productoid"))
+        if st.button("➕ Añadir cambio", key="sim_add_new", disabled=not valida):
+            cambios.append({"accion": "crear", "nueva": nueva})
+            st.rerun()
+
+    if cambios:
+        for i, c in enumerate(cambios):
+            c1, c2 = st.columns([6, 1])
+            c1.write(_describir(c, tarifas))
+            if c2.button("✖", key=f"sim_del_{i}"):
+                cambios.pop(i)
+                st.rerun()
+    else:
+        st.caption("Sin cambios: la simulación solo mostrará el efecto de las reglas actuales.")
+
+    st.markdown("---")
+
+    # ---------------------------
+    # Periodo y ejecución
+    # ---------------------------
+    c1, c2, c3 = st.columns([1, 1, 2])
+    with c1:
+        desde = st.date_input("Desde", value=date.today() - timedelta(days=365), key="sim_desde")
+    with c2:
+        hasta = st.date_input("Hasta", value=date.today(), key="sim_hasta")
+    with c3:
+        cli_f = st.selectbox("Limitar a cliente", ["(Todos)"] + list(clientes.keys()), key="sim_cli")
+
+    if not st.button("📈 Simular impacto", type="primary", use_container_width=True):
+        return
+
+    payload = {
+        "fecha_desde": desde.isoformat(),
+        "fecha_hasta": hasta.isoformat(),
+        "clienteid": clientes.get(cli_f),
+        "cambios": cambios,
+    }
+    try:
+        with st.spinner("Re-preciando líneas de albarán..."):
+            res = simular_tarifas(payload)
+    except Exception as e:
+        st.error(f"❌ Error durante la simulación: {e}")
+        return
+
+    r = res.get("resumen") or {}
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Líneas", f"{r.get('lineas', 0):,}")
+    m2.metric("Reglas actuales", f"{r.get('total_actual', 0):,.2f} €")
+    m3.metric(
+        "Simulado",
+        f"{r.get('total_simulado', 0):,.2f} €",
+        delta=f"{r.get('diferencia', 0):,.2f} €",
+    )
+    m4.metric("Histórico facturado", f"{r.get('total_historico', 0):,.2f} €")
+
+    t1, t2, t3 = st.tabs(["👤 Por cliente", "👥 Por grupo", "📦 Por familia"])
+    with t1:
+        st.dataframe(_tabla(res.get("por_cliente", []), clientes, "Cliente"), use_container_width=True, hide_index=True)
+    with t2:
+        st.dataframe(_tabla(res.get("por_grupo", []), grupos, "Grupo"), use_container_width=True, hide_index=True)
+    with t3:
+        st.dataframe(_tabla(res.get("por_familia", []), familias, "Familia"), use_container_width=True, hide_index=True)
@@ -52,6 +52,17 @@ def asignar_cliente_tarifa(payload: dict) -> dict:
     return _handle(r)
 
 
+def recargar_indice() -> dict:
+    r = requests.post(f"{_base_url()}/api/tarifas/indice/recargar", timeout=60)
+    return _handle(r)
+
+
 def calcular_precio(payload: dict) -> dict:
     r = requests.post(f"{_base_url()}/api/tarifas/calcular-precio", json=payload, timeout=20)
     return _handle(r)
+
+
+def simular_tarifas(payload: dict) -> dict:
+    # Re-precia albaranes historicos: puede tardar con rangos de fechas amplios
+    r = requests.post(f"{_base_url()}/api/tarifas/simular", json=payload, timeout=300)
+    return _handle(r)
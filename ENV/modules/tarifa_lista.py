@@ -3,6 +3,8 @@ import streamlit as st
 import pandas as pd
 from datetime import date
 
+from modules.tarifa_api import crear_regla
+
 # ======================================================
 # 🧩 Helpers visuales
 # ======================================================
@@ -168,7 +170,8 @@ def render_tarifa_lista(supabase):
                     productoid = next(p["productoid"] for p in prods if p["nombre"] == producto_nom)
                     tarifaid = next(t["tarifaid"] for t in tarifas if t["nombre"] == nueva_tarifa)
 
-                    supabase.table("tarifa_regla").insert({
+                    # Via API: el backend actualiza su indice de tarifas al crear la regla
+                    crear_regla({
                         "tarifaid": tarifaid,
                         "clienteid": clienteid,
                         "productoid": productoid,
@@ -176,7 +179,7 @@ def render_tarifa_lista(supabase):
                         "fecha_fin": fh.isoformat() if fh else None,
                         "prioridad": 1,
                         "habilitada": True
-                    }).execute()
+                    })
 
                     st.success(f"✅ Combinación '{cliente_nom} · {producto_nom}' promovida a **{nueva_tarifa}**.")
                     st.rerun()
@@ -7,6 +7,7 @@ from datetime import date
 
 from modules.tarifa_api import catalogos, listar_reglas, crear_regla, asignar_cliente_tarifa
 from modules.simulador_pedido import render_simulador_pedido
+from modules.simulador_tarifas import render_simulador_tarifas
 
 
 def _to_map(items):
@@ -29,7 +30,7 @@ def render_tarifa_manager():
     productos = _to_map(cats.get("productos", []))
     familias = _to_map(cats.get("familias", []))
 
-    tabs = st.tabs(["📋 Reglas", "➕ Crear / asignar", "🧮 Simulador"])
+    tabs = st.tabs(["📋 Reglas", "➕ Crear / asignar", "🧮 Simulador", "📈 Impacto de cambios"])
 
     # ---------------------------
     # Reglas (listado + filtros)
@@ -175,6 +176,12 @@ def render_tarifa_manager():
     with tabs[2]:
         render_simulador_pedido()
 
+    # ---------------------------
+    # Simulador what-if (albaranes)
+    # ---------------------------
+    with tabs[3]:
+        render_simulador_tarifas()
+
 
 def _label(catalog: dict, val):
     for k, v in catalog.items():
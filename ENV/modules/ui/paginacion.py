@@ -0,0 +1,37 @@
+# modules/ui/paginacion.py
+import streamlit as st
+
+
+def params_pagina(prefijo: str, page: int, filtros: dict) -> dict:
+    """
+    Parametros de paginacion para los listados de la API.
+    Pagina 1 (o una pagina sin cursor conocido): offset con conteo estimado.
+    Paginas siguientes: el cursor guardado y sin conteo (tiempo constante).
+    Si cambian los filtros se descartan los cursores.
+    """
+    huella = repr(sorted((k, str(v)) for k, v in filtros.items()))
+    if st.session_state.get(f"{prefijo}_huella") != huella:
+        st.session_state[f"{prefijo}_huella"] = huella
+        st.session_state[f"{prefijo}_cursores"] = {}
+        st.session_state[f"{prefijo}_total"] = None
+
+    cursor = st.session_state[f"{prefijo}_cursores"].get(page)
+    if page > 1 and cursor:
+        return {"cursor": cursor, "count": "none"}
+    return {"page": page, "count": "estimated"}
+
+
+def registrar_pagina(prefijo: str, page: int, payload: dict):
+    """Guarda el cursor de la pagina siguiente y el total (si vino). Devuelve el total conocido."""
+    cursores = st.session_state.setdefault(f"{prefijo}_cursores", {})
+    if payload.get("next_cursor"):
+        cursores[page + 1] = payload["next_cursor"]
+    else:
+        cursores.pop(page + 1, None)
+    if payload.get("total") is not None:
+        st.session_state[f"{prefijo}_total"] = payload["total"]
+    return st.session_state.get(f"{prefijo}_total")
+
+
+def hay_siguiente(prefijo: str, page: int) -> bool:
+    return page + 1 in st.session_state.get(f"{prefijo}_cursores", {})